@@ -0,0 +1,68 @@
+"""Microbenchmark of one tap on the calendar: building and serializing the keyboard
+of the view every time (as aiogram does with a fresh InlineKeyboardMarkup) against
+taking the serialized keyboard from the LRU cache
+
+Run from the root of the project: python -m benchmarks.calendar_keyboards
+"""
+import json
+import timeit
+from typing import Callable, List, Tuple
+
+from tg_bot.misc.calendar import DAYS_VIEW, MONTHS_VIEW, YEARS_VIEW, calendar_keyboard
+
+NUMBER = 2000
+TAPS: List[Tuple[str, int, int]] = [(YEARS_VIEW, 2022, -1), (MONTHS_VIEW, 2022, -1),
+                                    (DAYS_VIEW, 2022, 7)]
+
+
+def build(view: str, year: int, month: int) -> str:
+    """Builds and serializes the keyboard without the cache
+
+    :param: view: view of the calendar
+    :type: view: string
+    :param: year: current year
+    :type: year: integer
+    :param: month: current month
+    :type: month: integer
+    :return: serialized keyboard
+    :rtype: string
+
+    """
+    return calendar_keyboard.__wrapped__(view, year, month)
+
+
+def measure(function: Callable[[str, int, int], str], view: str, year: int, month: int) -> float:
+    """Measures the average time of one call of the function (in microseconds)
+
+    :param: function: function returning the serialized keyboard
+    :type: function: Callable[[string, integer, integer], string]
+    :param: view: view of the calendar
+    :type: view: string
+    :param: year: current year
+    :type: year: integer
+    :param: month: current month
+    :type: month: integer
+    :return: time of one call
+    :rtype: float
+
+    """
+    seconds: float = min(timeit.repeat(lambda: function(view, year, month), number=NUMBER, repeat=5))
+    return seconds / NUMBER * 1_000_000
+
+
+def main() -> None:
+    """Prints the time of one tap on each view before and after the caching
+
+    :return: None
+
+    """
+    for view, year, month in TAPS:
+        assert json.loads(build(view, year, month)) == json.loads(calendar_keyboard(view, year, month))
+        before: float = measure(build, view, year, month)
+        after: float = measure(calendar_keyboard, view, year, month)
+        print(f'{view:<7} built: {before:8.1f} us   cached: {after:6.2f} us   '
+              f'x{before / after:.0f}')
+
+
+if __name__ == '__main__':
+    main()
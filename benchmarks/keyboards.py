@@ -0,0 +1,49 @@
+"""Benchmark of the overhead of the constant keyboard of one reply: creating the keyboard
+(with emoji.emojize) and serializing it for every reply against taking the serialized
+keyboard built once by the registry
+
+Run from the root of the project: python -m benchmarks.keyboards
+"""
+import json
+import timeit
+from typing import Callable
+
+# the modules of the keyboards register them in the registry
+import tg_bot.keyboards.inline.inline_keyboards  # noqa: F401
+import tg_bot.keyboards.reply.menu_button  # noqa: F401
+from tg_bot.keyboards.registry import KEYBOARDS, serialize
+
+NUMBER = 2000
+
+
+def measure(function: Callable[[], str]) -> float:
+    """Measures the average time of one call of the function (in microseconds)
+
+    :param: function: function returning the serialized keyboard
+    :type: function: Callable[[], string]
+    :return: time of one call
+    :rtype: float
+
+    """
+    seconds: float = min(timeit.repeat(function, number=NUMBER, repeat=5))
+    return seconds / NUMBER * 1_000_000
+
+
+def main() -> None:
+    """Prints the overhead of each keyboard before and after the registry
+
+    :return: None
+
+    """
+    for name, keyboard in KEYBOARDS.items():
+        def build() -> str:
+            return serialize(keyboard=keyboard.__wrapped__())
+
+        assert json.loads(build()) == json.loads(keyboard())
+        before: float = measure(build)
+        after: float = measure(keyboard)
+        print(f'{name:<22} built: {before:7.1f} us   prebuilt: {after:5.2f} us   x{before / after:.0f}')
+
+
+if __name__ == '__main__':
+    main()
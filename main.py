@@ -1,6 +1,6 @@
 import asyncio
 
-from aiogram import Bot, Dispatcher
+from aiogram import Dispatcher
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.contrib.fsm_storage.redis import RedisStorage2
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
@@ -9,30 +9,62 @@ from sqlalchemy.orm import sessionmaker
 from tg_bot.config import get_config
 from tg_bot.handlers.errors.errors import register_error_handler
 from tg_bot.handlers.users.actions import register_basic_handlers
-from tg_bot.handlers.users.callbacks import register_callbacks_handlers
+from tg_bot.handlers.users.callbacks import fail_photo_job, register_callbacks_handlers, run_photo_job
+from tg_bot.keyboards.registry import build_keyboards
+from tg_bot.middlewares.callback_answer_middleware import CallbackAnswerMiddleware
 from tg_bot.middlewares.data_middleware import DataMiddleware
 from tg_bot.middlewares.db_middleware import DbMiddleware
 from tg_bot.middlewares.throttling_middleware import ThrottlingMiddleware
-from tg_bot.models.create_pool import create_pool
+from tg_bot.models.create_pool import create_pool, create_read_pool
+from tg_bot.services.cache.redis_client import create_redis
+from tg_bot.services.cache.tiered_cache import TieredCache
+from tg_bot.services.jobs.history_writer import HistoryWriter
+from tg_bot.services.jobs.photo_jobs import MemoryJobQueue, PhotoJobWorkers, RedisJobQueue
 from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import MetricsReporter, metrics
+from tg_bot.services.nasa.availability import DateAvailability
+from tg_bot.services.nasa.fair_queue import NasaQuotas
+from tg_bot.services.nasa.overload import OverloadDetector
+from tg_bot.services.scheduler.chat_scheduler import ChatScheduler, ScheduledDispatcher
+from tg_bot.services.scheduler.inflight import InFlightFetches
+from tg_bot.services.scheduler.lanes import LANE_HISTORY, LANE_PHOTO, Lanes
+from tg_bot.services.scheduler.prefetch import PrefetchSlots
+from tg_bot.services.sending.album_sender import AlbumSender
+from tg_bot.services.sending.loading import LoadingAnimation
+from tg_bot.services.sending.send_scheduler import ScheduledBot, SendScheduler
+from tg_bot.services.throttling.notifier import UnlockNotifier
+from tg_bot.services.throttling.sliding_window import SlidingWindow
 
 logger = get_logger(name=__name__)
 
 
-def register_all_middlewares(dp: Dispatcher, pool:  sessionmaker) -> None:
+def register_all_middlewares(dp: Dispatcher, pool:  sessionmaker, read_pool: sessionmaker,
+                             users: TieredCache, history: HistoryWriter,
+                             limiter: SlidingWindow, notifier: UnlockNotifier) -> None:
     """Registers all available middlewares from modules
 
     :param: dp: current dispatcher
     :type: dp: Dispatcher
     :param: pool: current pool of database connections
     :type: pool: sessionmaker
+    :param: read_pool: pool of connections for the read-only queries
+    :type: read_pool: sessionmaker
+    :param: users: cache of the names of the users already recorded in the database
+    :type: users: TieredCache
+    :param: history: write-behind buffer of the viewed photos
+    :type: history: HistoryWriter
+    :param: limiter: limiter of the calls of the handlers with the sliding window
+    :type: limiter: SlidingWindow
+    :param: notifier: delayed queue of the notifications about the end of the block
+    :type: notifier: UnlockNotifier
     :return: None
 
     """
-    dp.setup_middleware(DbMiddleware(pool=pool))
-    dp.setup_middleware(DataMiddleware())
+    dp.setup_middleware(DbMiddleware(pool=pool, read_pool=read_pool))
+    dp.setup_middleware(DataMiddleware(users=users, history=history))
     dp.setup_middleware(LoggingMiddleware(logger=logger))
-    dp.setup_middleware(ThrottlingMiddleware())
+    dp.setup_middleware(ThrottlingMiddleware(limiter=limiter, notifier=notifier))
+    dp.setup_middleware(CallbackAnswerMiddleware())
 
 
 
@@ -52,31 +84,108 @@ def register_all_handlers(dp: Dispatcher) -> None:
 async def main() -> None:
     """The main function that gets the user's config, initializes the bot, dispatcher,
     storage, pool of database connections objects, calls the general registrar of all
-    handlers and middlewares, and performs polling to receive updates from the Telegram
-    server. At the end of the work of bot, the current storage is closed, it is expected
-    to be completely closed and the current bot session is closed
+    handlers and middlewares, builds the constant keyboards, starts the background workers searching for photos and
+    writing the history and the metrics, the refreshing of the index of the dates with
+    photos and performs polling to receive updates from the Telegram server.
+    At the end of the work of bot, the workers are stopped, the rest of the history is
+    written to the database, the connections to the database are closed, the current
+    storage is closed, it is expected to be completely closed and the current bot
+    session is closed
 
     :return: None
 
     """
     logger.info("Starting bot")
     config = get_config(path='.env')
-    my_bot = Bot(token=config.bot.token, parse_mode='HTML')
+    my_bot = ScheduledBot(token=config.bot.token, parse_mode='HTML',
+                          sender=SendScheduler(global_rate=config.sending.global_rate,
+                                               chat_rate=config.sending.chat_rate,
+                                               group_rate=config.sending.group_rate,
+                                               chat_burst=config.sending.chat_burst))
     if config.bot.use_redis:
         storage = RedisStorage2(pool_size=50)
     else:
         storage = MemoryStorage()
-    dp = Dispatcher(bot=my_bot, storage=storage)
+    fetches = InFlightFetches()
+    prefetch = PrefetchSlots(ttl=config.scheduler.prefetch_ttl)
+    lanes = Lanes(max_workers=config.scheduler.max_workers,
+                  limits={LANE_PHOTO: config.scheduler.photo_workers,
+                          LANE_HISTORY: config.scheduler.history_workers})
+    scheduler = ChatScheduler(lanes=lanes)
+    dp = ScheduledDispatcher(bot=my_bot, storage=storage, scheduler=scheduler)
     pool = await create_pool(config=config)
+    read_pool = create_read_pool(config=config, pool=pool)
+    redis = create_redis(config=config)
+    history = HistoryWriter(pool=pool, interval=config.scheduler.history_flush_interval,
+                            batch_size=config.scheduler.history_batch_size,
+                            max_size=config.scheduler.history_buffer_size,
+                            replica_lag=config.database.replica_lag)
+    queue = RedisJobQueue(redis=redis, ttl=config.scheduler.photo_job_ttl) if redis else MemoryJobQueue()
+    jobs = PhotoJobWorkers(dp=dp, queue=queue, pool=pool, runner=run_photo_job,
+                           on_failure=fail_photo_job, scheduler=scheduler, lanes=lanes, history=history,
+                           workers=config.scheduler.photo_workers)
+    scheduler.on_superseded = (fetches.cancel, prefetch.discard, jobs.cancel)
+    users = TieredCache(prefix='user_name', maxsize=config.cache.users_size,
+                        redis=redis, ttl=config.cache.users_ttl)
+    file_ids = TieredCache(prefix='photo_file_id', maxsize=config.cache.file_ids_size,
+                           redis=redis, ttl=config.cache.file_ids_ttl)
+    mars_colors = TieredCache(prefix='mars_color', maxsize=config.cache.file_ids_size,
+                              redis=redis, ttl=config.cache.file_ids_ttl)
+    limiter = SlidingWindow(redis=redis)
+    notifier = UnlockNotifier(bot=my_bot, limiter=limiter)
+    nasa_responses = TieredCache(prefix='nasa', maxsize=config.cache.nasa_size,
+                                 redis=redis, ttl=config.cache.nasa_ttl)
+    overload = OverloadDetector(depth=lambda: jobs.pending,
+                                max_depth=config.monitoring.overload_max_queue,
+                                max_lag=config.monitoring.overload_max_lag,
+                                max_error_rate=config.monitoring.overload_max_error_rate,
+                                min_quota=config.monitoring.overload_min_quota,
+                                slow_request=config.monitoring.overload_slow_request,
+                                cooldown=config.monitoring.overload_cooldown)
+    availability = DateAvailability(api_key=config.api.nasa_api_token, overload=overload,
+                                    interval=config.api.availability_interval)
+    reporter = MetricsReporter(registry=metrics, interval=config.monitoring.metrics_interval)
     my_bot['config'] = config
-
-    register_all_middlewares(dp=dp, pool=pool)
+    my_bot['fetches'] = fetches
+    my_bot['prefetch'] = prefetch
+    my_bot['jobs'] = jobs
+    my_bot['nasa'] = NasaQuotas(capacity=config.api.concurrency,
+                                requests=config.api.user_requests,
+                                megabytes=config.api.user_megabytes,
+                                window=config.api.quota_window)
+    my_bot['albums'] = AlbumSender(bot=my_bot, file_ids=file_ids)
+    my_bot['file_ids'] = file_ids
+    my_bot['mars_colors'] = mars_colors
+    my_bot['loading'] = LoadingAnimation(bot=my_bot, file_ids=file_ids)
+    my_bot['nasa_cache'] = nasa_responses
+    my_bot['overload'] = overload
+    my_bot['availability'] = availability
+
+    register_all_middlewares(dp=dp, pool=pool, read_pool=read_pool, users=users, history=history,
+                             limiter=limiter, notifier=notifier)
     register_all_handlers(dp=dp)
+    build_keyboards()
 
     # start
+    history.start()
+    jobs.start()
+    reporter.start()
+    overload.start()
+    availability.start()
     try:
         await dp.start_polling(timeout=0)
     finally:
+        await jobs.close()
+        await notifier.close()
+        await history.close()
+        await reporter.close()
+        await overload.close()
+        await availability.close()
+        await pool.kw['bind'].dispose()
+        if read_pool is not pool:
+            await read_pool.kw['bind'].dispose()
+        if redis:
+            await redis.close()
         await dp.storage.close()
         await dp.storage.wait_closed()
         await my_bot.session.close()
@@ -1,5 +1,6 @@
 import os
 from dataclasses import dataclass
+from typing import Optional
 
 from dotenv import find_dotenv, load_dotenv
 
@@ -13,9 +14,12 @@ class TelegramBot:
     :type: token: string
     :param: use_redis: will Redis be used as a cache
     :type: use_redis: bool
+    :param: redis_url: url of the Redis server
+    :type: redis_url: string
     """
     token: str
     use_redis: bool
+    redis_url: str
 
 
 @dataclass
@@ -23,6 +27,10 @@ class Database:
     """
     Parameters of Database
 
+    :param: backend: the database used: postgres or the embedded sqlite
+    :type: backend: string
+    :param: sqlite_path: path to the file of the sqlite database
+    :type: sqlite_path: string
     :param: database_name: name of the current database
     :type: database_name: string
     :param: user: user of the current database
@@ -33,12 +41,44 @@ class Database:
     :type: host: string
     :param: port: port of the current database
     :type: port: string
+    :param: pool_size: the number of connections kept in the pool
+    :type: pool_size: integer
+    :param: max_overflow: the number of connections opened above the pool size at peaks
+    :type: max_overflow: integer
+    :param: pool_timeout: how long (in seconds) to wait for a free connection
+    :type: pool_timeout: float
+    :param: pool_recycle: the age (in seconds) after which the connection is reopened
+    (-1 - never)
+    :type: pool_recycle: integer
+    :param: pool_pre_ping: whether the connection is checked before it is given from the pool
+    :type: pool_pre_ping: bool
+    :param: prepared_statement_cache_size: the number of prepared statements cached by
+    SQLAlchemy for each connection
+    :type: prepared_statement_cache_size: integer
+    :param: pgbouncer: whether the connections go through pgbouncer in the transaction mode
+    (no statements are cached at all)
+    :type: pgbouncer: bool
+    :param: replica_dsn: uri of the read replica of Postgres (None - reading from the primary)
+    :type: replica_dsn: Optional[string]
+    :param: replica_lag: how long (in seconds) the just written history is read from the primary
+    :type: replica_lag: float
     """
+    backend: str
+    sqlite_path: str
     database_name: str
     user: str
     password: str
     host: str
     port: str
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float
+    pool_recycle: int
+    pool_pre_ping: bool
+    prepared_statement_cache_size: int
+    pgbouncer: bool
+    replica_dsn: Optional[str]
+    replica_lag: float
 
 
 @dataclass
@@ -48,8 +88,136 @@ class Api:
 
     :param: nasa_api_token: your private API token
     :type: nasa_api_token: string
+    :param: concurrency: the number of requests to NASA executed at the same time
+    :type: concurrency: integer
+    :param: user_requests: the number of requests to NASA of one user in the quota window
+    :type: user_requests: integer
+    :param: user_megabytes: the number of megabytes downloaded by one user in the quota window
+    :type: user_megabytes: float
+    :param: quota_window: length of the quota window (in seconds)
+    :type: quota_window: float
+    :param: availability_interval: how often (in seconds) the index of the dates with photos
+    is refreshed
+    :type: availability_interval: float
     """
     nasa_api_token: str
+    concurrency: int
+    user_requests: int
+    user_megabytes: float
+    quota_window: float
+    availability_interval: float
+
+
+@dataclass
+class Scheduler:
+    """
+    Parameters of the scheduler of updates
+
+    :param: max_workers: the maximum number of updates processed at the same time
+    :type: max_workers: integer
+    :param: prefetch_ttl: how long (in seconds) the photo found in advance is kept
+    :type: prefetch_ttl: integer
+    :param: photo_workers: the number of background workers searching for photos
+    (and of the updates of the photo lane processed at the same time)
+    :type: photo_workers: integer
+    :param: photo_job_ttl: how long (in seconds) the search waiting in the Redis queue
+    stays needed (the older ones are skipped)
+    :type: photo_job_ttl: integer
+    :param: history_workers: the number of histories sent at the same time
+    :type: history_workers: integer
+    :param: history_flush_interval: how often (in seconds) the viewed photos are written
+    to the database
+    :type: history_flush_interval: float
+    :param: history_batch_size: the number of viewed photos written to the database at once
+    :type: history_batch_size: integer
+    :param: history_buffer_size: the maximum number of viewed photos waiting for the writing
+    (the oldest ones are dropped while the database is not available)
+    :type: history_buffer_size: integer
+    """
+    max_workers: int
+    prefetch_ttl: int
+    photo_workers: int
+    photo_job_ttl: int
+    history_workers: int
+    history_flush_interval: float
+    history_batch_size: int
+    history_buffer_size: int
+
+
+@dataclass
+class Cache:
+    """
+    Parameters of the caches
+
+    :param: users_size: the maximum number of users kept in the memory
+    :type: users_size: integer
+    :param: users_ttl: how long (in seconds) the user is kept in Redis
+    :type: users_ttl: integer
+    :param: file_ids_size: the maximum number of file_id of the sent photos kept in the memory
+    :type: file_ids_size: integer
+    :param: file_ids_ttl: how long (in seconds) the file_id of the sent photo is kept in Redis
+    :type: file_ids_ttl: integer
+    :param: nasa_size: the maximum number of responses of NASA (lists of photos, APOD) kept in the memory
+    :type: nasa_size: integer
+    :param: nasa_ttl: how long (in seconds) the response of NASA is kept in Redis
+    :type: nasa_ttl: integer
+    """
+    users_size: int
+    users_ttl: int
+    file_ids_size: int
+    file_ids_ttl: int
+    nasa_size: int
+    nasa_ttl: int
+
+
+@dataclass
+class Sending:
+    """
+    Parameters of the sending of messages
+
+    :param: global_rate: the maximum number of requests per second for the whole bot
+    :type: global_rate: float
+    :param: chat_rate: the maximum number of requests per second for one private chat
+    :type: chat_rate: float
+    :param: group_rate: the maximum number of requests per second for one group
+    :type: group_rate: float
+    :param: chat_burst: the number of requests sent at once to one private chat
+    :type: chat_burst: float
+    """
+    global_rate: float
+    chat_rate: float
+    group_rate: float
+    chat_burst: float
+
+
+@dataclass
+class Monitoring:
+    """
+    Parameters of the monitoring
+
+    :param: metrics_interval: how often (in seconds) the metrics are written to the log
+    :type: metrics_interval: integer
+    :param: overload_max_queue: the number of waiting searches after which the bot is overloaded
+    :type: overload_max_queue: integer
+    :param: overload_max_lag: the lag of the event loop (in seconds) after which the bot is overloaded
+    :type: overload_max_lag: float
+    :param: overload_max_error_rate: the share of the failed requests to NASA after which NASA is overloaded
+    :type: overload_max_error_rate: float
+    :param: overload_min_quota: the number of the remaining requests of the NASA API below which
+    new requests are not sent
+    :type: overload_min_quota: integer
+    :param: overload_slow_request: duration (in seconds) after which the request to NASA is failed
+    :type: overload_slow_request: float
+    :param: overload_cooldown: how long (in seconds) the degraded mode lasts after the overload
+    :type: overload_cooldown: float
+    """
+    metrics_interval: int
+    overload_max_queue: int
+    overload_max_lag: float
+    overload_max_error_rate: float
+    overload_min_quota: int
+    overload_slow_request: float
+    overload_cooldown: float
 
 
 @dataclass
@@ -63,10 +231,22 @@ class Config:
     :type: database: instance of Database class
     :param: api: NASA api
     :type: api: instance of APi class
+    :param: scheduler: scheduler of updates
+    :type: scheduler: instance of Scheduler class
+    :param: cache: caches
+    :type: cache: instance of Cache class
+    :param: sending: sending of messages
+    :type: sending: instance of Sending class
+    :param: monitoring: monitoring
+    :type: monitoring: instance of Monitoring class
     """
     bot: TelegramBot
     database: Database
     api: Api
+    scheduler: Scheduler
+    cache: Cache
+    sending: Sending
+    monitoring: Monitoring
 
 
 def get_config(path: str) -> Config:
@@ -82,11 +262,55 @@ def get_config(path: str) -> Config:
     return Config(
         bot=TelegramBot(token=os.getenv('BOT_TOKEN'),
                         use_redis=True if os.getenv(
-                            'USE_REDIS') == 'True' else False),
-        database=Database(database_name=os.getenv('DB_NAME'),
+                            'USE_REDIS') == 'True' else False,
+                        redis_url=os.getenv('REDIS_URL', 'redis://localhost:6379/0')),
+        database=Database(backend=os.getenv('DB_BACKEND', 'postgres'),
+                          sqlite_path=os.getenv('DB_SQLITE_PATH', 'nasa_bot.sqlite3'),
+                          database_name=os.getenv('DB_NAME'),
                           user=os.getenv('DB_USER'),
                           password=os.getenv('DB_PASSWORD'),
                           host=os.getenv('DB_HOST'),
-                          port=os.getenv('DB_PORT')),
-        api=Api(nasa_api_token=os.getenv('NASA_API_TOKEN'))
+                          port=os.getenv('DB_PORT'),
+                          pool_size=int(os.getenv('DB_POOL_SIZE', 10)),
+                          max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 10)),
+                          pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 30)),
+                          pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 1800)),
+                          pool_pre_ping=True if os.getenv(
+                              'DB_POOL_PRE_PING', 'True') == 'True' else False,
+                          prepared_statement_cache_size=int(
+                              os.getenv('DB_PREPARED_STATEMENT_CACHE_SIZE', 100)),
+                          pgbouncer=True if os.getenv('DB_PGBOUNCER') == 'True' else False,
+                          replica_dsn=os.getenv('DB_REPLICA_DSN') or None,
+                          replica_lag=float(os.getenv('DB_REPLICA_LAG', 5))),
+        api=Api(nasa_api_token=os.getenv('NASA_API_TOKEN'),
+                concurrency=int(os.getenv('NASA_CONCURRENCY', 8)),
+                user_requests=int(os.getenv('NASA_USER_REQUESTS', 30)),
+                user_megabytes=float(os.getenv('NASA_USER_MEGABYTES', 100)),
+                quota_window=float(os.getenv('NASA_QUOTA_WINDOW', 60)),
+                availability_interval=float(os.getenv('NASA_AVAILABILITY_INTERVAL', 3600))),
+        scheduler=Scheduler(max_workers=int(os.getenv('MAX_WORKERS', 32)),
+                            prefetch_ttl=int(os.getenv('PREFETCH_TTL', 60)),
+                            photo_workers=int(os.getenv('PHOTO_WORKERS', 8)),
+                            photo_job_ttl=int(os.getenv('PHOTO_JOB_TTL', 600)),
+                            history_workers=int(os.getenv('HISTORY_WORKERS', 2)),
+                            history_flush_interval=float(os.getenv('HISTORY_FLUSH_INTERVAL', 0.5)),
+                            history_batch_size=int(os.getenv('HISTORY_BATCH_SIZE', 500)),
+                            history_buffer_size=int(os.getenv('HISTORY_BUFFER_SIZE', 10000))),
+        cache=Cache(users_size=int(os.getenv('USERS_CACHE_SIZE', 10000)),
+                    users_ttl=int(os.getenv('USERS_CACHE_TTL', 86400)),
+                    file_ids_size=int(os.getenv('FILE_IDS_CACHE_SIZE', 50000)),
+                    file_ids_ttl=int(os.getenv('FILE_IDS_CACHE_TTL', 2592000)),
+                    nasa_size=int(os.getenv('NASA_CACHE_SIZE', 500)),
+                    nasa_ttl=int(os.getenv('NASA_CACHE_TTL', 86400))),
+        sending=Sending(global_rate=float(os.getenv('SEND_GLOBAL_RATE', 30)),
+                        chat_rate=float(os.getenv('SEND_CHAT_RATE', 1)),
+                        group_rate=float(os.getenv('SEND_GROUP_RATE', 0.33)),
+                        chat_burst=float(os.getenv('SEND_CHAT_BURST', 3))),
+        monitoring=Monitoring(metrics_interval=int(os.getenv('METRICS_INTERVAL', 60)),
+                              overload_max_queue=int(os.getenv('OVERLOAD_MAX_QUEUE', 200)),
+                              overload_max_lag=float(os.getenv('OVERLOAD_MAX_LAG', 0.5)),
+                              overload_max_error_rate=float(os.getenv('OVERLOAD_MAX_ERROR_RATE', 0.5)),
+                              overload_min_quota=int(os.getenv('OVERLOAD_MIN_QUOTA', 100)),
+                              overload_slow_request=float(os.getenv('OVERLOAD_SLOW_REQUEST', 10)),
+                              overload_cooldown=float(os.getenv('OVERLOAD_COOLDOWN', 30)))
     )
@@ -1,8 +1,10 @@
+import asyncio
 import json
 import traceback
+from datetime import date
 from io import BytesIO
 from random import randint
-from typing import Optional, List, Dict, Any
+from typing import AsyncContextManager, Callable, Optional, List, Dict, Any, Union
 
 from PIL import Image
 from aiogoogletrans import Translator
@@ -10,14 +12,151 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.handler import ctx_data
 from aiogram.types import Message
 from aiogram.utils.exceptions import TelegramAPIError
+import yarl
 from aiohttp import ClientSession
 
 import tg_bot.keyboards.inline.inline_keyboards as inline
 from tg_bot.misc.states import Conditions
 from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+from tg_bot.services.nasa.availability import SOURCE_EARTH, SOURCE_MARS
+from tg_bot.services.nasa.fair_queue import NasaQuotas
+from tg_bot.services.nasa.overload import OverloadDetector
+from tg_bot.services.scheduler.prefetch import SUPERSEDED, PrefetchedPhoto
 
 logger = get_logger(name=__name__)
 
+# the number of candidates checked for the photo already sent by the bot in the degraded mode
+CACHED_CANDIDATES = 50
+
+
+def nasa_session(message: Message) -> ClientSession:
+    """Creates the session of the requests to NASA, whose responses are watched by the
+    detector of the overload
+
+    :param: message: current message
+    :type: message: Message
+    :return: session of the requests
+    :rtype: ClientSession
+
+    """
+    return ClientSession(trace_configs=[message.bot['overload'].trace])
+
+
+async def answer_degraded(message: Message) -> None:
+    """Politely tells the user that fresh photos are temporarily unavailable (the bot works
+    in the degraded mode and the requested data is not cached) and suggests choosing another
+    date or place (the state is set, in which only this keyboard is available)
+
+    :param: message: current message
+    :type: message: Message
+    :return: None
+
+    """
+    name: str = ctx_data.get()['user'].user_name
+    logger.warning(f'{name} did not receive fresh data, because the bot works in the degraded mode')
+    await Conditions.new_date_new_planet.set()
+    await message.answer('Сейчас NASA отвечает слишком медленно, поэтому свежие фотографии '
+                         'временно недоступны\n'
+                         'Попробуйте немного позже или выберите другую дату или планету)',
+                         reply_markup=inline.new_date_new_planet())
+
+
+async def take_cached_photo(message: Message, state: FSMContext, key: str,
+                            urls: List[str], colored_only: bool = False) -> Optional[str]:
+    """In the degraded mode takes from the list of the current state the photo already sent by
+    the bot (its file_id is cached), so it is shown without requests to NASA. If only color
+    photos of Mars were chosen, the photos that are not known to be color are skipped. The url
+    of the photo is recorded as the value of the contextual data dictionary for later addition
+    to the database using DataMiddleware. If no such photo is found, the user is told about it
+
+    :param: message: current message
+    :type: message: Message
+    :param: state: current state
+    :type: state: FSMContext
+    :param: key: key of the list of the photos in the dictionary of the current state
+    :type: key: string
+    :param: urls: urls of the photos of the list (in the same order)
+    :type: urls: List[string]
+    :param: colored_only: whether only the color photos of Mars are shown
+    :type: colored_only: bool
+    :return: file_id of the photo or None (if nothing is cached)
+    :rtype: Optional[string]
+
+    """
+    file_ids: List[Optional[str]] = await asyncio.gather(*[
+        message.bot['file_ids'].get(key=url) for url in urls[:CACHED_CANDIDATES]
+    ])
+    if colored_only:
+        colors: List[Optional[str]] = await asyncio.gather(*[
+            message.bot['mars_colors'].get(key=url) for url in urls[:CACHED_CANDIDATES]
+        ])
+        file_ids = [file_id if color == 'yes' else None for file_id, color in zip(file_ids, colors)]
+    for index, (url, file_id) in enumerate(zip(urls, file_ids)):
+        if file_id:
+            candidates: List = (await state.get_data())[key]
+            del candidates[index]
+            await state.update_data(**{key: candidates})
+            data: Dict = ctx_data.get()
+            data['photo_url']: str = url
+            ctx_data.set(data)
+            return file_id
+    await answer_degraded(message=message)
+
+
+def nasa_request(message: Message) -> AsyncContextManager[Callable[[int], None]]:
+    """Takes the place of the current user (via DataMiddleware) in the fair queue of the
+    requests to NASA (the request waits while the user has spent the budget of the window)
+
+    :param: message: current message
+    :type: message: Message
+    :return: context manager of the request, which gives the function adding the downloaded
+    bytes to the budget of the user
+    :rtype: AsyncContextManager[Callable[[integer], None]]
+
+    """
+    return message.bot['nasa'].request(user_id=ctx_data.get()['user'].user_id)
+
+
+async def remember_shown_photo(sent: Message, url: str, source: str, photo_date: str,
+                               caption: str) -> None:
+    """Writes the url and the description of the shown photo (source, date, dimensions,
+    caption and file_id received from Telegram) as the dictionary values of the context
+    data (for later addition to the database via DataMiddleware), so the history can be
+    shown later without requests to NASA. The file_id is also cached by the url of the
+    photo (the url of the candidate, not the one NASA redirects to), so the photo can be sent
+    again without downloading it (in the degraded mode too)
+
+    :param: sent: the message with the shown photo
+    :type: sent: Message
+    :param: url: url of the photo
+    :type: url: string
+    :param: source: explored place (Mars, Earth, Space)
+    :type: source: string
+    :param: photo_date: date of the photo (YYYY-MM-DD)
+    :type: photo_date: string
+    :param: caption: caption of the photo in the history
+    :type: caption: string
+    :return: None
+
+    """
+    try:
+        day: Optional[date] = date.fromisoformat(photo_date)
+    except (TypeError, ValueError):
+        day = None
+    size = sent.photo[-1] if sent.photo else None
+    data: Dict = ctx_data.get()
+    data['photo_url']: str = url
+    data['photo_metadata']: Dict[str, Any] = dict(source=source,
+                                                  photo_date=day,
+                                                  width=size.width if size else None,
+                                                  height=size.height if size else None,
+                                                  caption=caption,
+                                                  file_id=size.file_id if size else None)
+    ctx_data.set(data)
+    if size and url:
+        await sent.bot['file_ids'].set(key=url, value=size.file_id)
+
 
 async def get_all_mars_photos(message: Message, state: FSMContext) -> Optional[bool]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use his name
@@ -33,7 +172,10 @@ async def get_all_mars_photos(message: Message, state: FSMContext) -> Optional[b
     connection fails,the request is repeated (3 times). If the number of connection
     attempts to the api reaches the specified limit, the function returns. If all photos
     of the Mars are received, they are processed and the necessary information (photo id)
-    is extracted (using 'process_mars_data' function), after this True is returned.
+    is extracted (using 'process_mars_data' function), after this True is returned. The processed
+    photos are cached by the date and are taken from the cache without requests to the API (in the
+    degraded mode only the cached photos are available). If the index of the dates with photos
+    knows that the rover took no photos on the day, the API is not requested at all.
 
     :param: message: current message
     :type: message: Message
@@ -50,6 +192,24 @@ async def get_all_mars_photos(message: Message, state: FSMContext) -> Optional[b
     ROVER_URL: str = 'https://api.nasa.gov/mars-photos/api/v1/rovers/curiosity/photos'
     params: Dict[str: str] = dict(earth_date=current_data.get('calendar_date'),
                         api_key=message.bot.get('config').api.nasa_api_token)
+    cache_key: str = f'mars:{current_data.get("calendar_date")}'
+    if message.bot['availability'].is_empty(source=SOURCE_MARS, day=current_data.get('calendar_date')):
+        metrics.increment('availability.empty_dates')
+        logger.warning(f"{name} couldn't find any photos of Mars "
+                       f"on the specified date (by the index of the dates)")
+        await Conditions.new_date_new_planet.set()
+        await message.answer('В этот день марсоход не сделал ни одного фото)\n'
+                             'Хотите изменить свое решение?',
+                             reply_markup=inline.new_date_new_planet())
+        return
+    cached: Optional[str] = await message.bot['nasa_cache'].get(key=cache_key)
+    if cached:
+        await state.update_data(mars_photos=json.loads(cached))
+        logger.info(f'{name} have received all photos of Mars from the cache')
+        return True
+    if message.bot['overload'].degraded:
+        await answer_degraded(message=message)
+        return
     while True:
         if connection_attempts == 3:
             await message.answer('Попробуйте воспользоваться мной немного позже')
@@ -57,10 +217,11 @@ async def get_all_mars_photos(message: Message, state: FSMContext) -> Optional[b
                             f'of connection to the API, {name} finished his work'
                             f' with the bot')
             return
-        async with ClientSession() as session:
+        async with nasa_request(message=message) as charge, nasa_session(message=message) as session:
             async with session.get(url=ROVER_URL, params=params) as response:
                 if response.status == 200:
                     response_dictionary: json = await response.json()
+                    charge(response.content_length or 0)
                     if 'photos' not in response_dictionary:
                         logger.critical(f'{name} in the process of receiving Mars photos'
                                         f' has exhausted the daily limit of the API connections')
@@ -79,6 +240,8 @@ async def get_all_mars_photos(message: Message, state: FSMContext) -> Optional[b
                         logger.info(f'{name} have received all photos of Mars '
                                     f'(not processed)')
                         await process_mars_data(initial_mars_data=response_dictionary, state=state)
+                        await message.bot['nasa_cache'].set(
+                            key=cache_key, value=json.dumps((await state.get_data())['mars_photos']))
                         return True
                 else:
                     await message.answer('Кажется появились какие-то проблемы с подключением\n'
@@ -112,7 +275,7 @@ async def process_mars_data(initial_mars_data: json, state: FSMContext) -> None:
 
 
 
-async def mars_request(message: Message, state: FSMContext) -> Optional[bytes]:
+async def mars_request(message: Message, state: FSMContext) -> Optional[Union[bytes, str]]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use his name
     when recording log message. Takes the current data (dictionary of the current state).
     Executes an API request, using the ID (random) of the Mars photo from the  list, assigned as
@@ -122,9 +285,11 @@ async def mars_request(message: Message, state: FSMContext) -> Optional[bytes]:
     into bytes and passed to the validator function, which checks whether the photo matches
     the specified parameters. If the photo is high resolution, it is returned. The url of the
     Mars photo is recorded as the value of the contextual data dictionary for later addition
-    to the database using DataMiddleware. If all photos are shown (or None are found), it is
+    to the database using DataMiddleware. The checked photo is removed from the list of the
+    current state, so it is not shown again. If all photos are shown (or None are found), it is
     suggested to select a new date and continue exploring the selected place or choose another
-    (the state is set, in which only calendar is available).
+    (the state is set, in which only calendar is available). In the degraded mode only the photos
+    already sent by the bot are shown (by their file_id), without requests to the API.
 
     :param: message: current message
     :type: message: Message
@@ -133,14 +298,19 @@ async def mars_request(message: Message, state: FSMContext) -> Optional[bytes]:
     :exception: The IndexError, AttributeError, ValueError exceptions occur if there are
     no more photos of Mars in the list (the value of the 'mars_photos' key of the dictionary of
     the current state).
-    :return: high-resolution photo transformed into bytes or None (if the total number
-    of requests to the api / connection attempts is exceeded or something went wrong)
-    :rtype: Optional[bytes]
+    :return: high-resolution photo transformed into bytes, file_id of the photo already sent
+    (in the degraded mode) or None (if the total number of requests to the api / connection
+    attempts is exceeded or something went wrong)
+    :rtype: Optional[Union[bytes, string]]
 
     """
     connection_attempts: int = 0
     name: str = ctx_data.get().get('user').user_name
     current_data: Dict[str: Any] = await state.get_data()
+    if message.bot['overload'].degraded:
+        return await take_cached_photo(message=message, state=state, key='mars_photos',
+                                       urls=current_data.get('mars_photos') or [],
+                                       colored_only=current_data.get('mars_color_chosen') == 'yes')
     while True:
         if connection_attempts == 3:
             logger.critical(f'In the process of getting one Mars photo, after three attempts '
@@ -151,15 +321,17 @@ async def mars_request(message: Message, state: FSMContext) -> Optional[bytes]:
         try:
             current_photo: str = current_data.get('mars_photos').pop(
                 randint(0, len(current_data.get('mars_photos')) - 1))
-            async with ClientSession() as session:
+            await state.update_data(mars_photos=current_data.get('mars_photos'))
+            async with nasa_request(message=message) as charge, nasa_session(message=message) as session:
                 async with session.get(url=current_photo) as response:
                     if response.status == 200:
                         logger.info(f'{name} have received some picture of Mars, '
                                     f'and is going to check its quality')
                         bytes_image: bytes = await response.read()
+                        charge(len(bytes_image))
                         if await validate_mars_image(image_bytes=bytes_image, state=state):
                             data: Dict = ctx_data.get()
-                            data['photo_url']: str = str(response.url)
+                            data['photo_url']: str = current_photo
                             ctx_data.set(data)
                             return bytes_image
                     else:
@@ -193,22 +365,46 @@ async def validate_mars_image(image_bytes: bytes, state: FSMContext) -> Optional
 
     """
     name: str = ctx_data.get().get('user').user_name
-    image: image_bytes = Image.open(BytesIO(initial_bytes=image_bytes))
     current_data: Dict[str: str] = await state.get_data()
-    if current_data.get('mars_color_chosen') == 'yes':
-        if image.width >= 1024 and image.height >= 1024 and image.mode != 'L':
-            logger.info(f'{name} have received the photo of Mars with high resolution')
-            return True
-        else:
-            logger.info(f'{name} have received the photo of Mars with a low resolution')
-            return False
-    elif current_data.get('mars_color_chosen') == 'no':
-        if image.width >= 1024 and image.height >= 1024:
-            logger.info(f'{name} have received the photo of Mars with high resolution')
-            return True
-        else:
-            logger.info(f'{name} have received the photo of Mars with a low resolution')
-            return False
+    if current_data.get('mars_color_chosen') not in ('yes', 'no'):
+        return
+    if is_suitable_mars_image(image_bytes=image_bytes,
+                              color_chosen=current_data.get('mars_color_chosen')):
+        logger.info(f'{name} have received the photo of Mars with high resolution')
+        return True
+    logger.info(f'{name} have received the photo of Mars with a low resolution')
+    return False
+
+
+def is_suitable_mars_image(image_bytes: bytes, color_chosen: str) -> bool:
+    """Checks the photo of Mars, translated into bytes, for compliance with the specified
+    size and color (only the header of the image is read)
+
+    :param: image_bytes: transformed current image of Mars
+    :type: image_bytes: bytes
+    :param: color_chosen: 'yes' if color photos were chosen, 'no' if uncolored
+    :type: color_chosen: string
+    :return: True, if the photo meets the specified standard, else False
+    :rtype: bool
+
+    """
+    image: Image.Image = Image.open(BytesIO(initial_bytes=image_bytes))
+    if image.width < 1024 or image.height < 1024:
+        return False
+    return color_chosen != 'yes' or is_colored_image(image_bytes=image_bytes)
+
+
+def is_colored_image(image_bytes: bytes) -> bool:
+    """Checks whether the photo, translated into bytes, is color (only the header of the
+    image is read)
+
+    :param: image_bytes: transformed current image
+    :type: image_bytes: bytes
+    :return: True, if the photo is color, else False
+    :rtype: bool
+
+    """
+    return Image.open(BytesIO(initial_bytes=image_bytes)).mode != 'L'
 
 
 
@@ -234,7 +430,7 @@ async def get_mars_photo_bytes(message: Message, state: FSMContext) -> Optional[
     """
     name: str = ctx_data.get()['user'].user_name
     current_data: Dict[str: Any] = await state.get_data()
-    if not current_data.get('mars_photos'):
+    if current_data.get('mars_photos') is None:
         logger.info(f'{name} is sending a request to the API at the first time'
                     f'(in the process of receiving of Mars photos)')
         current_urls: bool = await get_all_mars_photos(message=message, state=state)
@@ -250,10 +446,20 @@ async def get_mars_photo_bytes(message: Message, state: FSMContext) -> Optional[
 
 async def show_mars_photo(message: Message, state: FSMContext) -> None:
     """Sets the state (working_with_mars) in which only the keyboard offering "view photos
-    of Mars or stop" is available. Sends a gif message to the user, which is displayed until
-    the photo of Mars with the above keyboard appears or the message appears stating that the
-    api connection limit or the number of connection attempts has been exceeded. Retrieves the
-    necessary user from the database (via DataMiddleware) to use his name when recording log message.
+    of Mars or stop" is available. If the next photo has already been found in the background
+    (while the user was looking at the previous one), it is shown at once. Otherwise sends a gif
+    message to the user (by its cached file_id), which is displayed until the photo of Mars is
+    found or the message appears stating that the api connection limit or the number of connection
+    attempts has been exceeded (if the photos of the date are already known, only the action of
+    the chat is sent instead of the gif). The photo is shown in one message together with the
+    above keyboard, after which the search of the next photo is started in the background. Retrieves the necessary
+    user from the database (via DataMiddleware) to use his name when recording log message.
+    The url and the description of the shown photo are written to the context data (for later
+    addition to the database via DataMiddleware). Whether the downloaded photo is color is cached
+    by its url, so only the color photos are shown in the degraded mode if they were chosen.
+    The search is registered as the in-flight fetch of the chat and is cancelled (nothing is shown)
+    if the user moves on before the photo is found. In the degraded mode the next photo is not
+    searched in the background.
 
     :param: message: current message
     :type: message: Message
@@ -263,20 +469,90 @@ async def show_mars_photo(message: Message, state: FSMContext) -> None:
 
     """
     await Conditions.working_with_mars.set()
-    gif: Message = await message.bot.send_animation(
-        chat_id=message.chat.id,
-        animation='https://vgif.ru/gifs/166/vgif-ru-37964.gif')
-    image: bytes = await get_mars_photo_bytes(message=message, state=state)
+    current_data: Dict[str: Any] = await state.get_data()
+    prefetch_key: tuple = ('Mars', current_data['calendar_date'],
+                           current_data.get('mars_color_chosen'))
+    prefetched: Optional[PrefetchedPhoto] = await message.bot['prefetch'].take(
+        chat_id=message.chat.id, key=prefetch_key, fetches=message.bot['fetches'])
+    if prefetched is SUPERSEDED:
+        return
+    if prefetched:
+        await state.update_data(mars_photos=prefetched.remaining)
+    if prefetched and prefetched.photo:
+        image: bytes = prefetched.photo
+        data: Dict = ctx_data.get()
+        data['photo_url']: str = prefetched.url
+    else:
+        warm: bool = bool(current_data.get('mars_photos')) or await message.bot['nasa_cache'].get(
+            key=f'mars:{current_data["calendar_date"]}') is not None
+        async with message.bot['loading'].show(chat_id=message.chat.id, warm=warm):
+            image: bytes = await message.bot['fetches'].run(
+                chat_id=message.chat.id, fetch=get_mars_photo_bytes(message=message, state=state))
     if image:
-        current_data: Dict[str: Any] = await state.get_data()
-        await message.bot.send_photo(chat_id=message.chat.id,
-                                     photo=image,
-                                     caption=f'Актуальное фото Марса на {current_data["calendar_date"]}')
-        await message.answer('\nНу что, останемся еще немного на этой планете '
-                             'или выберем что-то другое?)', reply_markup=inline.show_more_mars_photo())
+        sent: Message = await message.bot.send_photo(
+            chat_id=message.chat.id,
+            photo=image,
+            caption=f'Актуальное фото Марса на {current_data["calendar_date"]}\n\n'
+                    f'Ну что, останемся еще немного на этой планете '
+                    f'или выберем что-то другое?)',
+            reply_markup=inline.show_more_mars_photo())
+        photo_url: Optional[str] = ctx_data.get().get('photo_url')
+        await remember_shown_photo(sent=sent, url=photo_url, source='Mars',
+                                   photo_date=current_data['calendar_date'],
+                                   caption=f'Марс, {current_data["calendar_date"]}')
+        if isinstance(image, bytes) and photo_url:
+            await message.bot['mars_colors'].set(
+                key=photo_url, value='yes' if is_colored_image(image_bytes=image) else 'no')
         name: str = ctx_data.get()['user'].user_name
         logger.info(f'{name} have watched one photo of Mars')
-    await gif.delete()
+        if message.bot['overload'].degraded:
+            return
+        current_data = await state.get_data()
+        message.bot['prefetch'].start(
+            chat_id=message.chat.id, key=prefetch_key,
+            fetch=find_next_mars_photo(candidates=current_data.get('mars_photos') or [],
+                                       color_chosen=current_data.get('mars_color_chosen'),
+                                       quotas=message.bot['nasa'], user_id=ctx_data.get()['user'].user_id,
+                                       overload=message.bot['overload']))
+
+
+async def find_next_mars_photo(candidates: List[str], color_chosen: str, quotas: NasaQuotas,
+                               user_id: int, overload: OverloadDetector) -> PrefetchedPhoto:
+    """Searches (in the background, without any messages to the user) the next high-resolution
+    photo of Mars among the candidates, that have not been shown yet. The search is stopped
+    after three unsuccessful connection attempts to the API
+
+    :param: candidates: urls of the photos of Mars that have not been shown yet
+    :type: candidates: list with strings
+    :param: color_chosen: 'yes' if color photos were chosen, 'no' if uncolored
+    :type: color_chosen: string
+    :param: quotas: fair queue of the requests to NASA
+    :type: quotas: NasaQuotas
+    :param: user_id: id of the user
+    :type: user_id: integer
+    :param: overload: detector of the overload, which watches the responses of NASA
+    :type: overload: OverloadDetector
+    :return: found photo (or None instead of the photo, if nothing suitable was found)
+    together with the candidates that have not been checked yet
+    :rtype: PrefetchedPhoto
+
+    """
+    candidates: List[str] = list(candidates)
+    connection_attempts: int = 0
+    async with ClientSession(trace_configs=[overload.trace]) as session:
+        while candidates and connection_attempts < 3:
+            current_photo: str = candidates.pop(randint(0, len(candidates) - 1))
+            async with quotas.request(user_id=user_id) as charge, \
+                    session.get(url=current_photo) as response:
+                if response.status != 200:
+                    connection_attempts += 1
+                    continue
+                bytes_image: bytes = await response.read()
+                charge(len(bytes_image))
+                if is_suitable_mars_image(image_bytes=bytes_image, color_chosen=color_chosen):
+                    return PrefetchedPhoto(photo=bytes_image, url=current_photo,
+                                           remaining=candidates)
+    return PrefetchedPhoto(photo=None, url=None, remaining=candidates)
 
 
 async def get_all_earth_photos(message: Message, state: FSMContext) -> Optional[bool]:
@@ -290,7 +566,10 @@ async def get_all_earth_photos(message: Message, state: FSMContext) -> Optional[
     The dictionary containing all photos of Earth (deserialized json) is passed into the
     function ('process_earth_data') which process it and transform to the proper form (dictionary,
     containing the image ID and its date as the values)  and writes this dict as the value of
-    dictionary of the current state (in this case, True is returned). If the connection fails,
+    dictionary of the current state (in this case, True is returned). The processed photos are
+    cached by the date and are taken from the cache without requests to the API (in the degraded
+    mode only the cached photos are available). If the index of the dates with photos knows that
+    there are no photos on the day, the API is not requested at all. If the connection fails,
     the request is repeated. If the number of connection attempts to the api reaches the specified
     limit, the function returns.
 
@@ -308,6 +587,24 @@ async def get_all_earth_photos(message: Message, state: FSMContext) -> Optional[
     URL: str = f'https://api.nasa.gov/EPIC/api/natural/date/{current_data["calendar_date"]}'
     params: Dict = dict(api_key=message.bot.get('config').api.nasa_api_token)
     name: str = ctx_data.get()['user'].user_name
+    cache_key: str = f'earth:{current_data["calendar_date"]}'
+    if message.bot['availability'].is_empty(source=SOURCE_EARTH, day=current_data['calendar_date']):
+        metrics.increment('availability.empty_dates')
+        logger.warning(f"{name} couldn't find any photos of Earth"
+                       f" on the specified date (by the index of the dates)")
+        await Conditions.new_date_new_planet.set()
+        await message.answer('В выбранную вами дату нет ни одного фото\n'
+                             'Измените сове решение?',
+                             reply_markup=inline.new_date_new_planet())
+        return
+    cached: Optional[str] = await message.bot['nasa_cache'].get(key=cache_key)
+    if cached:
+        await state.update_data(earth_photos=json.loads(cached))
+        logger.info(f'{name} have received all photos of Earth from the cache')
+        return True
+    if message.bot['overload'].degraded:
+        await answer_degraded(message=message)
+        return
     while True:
         if connection_attempts == 3:
             await message.answer('Попробуйте воспользоваться мной немного позже')
@@ -315,10 +612,11 @@ async def get_all_earth_photos(message: Message, state: FSMContext) -> Optional[
                             f'of connection to the  API, {name} finished his work '
                             f'with the bot')
             return
-        async with ClientSession() as session:
+        async with nasa_request(message=message) as charge, nasa_session(message=message) as session:
             async with session.get(url=URL, params=params) as response:
                 if response.status == 200:
                     all_earth_photos: json = await response.json()
+                    charge(response.content_length or 0)
                     if not all_earth_photos:
                         logger.warning(f"{name} couldn't find any photos of Earth"
                                        f" on the specified date")
@@ -331,6 +629,8 @@ async def get_all_earth_photos(message: Message, state: FSMContext) -> Optional[
                         logger.info(f'{name} have received all photos of Earth '
                                     f'(not processed)')
                         await process_earth_data(initial_earth_data=all_earth_photos, state=state)
+                        await message.bot['nasa_cache'].set(
+                            key=cache_key, value=json.dumps((await state.get_data())['earth_photos']))
                         return True
                 else:
                     await message.answer('Кажется появились какие-то проблемы с соединением\n'
@@ -377,6 +677,7 @@ async def earth_request(message: Message, state: FSMContext) -> Optional[str]:
     (when data about all Earth photos is collected). If the connection fails, the request is
     repeated. If the number of connection attempts to the api reaches the specified limit,
     the function returns. A successful response is transformed into bytes and will be returned.
+    The checked photo is removed from the list of the current state, so it is not shown again.
     If all photos are shown (or none are found), it is suggested to select a new date and continue
     exploring the selected place or choose another place (a state is set in which only this keyboard
     is available).
@@ -388,7 +689,8 @@ async def earth_request(message: Message, state: FSMContext) -> Optional[str]:
     :exception: The IndexError, AttributeError, ValueError exceptions occur if there
     are no more photos of Earth in the list with dictionaries (the value
     of the dictionary of the current state)
-    # :return:  url of the photo of Earth or None (if the total number of requests to
+    # :return:  url of the photo of Earth, file_id of the photo already sent (in the degraded
+    mode, when no requests are sent to the API) or None (if the total number of requests to
     the api / connection attempts is exceeded or something went wrong)
     :rtype: Optional[string]
 
@@ -396,6 +698,11 @@ async def earth_request(message: Message, state: FSMContext) -> Optional[str]:
     connection_attempts: int = 0
     name: str = ctx_data.get()['user'].user_name
     current_data: Dict[str: Any] = await state.get_data()
+    if message.bot['overload'].degraded:
+        api_key: str = message.bot.get('config').api.nasa_api_token
+        return await take_cached_photo(message=message, state=state, key='earth_photos',
+                                       urls=[earth_photo_url(photo=photo, api_key=api_key)
+                                             for photo in current_data.get('earth_photos') or []])
     while True:
         if connection_attempts == 3:
             logger.critical(f'In the process of getting one Earth photo, after '
@@ -406,14 +713,19 @@ async def earth_request(message: Message, state: FSMContext) -> Optional[str]:
         try:
             current_photo_dict: Dict[str: str] = current_data['earth_photos'].pop(
                 randint(0, len(current_data['earth_photos']) - 1))
+            await state.update_data(earth_photos=current_data['earth_photos'])
             current_date: str = current_photo_dict['date']
             current_image: str = current_photo_dict['image']
             URL: str = f'https://api.nasa.gov/EPIC/archive/natural/{current_date}/png/{current_image}.png'
             params: Dict[str: str] = dict(api_key=message.bot.get('config').api.nasa_api_token)
-            async with ClientSession() as session:
+            async with nasa_request(message=message), nasa_session(message=message) as session:
                 async with session.get(url=URL, params=params) as response:
                     if response.status == 200:
                         current_photo = str(response.url)
+                        data: Dict = ctx_data.get()
+                        data['photo_url']: str = earth_photo_url(photo=current_photo_dict,
+                                                                 api_key=params['api_key'])
+                        ctx_data.set(data)
                         logger.info(f'{name} have received one photo of Earth')
                         return current_photo
                     else:
@@ -432,6 +744,21 @@ async def earth_request(message: Message, state: FSMContext) -> Optional[str]:
             return
 
 
+def earth_photo_url(photo: Dict[str, str], api_key: str) -> str:
+    """Returns the url of the photo of Earth in the archive of the API
+
+    :param: photo: the main parameters of the photo of Earth (image ID and date)
+    :type: photo: dictionary
+    :param: api_key: your private NASA API token
+    :type: api_key: string
+    :return: url of the photo
+    :rtype: string
+
+    """
+    return str(yarl.URL(f'https://api.nasa.gov/EPIC/archive/natural/{photo["date"]}'
+                        f'/png/{photo["image"]}.png').with_query(api_key=api_key))
+
+
 async def get_one_earth_photo(message: Message, state: FSMContext) -> Optional[str]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use his name when
     recording log message. Takes the current data (dictionary of the current state). If the
@@ -454,7 +781,7 @@ async def get_one_earth_photo(message: Message, state: FSMContext) -> Optional[s
     """
     name: str = ctx_data.get()['user'].user_name
     current_data: Dict[str: Any] = await state.get_data()
-    if not current_data.get('earth_photos'):
+    if current_data.get('earth_photos') is None:
         logger.info(f'{name} is sending a request to the API at the first time'
                     f'(in a process of receiving Earth photos)')
         current_urls: bool = await get_all_earth_photos(message=message, state=state)
@@ -470,12 +797,20 @@ async def get_one_earth_photo(message: Message, state: FSMContext) -> Optional[s
 
 async def show_earth_photo(message: Message, state: FSMContext) -> None:
     """Takes the current data (dictionary of the current state). Sets the state in which only
-    the keyboard offering "view photos of Earth or stop" is available. Sends a gif message to
-    the user, which is displayed until a photo of Earth with the above keyboard appears or
-    a message appears, stating that the api connection limit or the number of connection
-    attempts has been exceeded. Retrieves the necessary user from the database (via DataMiddleware)
-    to use his name when recording log message. Writes the url of the photo of Earth as the
-    dictionary value of the context data (for later addition to the database via DataMiddleware)
+    the keyboard offering "view photos of Earth or stop" is available. If the next photo has
+    already been found in the background (while the user was looking at the previous one), it
+    is shown at once. Otherwise sends a gif message to the user (by its cached file_id), which is
+    displayed until a photo of Earth is found or a message appears, stating that the api connection
+    limit or the number of connection attempts has been exceeded (if the photos of the date are
+    already known, only the action of the chat is sent instead of the gif). The photo is shown
+    in one message together with the above keyboard, after which the search of the next photo
+    is started in the background.
+    Retrieves the necessary user from the database (via DataMiddleware) to use his name when
+    recording log message. Writes the url and the description of the photo of Earth as the
+    dictionary values of the context data (for later addition to the database via DataMiddleware).
+    The search is registered as the in-flight fetch of the chat and is cancelled (nothing is shown)
+    if the user moves on before the photo is found. In the degraded mode the next photo is not
+    searched in the background.
 
     :param: message: current message
     :type: message: Message
@@ -486,23 +821,85 @@ async def show_earth_photo(message: Message, state: FSMContext) -> None:
     """
     current_data: Dict[str: Any] = await state.get_data()
     await Conditions.working_with_earth.set()
-    gif: Message = await message.bot.send_animation(
-        chat_id=message.chat.id,
-        animation='https://vgif.ru/gifs/166/vgif-ru-37964.gif')
-    image: str = await get_one_earth_photo(message=message, state=state)
+    prefetch_key: tuple = ('Earth', current_data['calendar_date'])
+    prefetched: Optional[PrefetchedPhoto] = await message.bot['prefetch'].take(
+        chat_id=message.chat.id, key=prefetch_key, fetches=message.bot['fetches'])
+    if prefetched is SUPERSEDED:
+        return
+    if prefetched:
+        await state.update_data(earth_photos=prefetched.remaining)
+    if prefetched and prefetched.photo:
+        image: str = prefetched.photo
+        data: Dict = ctx_data.get()
+        data['photo_url']: str = prefetched.url
+    else:
+        warm: bool = bool(current_data.get('earth_photos')) or await message.bot['nasa_cache'].get(
+            key=f'earth:{current_data["calendar_date"]}') is not None
+        async with message.bot['loading'].show(chat_id=message.chat.id, warm=warm):
+            image: str = await message.bot['fetches'].run(
+                chat_id=message.chat.id, fetch=get_one_earth_photo(message=message, state=state))
     if image:
-        await message.bot.send_photo(chat_id=message.chat.id,
-                                     photo=image,
-                                     caption=f'Актуальное фото земли на {current_data["calendar_date"]}\n')
-        await message.answer('\nНу что, останемся еще немного на этой планете '
-                             'или выберем что-то другое?)',
-                             reply_markup=inline.show_more_earth_photo())
+        sent: Message = await message.bot.send_photo(
+            chat_id=message.chat.id,
+            photo=image,
+            caption=f'Актуальное фото земли на {current_data["calendar_date"]}\n\n'
+                    f'Ну что, останемся еще немного на этой планете '
+                    f'или выберем что-то другое?)',
+            reply_markup=inline.show_more_earth_photo())
         name: str = ctx_data.get()['user'].user_name
         logger.info(f'{name} have watched one photo of Earth')
-        data: Dict = ctx_data.get()
-        data['photo_url']: str = image
-        ctx_data.set(data)
-    await gif.delete()
+        await remember_shown_photo(sent=sent, url=ctx_data.get().get('photo_url') or image,
+                                   source='Earth', photo_date=current_data['calendar_date'],
+                                   caption=f'Земля, {current_data["calendar_date"]}')
+        if message.bot['overload'].degraded:
+            return
+        current_data = await state.get_data()
+        message.bot['prefetch'].start(
+            chat_id=message.chat.id, key=prefetch_key,
+            fetch=find_next_earth_photo(candidates=current_data.get('earth_photos') or [],
+                                        api_key=message.bot.get('config').api.nasa_api_token,
+                                        quotas=message.bot['nasa'], user_id=ctx_data.get()['user'].user_id,
+                                        overload=message.bot['overload']))
+
+
+async def find_next_earth_photo(candidates: List[Dict[str, str]], api_key: str, quotas: NasaQuotas,
+                                user_id: int, overload: OverloadDetector) -> PrefetchedPhoto:
+    """Searches (in the background, without any messages to the user) the next available
+    photo of Earth among the candidates, that have not been shown yet. The search is stopped
+    after three unsuccessful connection attempts to the API
+
+    :param: candidates: dictionaries with the main parameters of the photos of Earth
+    that have not been shown yet
+    :type: candidates: list with dictionaries
+    :param: api_key: your private NASA API token
+    :type: api_key: string
+    :param: quotas: fair queue of the requests to NASA
+    :type: quotas: NasaQuotas
+    :param: user_id: id of the user
+    :type: user_id: integer
+    :param: overload: detector of the overload, which watches the responses of NASA
+    :type: overload: OverloadDetector
+    :return: url of the found photo (or None instead of it, if nothing was found) together
+    with the candidates that have not been checked yet
+    :rtype: PrefetchedPhoto
+
+    """
+    candidates: List[Dict[str, str]] = list(candidates)
+    connection_attempts: int = 0
+    async with ClientSession(trace_configs=[overload.trace]) as session:
+        while candidates and connection_attempts < 3:
+            current_photo_dict: Dict[str, str] = candidates.pop(randint(0, len(candidates) - 1))
+            URL: str = (f'https://api.nasa.gov/EPIC/archive/natural/{current_photo_dict["date"]}'
+                        f'/png/{current_photo_dict["image"]}.png')
+            async with quotas.request(user_id=user_id), \
+                    session.get(url=URL, params=dict(api_key=api_key)) as response:
+                if response.status != 200:
+                    connection_attempts += 1
+                    continue
+                return PrefetchedPhoto(photo=str(response.url),
+                                       url=earth_photo_url(photo=current_photo_dict, api_key=api_key),
+                                       remaining=candidates)
+    return PrefetchedPhoto(photo=None, url=None, remaining=candidates)
 
 
 async def get_all_space_data_from_api(message: Message, state: FSMContext) -> Optional[Dict]:
@@ -511,7 +908,8 @@ async def get_all_space_data_from_api(message: Message, state: FSMContext) -> Op
     an api request using the date of the space snapshot from 'current data'. If the connection
     fails, the request is repeated. If the number of connection attempts to the api reaches
     the specified limit, the function returns. A successful response is deserialized to the
-    dictionary
+    dictionary and cached by the date (the cached response is returned without requests to the
+    API; in the degraded mode only the cached responses are available)
 
     :param: message: current message
     :type: message: Message
@@ -529,6 +927,14 @@ async def get_all_space_data_from_api(message: Message, state: FSMContext) -> Op
     params: Dict[str: str] = dict(date=current_data['calendar_date'],
                         api_key=message.bot.get('config').api.nasa_api_token)
     name: str = ctx_data.get()['user'].user_name
+    cache_key: str = f'apod:{current_data["calendar_date"]}'
+    cached: Optional[str] = await message.bot['nasa_cache'].get(key=cache_key)
+    if cached:
+        logger.info(f'{name} have received one photo of the space from the cache')
+        return json.loads(cached)
+    if message.bot['overload'].degraded:
+        await answer_degraded(message=message)
+        return
     while True:
         if connection_attempts == 3:
             logger.critical(f'In the process of getting one photo of the space, after '
@@ -536,11 +942,13 @@ async def get_all_space_data_from_api(message: Message, state: FSMContext) -> Op
                             f'finished his work with the bot')
             await message.answer('Попробуйте воспользоваться мной немного позже')
             return
-        async with ClientSession() as session:
+        async with nasa_request(message=message) as charge, nasa_session(message=message) as session:
             async with session.get(url=URL, params=params) as response:
                 if response.status == 200:
                     current_photo: json = await response.json()
+                    charge(response.content_length or 0)
                     logger.info(f'{name} have received one photo of Earth')
+                    await message.bot['nasa_cache'].set(key=cache_key, value=json.dumps(current_photo))
                     return current_photo
                 else:
                     await message.answer('Кажется появились какие-то проблемы с подключением\n'
@@ -551,8 +959,9 @@ async def get_all_space_data_from_api(message: Message, state: FSMContext) -> Op
 
 
 async def show_space_photo(message: Message, state: FSMContext) -> None:
-    """Displays a GIF message that will be active until the photo with a description
-    of it is displayed. The api request is executed using the get_all_space_data_from_api
+    """Displays a GIF message (by its cached file_id) that will be active until the photo with
+    a description of it is displayed (if the data of the date is already cached, only the action
+    of the chat is sent instead of the GIF). The api request is executed using the get_all_space_data_from_api
     function, which returns a dictionary (deserialized json) with the main parameters of
     the space object (url, description, etc.) on the selected date. Retrieves the necessary
     user from the database (via DataMiddleware) to use his name when recording log message.
@@ -560,8 +969,10 @@ async def show_space_photo(message: Message, state: FSMContext) -> None:
     After the photo with description is displayed. The state is set, in which only the
     keyboard is available, offering to select a new date and continue exploring space
     or choose another place. The above keyboard is displayed with the corresponding message.
-    Writes the url of the photo of Space as the dictionary value of the context data
-    (for later addition to the database via DataMiddleware)
+    Writes the url and the description of the photo of Space as the dictionary values of the
+    context data (for later addition to the database via DataMiddleware). The api request is registered
+    as the in-flight fetch of the chat and is cancelled if the user moves on. The photo already sent
+    by the bot is sent by its cached file_id.
 
     :param: message: current message
     :type: message: aiogram.types.Message
@@ -571,33 +982,36 @@ async def show_space_photo(message: Message, state: FSMContext) -> None:
     :return: None
 
     """
-    gif: Message = await message.bot.send_animation(
-        chat_id=message.chat.id,
-        animation='https://vgif.ru/gifs/166/vgif-ru-37964.gif')
-    space_data: json = await get_all_space_data_from_api(message=message, state=state)
-
-    if space_data:
-        name: str = ctx_data.get()['user'].user_name
-        translator = Translator()
-        data_for_translation: List[str] = [space_data.get("title"), space_data.get("explanation")]
-        result = await translator.translate(text=data_for_translation, dest='ru')
-        try:
-            await message.bot.send_photo(chat_id=message.chat.id,
-                                         photo=space_data.get('hdurl'),
-                                         caption=f'Фотография на {space_data.get("date")}\n'
-                                                 f'Название: {result[0].text}\n')
-            await message.answer(f'Описание: {result[1].text}')
-            await Conditions.new_date_new_planet.set()
-            await message.answer('Хотите продолжить исследовать космос?\n'
-                                 'Можете выбрать другую дату или все же полетим на другую планету?',
-                                 reply_markup=inline.new_date_new_planet())
-            logger.info(f"{name} have received a good photo of space")
-            data: Dict = ctx_data.get()
-            data['photo_url']: str = space_data.get('hdurl')
-            ctx_data.set(data)
-        except TelegramAPIError:
-            await Conditions.new_date_new_planet.set()
-            logger.warning(f'{name} have received a bad  photo of space \n {traceback.format_exc()}')
-            await message.answer('Получена не качественная фотография, можете выбрать другую дату или планету',
-                                 reply_markup=inline.new_date_new_planet())
-    await gif.delete()
\ No newline at end of file
+    current_data: Dict[str: Any] = await state.get_data()
+    warm: bool = await message.bot['nasa_cache'].get(
+        key=f'apod:{current_data["calendar_date"]}') is not None
+    async with message.bot['loading'].show(chat_id=message.chat.id, warm=warm):
+        space_data: json = await message.bot['fetches'].run(
+            chat_id=message.chat.id, fetch=get_all_space_data_from_api(message=message, state=state))
+
+        if space_data:
+            name: str = ctx_data.get()['user'].user_name
+            translator = Translator()
+            data_for_translation: List[str] = [space_data.get("title"), space_data.get("explanation")]
+            result = await translator.translate(text=data_for_translation, dest='ru')
+            file_id: Optional[str] = await message.bot['file_ids'].get(key=space_data.get('hdurl'))
+            try:
+                sent: Message = await message.bot.send_photo(
+                    chat_id=message.chat.id,
+                    photo=file_id or space_data.get('hdurl'),
+                    caption=f'Фотография на {space_data.get("date")}\n'
+                            f'Название: {result[0].text}\n')
+                await message.answer(f'Описание: {result[1].text}')
+                await Conditions.new_date_new_planet.set()
+                await message.answer('Хотите продолжить исследовать космос?\n'
+                                     'Можете выбрать другую дату или все же полетим на другую планету?',
+                                     reply_markup=inline.new_date_new_planet())
+                logger.info(f"{name} have received a good photo of space")
+                await remember_shown_photo(sent=sent, url=space_data.get('hdurl'), source='Space',
+                                           photo_date=space_data.get('date'),
+                                           caption=f'{result[0].text}, {space_data.get("date")}')
+            except TelegramAPIError:
+                await Conditions.new_date_new_planet.set()
+                logger.warning(f'{name} have received a bad  photo of space \n {traceback.format_exc()}')
+                await message.answer('Получена не качественная фотография, можете выбрать другую дату или планету',
+                                     reply_markup=inline.new_date_new_planet())
\ No newline at end of file
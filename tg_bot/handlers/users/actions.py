@@ -233,8 +233,8 @@ async def re_send_mars_photo(message: Message) -> Optional[bool]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use
     his name when recording log message. Warns the user that an incorrect message
     has been entered (after displaying the found photo of Mars and a keyboard
-    offering to continue viewing the photo or stop it). Deletes the previous
-    inline keyboard and displays it again.
+    offering to continue viewing the photo or stop it). Removes the previous
+    inline keyboard from the photo (the photo itself is kept) and displays it again.
 
     :param: message: current message
     :type: message: Message
@@ -245,8 +245,8 @@ async def re_send_mars_photo(message: Message) -> Optional[bool]:
     name = ctx_data.get()['user'].user_name
     logger.info(f"{name} entered incorrect answer"
                 f" about continue of viewing photos of Mars")
-    await message.bot.delete_message(chat_id=message.chat.id,
-                                     message_id=message.message_id - 1)
+    await message.bot.edit_message_reply_markup(chat_id=message.chat.id,
+                                                message_id=message.message_id - 1)
     await message.answer(text='Я вас не понимаю, подумайте еще)\n',
                          reply_markup=inline.show_more_mars_photo())
     return True
@@ -256,8 +256,8 @@ async def re_send_earth_photo(message: Message) -> Optional[bool]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use
     his name when recording log message. Warns the user that an incorrect message
     has been entered (after displaying the found photo of Earth and a keyboard
-    offering to continue viewing the photo or stop it). Deletes the previous
-    inline keyboard and displays it again.
+    offering to continue viewing the photo or stop it). Removes the previous
+    inline keyboard from the photo (the photo itself is kept) and displays it again.
 
     :param: message: current message
     :type: message: Message
@@ -268,8 +268,8 @@ async def re_send_earth_photo(message: Message) -> Optional[bool]:
     name: str = ctx_data.get()['user'].user_name
     logger.info(f"{name} entered incorrect answer"
                 f" about continue of viewing photos of Earth")
-    await message.bot.delete_message(chat_id=message.chat.id,
-                                     message_id=message.message_id - 1)
+    await message.bot.edit_message_reply_markup(chat_id=message.chat.id,
+                                                message_id=message.message_id - 1)
     await message.answer(text='Я вас не понимаю, подумайте еще)\n',
                          reply_markup=inline.show_more_earth_photo())
     return True
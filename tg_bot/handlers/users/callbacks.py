@@ -1,3 +1,4 @@
+from functools import partial
 from typing import Dict, Any, Optional
 
 import emoji
@@ -5,20 +6,109 @@ from aiogram import Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 from aiogram.dispatcher.handler import ctx_data
-from aiogram.types import CallbackQuery
+from aiogram.types import CallbackQuery, Message
 from aiogram.types import ReplyKeyboardRemove
 from aiogram.utils.callback_data import CallbackData
+from aiogram.utils.exceptions import TelegramAPIError
 
 from tg_bot.handlers.users.API import show_mars_photo, show_earth_photo, show_space_photo
 from tg_bot.handlers.users.actions import flight_beginning, help_answer, show_actions
 from tg_bot.keyboards.inline.inline_keyboards import mars_photos_color
 from tg_bot.misc.calendar import calendar_callback as dialog_cal_callback, DialogCalendar
+from tg_bot.misc.callback_answer import answers_callback
+from tg_bot.misc.limit_for_throttling import rate_limit
 from tg_bot.misc.states import Conditions
+from tg_bot.services.jobs.photo_jobs import PhotoJob
 from tg_bot.services.logger.my_logger import get_logger
 
 logger = get_logger(name=__name__)
 
 
+async def close_photo_keyboard(message: Message, text: str) -> None:
+    """Removes the keyboard offering to continue viewing photos and replaces it with the
+    text. The keyboard is shown either under the photo (then the first line of the caption,
+    containing the date of the photo, is kept, if the photo has the caption) or under the
+    text message
+
+    :param: message: message with the keyboard
+    :type: message: Message
+    :param: text: new text of the message
+    :type: text: string
+    :return: None
+
+    """
+    if message.photo:
+        await message.edit_caption(
+            caption='\n\n'.join((message.caption or '').splitlines()[:1] + [text]))
+    else:
+        await message.edit_text(text)
+
+
+async def start_photo_search(call: CallbackQuery, place: str, text: str) -> None:
+    """Shows the progress of the search in the message with the pressed button and puts
+    the search of the photo of the chosen place into the queue of background jobs (so the
+    processing of the update does not wait for the NASA API)
+
+    :param: call: current callback
+    :type: call: CallbackQuery
+    :param: place: explored place (Mars, Earth, Space)
+    :type: place: string
+    :param: text: text of the message with the pressed button
+    :type: text: string
+    :return: None
+
+    """
+    await close_photo_keyboard(message=call.message,
+                               text=emoji.emojize(f'{text} :hourglass_not_done:'))
+    await call.bot['jobs'].submit(PhotoJob(kind=place,
+                                           chat_id=call.message.chat.id,
+                                           user_id=call.from_user.id,
+                                           user_name=ctx_data.get()['user'].user_name,
+                                           message=call.message.to_python(),
+                                           done_text=text))
+
+
+async def run_photo_job(message: Message, state: FSMContext, job: PhotoJob) -> None:
+    """Executes the background job: calls the function showing the photo of the chosen place
+    and then removes the sign of the progress from the message with the pressed button
+
+    :param: message: the message with the pressed button
+    :type: message: Message
+    :param: state: current state
+    :type: state: FSMContext
+    :param: job: current job
+    :type: job: PhotoJob
+    :return: None
+
+    """
+    if job.kind == 'Mars':
+        await show_mars_photo(message=message, state=state)
+    elif job.kind == 'Earth':
+        await show_earth_photo(message=message, state=state)
+    elif job.kind == 'Space':
+        await show_space_photo(message=message, state=state)
+    await close_photo_keyboard(message=message, text=job.done_text)
+
+
+async def fail_photo_job(message: Message, job: PhotoJob) -> None:
+    """Is called when the background job has failed: removes the sign of the progress from
+    the message with the pressed button and tells the user about the problem
+
+    :param: message: the message with the pressed button
+    :type: message: Message
+    :param: job: current job
+    :type: job: PhotoJob
+    :return: None
+
+    """
+    try:
+        await close_photo_keyboard(message=message, text=job.done_text)
+    except TelegramAPIError:
+        logger.warning(f'the progress of the search of {job.user_name} was not removed')
+    await message.answer('Кажется что-то пошло не так\n'
+                         'Попробуйте воспользоваться мной немного позже')
+
+
 async def yes_answer(call: CallbackQuery) -> Optional[bool]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use
     his name when recording log messageProcesses the callback when pressing the
@@ -237,13 +327,17 @@ async def space_chosen(call: CallbackQuery, state: FSMContext) -> Optional[bool]
     return True
 
 
+@rate_limit(limit=2, calls=4)
+@answers_callback
 async def process_dialog_calendar(call: CallbackQuery, callback_data: CallbackData,
                                   state: FSMContext) -> Optional[bool]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use
     his name when recording log message. displays the date entered by the user
-    and records it as the dictionary value of the current state. Depending on
-    the selected location for viewing photos at the previous stage, the
-    corresponding functions are called that show photos of planets or space
+    (only the days with photos of the explored place are offered by the calendar)
+    and records it as the dictionary value of the current state (the photos found
+    for the previous date are forgotten). Depending on
+    the selected location for viewing photos at the previous stage, the search
+    of the photo of planets or space is put into the queue of background jobs
 
     :param: call: current callback
     :type: call: CallbackQuery
@@ -257,28 +351,26 @@ async def process_dialog_calendar(call: CallbackQuery, callback_data: CallbackDa
     """
     name: str = ctx_data.get()['user'].user_name
     logger.info(f'{name} is entering the date')
-    selected, date = await DialogCalendar().process_selection(call, callback_data)
+    current_data: Dict[str: Any] = await state.get_data()
+    available_days = partial(call.bot['availability'].month_days, current_data.get('explored_place'))
+    selected, date = await DialogCalendar(available_days=available_days).process_selection(
+        call, callback_data)
     selected: bool
     date: date
     if selected:
-        await call.message.edit_text(
-            f'Вы выбрали {date.strftime("%d-%m-%Y")}'
-        )
-        await state.update_data(calendar_date=date.strftime('%Y-%m-%d'))
-        current_data: Dict[str: Any] = await state.get_data()
-        if current_data['explored_place'] == 'Mars':
-            await show_mars_photo(message=call.message, state=state)
-        elif current_data['explored_place'] == 'Earth':
-            await show_earth_photo(message=call.message, state=state)
-        elif current_data['explored_place'] == 'Space':
-            await show_space_photo(message=call.message, state=state)
+        await state.update_data(calendar_date=date.strftime('%Y-%m-%d'),
+                                mars_photos=None, earth_photos=None)
+        await start_photo_search(call=call, place=current_data['explored_place'],
+                                 text=f'Вы выбрали {date.strftime("%d-%m-%Y")}')
     return True
 
 
+@rate_limit(limit=5, calls=2)
 async def more_mars_photo(call: CallbackQuery, state: FSMContext) -> Optional[bool]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use
     his name when recording log message. Informs the user that the exploration
-    of Mars is ongoing and calls the function to display its photo
+    of Mars is ongoing and puts the search of its photo into the queue of
+    background jobs
 
     :param: call: current callback
     :type: call: CallbackQuery
@@ -290,8 +382,7 @@ async def more_mars_photo(call: CallbackQuery, state: FSMContext) -> Optional[bo
     """
     name: str = ctx_data.get()['user'].user_name
     logger.info(f'{name} is continuing of Mars exploring')
-    await call.message.edit_text('Продолжаем исследовать Марс')
-    await show_mars_photo(message=call.message, state=state)
+    await start_photo_search(call=call, place='Mars', text='Продолжаем исследовать Марс')
     return True
 
 
@@ -311,11 +402,12 @@ async def no_more_mars_photo(call: CallbackQuery, state: FSMContext) -> Optional
     """
     name: str = ctx_data.get()['user'].user_name
     logger.info(f'{name} dont wont to explore Mars anymore')
-    await call.message.edit_text('В самом деле, Марс уже поднадоел)')
+    await close_photo_keyboard(message=call.message, text='В самом деле, Марс уже поднадоел)')
     await help_answer(message=call.message, state=state)
     return True
 
 
+@rate_limit(limit=5, calls=2)
 async def more_earth_photo(call: CallbackQuery, state: FSMContext) -> Optional[bool]:
     """Retrieves the necessary user from the database (via DataMiddleware) to use
     his name when recording log message. Processes a callback when the user
@@ -332,8 +424,7 @@ async def more_earth_photo(call: CallbackQuery, state: FSMContext) -> Optional[b
     """
     name: str = ctx_data.get()['user'].user_name
     logger.info(f'{name} is continuing of Earth exploring')
-    await call.message.edit_text('Продолжаем исследовать Землю')
-    await show_earth_photo(message=call.message, state=state)
+    await start_photo_search(call=call, place='Earth', text='Продолжаем исследовать Землю')
     return True
 
 
@@ -353,7 +444,7 @@ async def no_more_earth_photo(call: CallbackQuery, state: FSMContext) -> Optiona
     """
     name: str = ctx_data.get()['user'].user_name
     logger.info(f'{name} dont wont to explore Ears anymore')
-    await call.message.edit_text('В самом деле, Земля уже поднадоела)')
+    await close_photo_keyboard(message=call.message, text='В самом деле, Земля уже поднадоела)')
     await help_answer(message=call.message, state=state)
     return True
 
@@ -413,6 +504,7 @@ async def new_planet(call: CallbackQuery, state: FSMContext) -> bool:
     return True
 
 
+@rate_limit(limit=5)
 async def history(call: CallbackQuery) -> bool:
     """Retrieves the necessary user from the database (via DataMiddleware) to use
     his name when recording log message. Sets the dictionary value of the context
@@ -434,6 +526,30 @@ async def history(call: CallbackQuery) -> bool:
     return True
 
 
+@rate_limit(limit=3)
+async def next_history_page(call: CallbackQuery) -> bool:
+    """Retrieves the necessary user from the database (via DataMiddleware) to use
+    his name when recording log message. Handles a callback when the button
+    to look at the next photos of the history is pressed: removes the button and
+    records into the dictionary of contextual data the id of the last shown photo,
+    after which the next page is extracted from the database (via DataMiddleware)
+
+    :param: call: current callback
+    :type: call: CallbackQuery
+    :return: True, if the function is successfully executed or None if something
+    went wrong
+
+    """
+    name: str = ctx_data.get()['user'].user_name
+    logger.info(f'{name} looks at the next page of the history of space travel')
+    await call.message.edit_reply_markup()
+    data: Dict[str: Any] = ctx_data.get()
+    data['show_photo']: bool = True
+    data['history_after']: int = int(call.data.split(':')[1])
+    ctx_data.set(data)
+    return True
+
+
 async def finish_work(call: CallbackQuery, state: FSMContext) -> bool:
     """Retrieves the necessary user from the database (via DataMiddleware) to use
     his name when recording log message. Handles a callback when the button
@@ -454,7 +570,6 @@ async def finish_work(call: CallbackQuery, state: FSMContext) -> bool:
     await call.message.answer('Обращайтесь при любой необходимости)',
                               reply_markup=ReplyKeyboardRemove())
     await state.reset_state(with_data=True)
-    await call.answer()
     return True
 
 
@@ -562,6 +677,9 @@ def register_callbacks_handlers(dp: Dispatcher) -> None:
     dp.register_callback_query_handler(history,
                                        Text(equals='history'),
                                        state=Conditions.chose_place_keyboard)
+    dp.register_callback_query_handler(next_history_page,
+                                       Text(startswith='history_next:'),
+                                       state='*')
     dp.register_callback_query_handler(finish_work,
                                        Text(equals='finish_work'),
                                        state=Conditions.chose_place_keyboard)
@@ -1,7 +1,12 @@
 import emoji
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from tg_bot.keyboards.registry import prebuilt
 
+NEXT_HISTORY_PAGE = emoji.emojize('Следующие 9 :right_arrow:')
+
+
+@prebuilt
 def answer_about_trip() -> InlineKeyboardMarkup:
     """Displays buttons with the answer to the question, whether the user
      wants to travel to space
@@ -19,6 +24,7 @@ def answer_about_trip() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@prebuilt
 def rocket_button() -> InlineKeyboardMarkup:
     """Displays a keyboard with one button in the form of a rocket
     (flight readiness)
@@ -32,6 +38,7 @@ def rocket_button() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@prebuilt
 def show_commands() -> InlineKeyboardMarkup:
     """Displays buttons with available planets or space, photos of which can be viewed
 
@@ -56,6 +63,7 @@ def show_commands() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@prebuilt
 def show_more_mars_photo() -> InlineKeyboardMarkup:
     """It is displayed after each found photo of Mars and offers
      to continue exploring Mars or stop
@@ -73,6 +81,7 @@ def show_more_mars_photo() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@prebuilt
 def mars_photos_color() -> InlineKeyboardMarkup:
     """Offers to choose to view color or black-and-white photos of Mars
 
@@ -89,6 +98,7 @@ def mars_photos_color() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@prebuilt
 def show_more_earth_photo() -> InlineKeyboardMarkup:
     """It is displayed after each found photo of Earth and offers
      to continue exploring Earth or stop
@@ -106,6 +116,7 @@ def show_more_earth_photo() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@prebuilt
 def new_date_new_planet() -> InlineKeyboardMarkup:
     """It is displayed after no photos with the previously specified date have been
     found and offers to select a new date and continue viewing photos of the same planet
@@ -122,3 +133,18 @@ def new_date_new_planet() -> InlineKeyboardMarkup:
     ]
     keyboard = InlineKeyboardMarkup().add(*buttons)
     return keyboard
+
+
+def show_more_history(last_photo_id: int) -> InlineKeyboardMarkup:
+    """It is displayed after each page of the history of travels (if there are more
+    photos) and offers to look at the next 9 photos
+
+    :param: last_photo_id: id of the last photo of the shown page
+    :type: last_photo_id: integer
+    :return: keyboard with available button
+    :rtype: InlineKeyboardMarkup"""
+
+    keyboard = InlineKeyboardMarkup().add(
+        InlineKeyboardButton(text=NEXT_HISTORY_PAGE,
+                             callback_data=f'history_next:{last_photo_id}'))
+    return keyboard
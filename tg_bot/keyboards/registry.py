@@ -0,0 +1,52 @@
+import json
+from functools import lru_cache, update_wrapper
+from typing import Callable, Dict, Union
+
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup
+
+Keyboard = Union[InlineKeyboardMarkup, ReplyKeyboardMarkup]
+# functions returning the serialized constant keyboards (by the names of the keyboards)
+KEYBOARDS: Dict[str, Callable[[], str]] = dict()
+
+
+def serialize(keyboard: Keyboard) -> str:
+    """Serializes the keyboard for the Bot API (the serialized keyboard is sent by aiogram
+    as it is)
+
+    :param: keyboard: keyboard
+    :type: keyboard: Union[InlineKeyboardMarkup, ReplyKeyboardMarkup]
+    :return: serialized keyboard
+    :rtype: string
+
+    """
+    return json.dumps(keyboard.to_python(), ensure_ascii=False)
+
+
+def prebuilt(function: Callable[[], Keyboard]) -> Callable[[], str]:
+    """Decorates the function creating the constant keyboard and registers it: the keyboard
+    (with its emoji) is built and serialized only once, then the same serialized keyboard is
+    returned to each reply. The function creating the keyboard is kept as __wrapped__
+
+    :param: function: function creating the keyboard
+    :type: function: Callable[[], Union[InlineKeyboardMarkup, ReplyKeyboardMarkup]]
+    :return: function returning the serialized keyboard
+    :rtype: Callable[[], string]
+
+    """
+    @lru_cache(maxsize=None)
+    def keyboard() -> str:
+        return serialize(keyboard=function())
+
+    update_wrapper(keyboard, function, assigned=('__module__', '__name__', '__qualname__', '__doc__'))
+    KEYBOARDS[function.__name__] = keyboard
+    return keyboard
+
+
+def build_keyboards() -> None:
+    """Builds all registered keyboards in advance (at the start of the bot)
+
+    :return: None
+
+    """
+    for keyboard in KEYBOARDS.values():
+        keyboard()
@@ -1,7 +1,10 @@
 import emoji
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
+from tg_bot.keyboards.registry import prebuilt
 
+
+@prebuilt
 def menu_button() -> ReplyKeyboardMarkup:
     """Displays the menu button
 
@@ -0,0 +1,73 @@
+from typing import Optional
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.types import CallbackQuery
+from aiogram.utils.exceptions import BadRequest, InvalidQueryID
+
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+
+logger = get_logger(name=__name__)
+
+# key of the data of the callback, set when the callback has been answered
+CALLBACK_ANSWERED = 'callback_answered'
+
+
+async def answer_callback(call: CallbackQuery, cache_time: Optional[int] = None) -> None:
+    """Answers the callback; the callback that has waited for its turn longer than Telegram
+    accepts the answer can not be answered anymore, but it is still processed
+
+    :param: call: current callback
+    :type: call: CallbackQuery
+    :param: cache_time: how long (in seconds) the answer is cached by the client
+    :type: cache_time: Optional[integer]
+    :return: None
+
+    """
+    try:
+        await call.answer(cache_time=cache_time)
+    except (InvalidQueryID, BadRequest) as exception:
+        logger.debug(f'the callback "{call.data}" is not answered: {exception}')
+
+
+class CallbackAnswerMiddleware(BaseMiddleware):
+    """
+    Middleware answering every callback query: the callback is answered before its
+    handler is called (so the client stops showing the progress at once), except for the
+    handlers answering the callback themselves (marked by the answers_callback decorator).
+    The callbacks that have not reached any handler (the buttons of the old keyboards)
+    are answered after the processing
+    """
+    async def on_process_callback_query(self, call: CallbackQuery, data: dict) -> None:
+        """This handler is called when dispatcher receives a callback query which has
+        the handler
+
+        :param: call: current callback
+        :type: call: CallbackQuery
+        :param: data: data of current callback
+        :type: data: Dictionary
+        :return: None
+
+        """
+        if not getattr(current_handler.get(), 'answers_callback', False):
+            await answer_callback(call=call)
+        data[CALLBACK_ANSWERED] = True
+
+    async def on_post_process_callback_query(self, call: CallbackQuery, results: list,
+                                             data: dict) -> None:
+        """This handler is called after the processing of the callback query
+
+        :param: call: current callback
+        :type: call: CallbackQuery
+        :param: results: results of the handlers
+        :type: results: list
+        :param: data: data of current callback
+        :type: data: Dictionary
+        :return: None
+
+        """
+        if not data.get(CALLBACK_ANSWERED):
+            metrics.increment('callbacks.unhandled')
+            logger.info(f'the callback "{call.data}" has no handler in the current state')
+            await answer_callback(call=call)
@@ -1,30 +1,51 @@
 from sqlite3 import Row
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 from aiogram import types
 from aiogram.dispatcher.handler import ctx_data
 from aiogram.dispatcher.middlewares import BaseMiddleware
-from sqlalchemy import select
-from sqlalchemy.engine import ChunkedIteratorResult
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.ext.asyncio import AsyncResult, AsyncSession
 
+from tg_bot.keyboards.inline.inline_keyboards import show_more_history
 from tg_bot.models.db_tables import User, UserFavoritePhotos
+from tg_bot.services.cache.tiered_cache import TieredCache
+from tg_bot.services.jobs.history_writer import HistoryWriter
 from tg_bot.services.logger.my_logger import get_logger
 
 logger = get_logger(name=__name__)
 
+# the number of photos in one media group of the history
+HISTORY_PAGE_SIZE = 9
+
 
 class DataMiddleware(BaseMiddleware):
     """
     Middleware for adding information to the database and extracting it from it
     """
-    @staticmethod
-    async def setup_user(data: dict, user: types.User = None) -> None:
-        """Retrieves the user's name and ID from the received update; extracts the current
-        session from the contextual data dictionary; extracts (by the user id key) from the
-        database of the required user (or adds to the database if the user uses the bot for
-        the first time); adds the current user to the dictionary of contextual data for
-        subsequent use in a various places of the program
+    def __init__(self, users: TieredCache, history: HistoryWriter) -> None:
+        """constructor of the middleware class
+
+        :param: users: cache of the names of the users already recorded in the database
+        :type: users: TieredCache
+        :param: history: write-behind buffer of the viewed photos
+        :type: history: HistoryWriter
+        :return: None
+
+        """
+        super(DataMiddleware, self).__init__()
+        self.users = users
+        self.history = history
+
+    async def setup_user(self, data: dict, user: types.User = None) -> None:
+        """Retrieves the user's name and ID from the received update; checks the cache
+        of the users already recorded in the database. The database is touched only
+        when the user is seen for the first time (the user is added to the database
+        if he uses the bot for the first time) or when his name has changed; adds
+        the current user to the dictionary of contextual data for subsequent use
+        in a various places of the program
 
         :param: data: contextual data
         :type: data: dictionary
@@ -36,22 +57,39 @@ class DataMiddleware(BaseMiddleware):
         """
         user_id = int(user.id)
         user_name: str = user.full_name
-        session: AsyncSession = data['session']
-        async with session.begin():
-            if not (user := await session.get(User, user_id)):
-                session.add(user := User(user_id=user_id, user_name=user_name))
-            await session.flush()
+        cached_name: Optional[str] = await self.users.get(key=user_id)
+        if cached_name != user_name:
+            session: AsyncSession = data['session']
+            async with session.begin():
+                if cached_name is None:
+                    result: CursorResult = await session.execute(
+                        insert(User).values(user_id=user_id, user_name=user_name)
+                        .on_conflict_do_nothing(index_elements=[User.user_id])
+                    )
+                    renamed: bool = not result.rowcount
+                else:
+                    renamed = True
+                if renamed:
+                    await session.execute(
+                        update(User).where(User.user_id == user_id,
+                                           User.user_name != user_name)
+                        .values(user_name=user_name)
+                    )
+            await self.users.set(key=user_id, value=user_name)
 
-        data['user'] = user
+        data['user'] = User(user_id=user_id, user_name=user_name)
 
     @staticmethod
-    async def add_url_to_database() -> None:
+    async def add_url_to_database(history: HistoryWriter) -> None:
         """Retrieves the url of the viewed photo from the contextual data dictionary;
-        if the url is received, extracts the current user and session from the above
-        dictionary; extracts a photo with the current url from the database and if there
-        is no such, then adds it to the database (if the photo is found, then the duplicate
-        is not added)
-
+        if the url is received, extracts the current user and the description of the photo
+        (source, date, dimensions, caption, file_id) from the above dictionary and
+        puts the photo into the write-behind buffer (the user does not wait for the database;
+        if the user has already seen the photo, the unique index on the user and the hash
+        of the url prevents the duplicate from being added)
+
+        :param: history: write-behind buffer of the viewed photos
+        :type: history: HistoryWriter
         :return: None
 
         """
@@ -59,68 +97,73 @@ class DataMiddleware(BaseMiddleware):
         url: str = data.get('photo_url')
         if url:
             user: User = data['user']
-            session: AsyncSession = data['session']
-            async with session.begin():
-                url_exist: ChunkedIteratorResult = await session.execute(select(UserFavoritePhotos).where(
-                    UserFavoritePhotos.photo_url == url))
-                if not url_exist.all():
-                    session.add(UserFavoritePhotos(
-                        relation_user_id=user.user_id,
-                        photo_url=url)
-                    )
-                await session.flush()
+            history.add(user_id=user.user_id, url=url, metadata=data.get('photo_metadata'))
 
     @staticmethod
-    async def get_photo_from_database() -> None:
+    async def get_photo_from_database(history: HistoryWriter) -> None:
         """Retrieves a value from the contextual data dictionary indicating the need
-        to view previously displayed photos; if the above value is True, extracts
-        the current user and session from the contextual data dictionary, extracts
-        all photos from the database viewed by this user earlier and adds them to
-        the contextual data dictionary as a value. The photos will be viewed through
-        another method of the class
-
+        to view previously displayed photos; if the above value is True, writes the
+        buffer of the viewed photos to the database, extracts
+        the current user and the session for reading (the read replica, if it is used;
+        the primary database, if the photos of the user have just been written and the
+        replica may not have them yet) from the contextual data dictionary, extracts
+        the next page of photos viewed by this user earlier (the photos following the
+        last shown one, by the index on the user and the id of the photo) from the
+        server-side cursor and adds them to the contextual data dictionary as a value.
+        One photo more than the page is extracted to know whether there is the next page.
+        The photos will be viewed through another method of the class
+
+        :param: history: write-behind buffer of the viewed photos
+        :type: history: HistoryWriter
         :return: None
 
         """
         data: Dict[str: str] = ctx_data.get()
         viewing_photo: bool = data.get('show_photo')
         if viewing_photo:
+            await history.flush()
             user: User = data['user']
-            session: AsyncSession = data['session']
+            key: str = 'session' if history.written_recently(user_id=user.user_id) else 'read_session'
+            session: AsyncSession = data[key]
             async with session.begin():
-                result: ChunkedIteratorResult = await session.execute(
-                    select(UserFavoritePhotos).where(
-                        UserFavoritePhotos.relation_user_id == user.user_id)
+                result: AsyncResult = await session.stream(
+                    select(UserFavoritePhotos.id, UserFavoritePhotos.photo_url,
+                           UserFavoritePhotos.file_id, UserFavoritePhotos.caption)
+                    .where(UserFavoritePhotos.relation_user_id == user.user_id,
+                           UserFavoritePhotos.id > data.get('history_after', 0))
+                    .order_by(UserFavoritePhotos.id)
+                    .limit(HISTORY_PAGE_SIZE + 1)
                 )
-                data['all_photos'] = result
-                await session.flush()
+                data['all_photos'] = await result.fetchmany(HISTORY_PAGE_SIZE + 1)
+                await result.close()
 
     @staticmethod
     async def create_media_group(loaded_photos: List[Row], update: types.Update) -> None:
-        """displays the viewed photos as a media group
+        """displays the viewed photos as a media group (via the sender of albums, which
+        keeps the Telegram limits and reuses the file_id of the photos sent earlier). The
+        photos are sent by the file_id and with the captions recorded in the database
 
-        :param: loaded_photos: 9 first photos (not processed) extracted from the database
+        :param: loaded_photos: the page of photos (not processed) extracted from the database
         :type: loaded_photos: list with database rows
         :param: update: current update
         :type: update: Update
         :return: None
 
         """
-        photos_urls: List[Union[str]] = list(map(lambda x: x[0].photo_url, loaded_photos))
-        processed_photos: List[Union[types.InputMediaPhoto]] = [
-            types.InputMediaPhoto(url) for url in photos_urls
-        ]
+        photos_urls: List[Union[str]] = list(map(lambda x: x.photo_url, loaded_photos))
         await update.callback_query.message.answer('Вот, где мы успели побывать)')
-        await update.callback_query.bot.send_media_group(
+        await update.callback_query.bot['albums'].send(
             chat_id=update.callback_query.message.chat.id,
-            media=processed_photos)
+            urls=photos_urls,
+            file_ids=[photo.file_id for photo in loaded_photos],
+            captions=[photo.caption for photo in loaded_photos])
 
 
     @staticmethod
     async def show_photos(update: types.Update) -> None:
-        """Extracts all the photos viewed by the user (ChunkedIteratorResult) from the
-        dictionary of contextual data; until the above iterator is exhausted, it takes
-        9 photos from it and displays them as a media group using the special method
+        """Extracts the page of the photos viewed by the user from the dictionary
+        of contextual data and displays it as a media group using the special method.
+        If there are more photos, offers to look at the next page
 
         :param: update: current update
         :type: update: Update
@@ -128,15 +171,18 @@ class DataMiddleware(BaseMiddleware):
 
         """
         data: Dict[str: str] = ctx_data.get()
-        photos: ChunkedIteratorResult = data.get('all_photos')
-        if photos and update.callback_query:
-            while True:
-                loaded_photos: List[Row] = photos.fetchmany(9)
-                if not loaded_photos:
-                    await update.callback_query.message.answer('Упс, кажется фотографии закончились)')
-                    break
+        photos: Optional[List[Row]] = data.get('all_photos')
+        if photos is not None and update.callback_query:
+            loaded_photos: List[Row] = photos[:HISTORY_PAGE_SIZE]
+            if loaded_photos:
                 await DataMiddleware.create_media_group(loaded_photos=loaded_photos,
                                                         update=update)
+            if len(photos) > HISTORY_PAGE_SIZE:
+                await update.callback_query.message.answer(
+                    'Посмотрим, где еще мы побывали?',
+                    reply_markup=show_more_history(last_photo_id=loaded_photos[-1].id))
+            else:
+                await update.callback_query.message.answer('Упс, кажется фотографии закончились)')
 
 
 
@@ -178,7 +224,7 @@ class DataMiddleware(BaseMiddleware):
         :return: None
 
         """
-        await self.add_url_to_database()
+        await self.add_url_to_database(history=self.history)
 
     async def on_post_process_update(self, update: types.Update, *args) -> None:
         """when the callback query is processed, using the special methods, retrieves viewed
@@ -191,5 +237,5 @@ class DataMiddleware(BaseMiddleware):
         :return: None
 
         """
-        await self.get_photo_from_database()
+        await self.get_photo_from_database(history=self.history)
         await self.show_photos(update=update)
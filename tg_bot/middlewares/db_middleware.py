@@ -1,36 +1,95 @@
+from typing import Any, Optional
+
 from aiogram.dispatcher.middlewares import LifetimeControllerMiddleware
 from aiogram.types.base import TelegramObject
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
 
 logger = get_logger(name=__name__)
 
 
+class LazySession:
+    """
+    Proxy of the session: the session is taken from the pool only when it is used
+    for the first time, so the updates that do not need the database do not take it
+    """
+    def __init__(self, pool: sessionmaker) -> None:
+        """constructor of the proxy class
+
+        :param: pool: current pool of database connections
+        :type: pool: sessionmaker
+        :return: None
+
+        """
+        self._pool = pool
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def used(self) -> bool:
+        """Whether the session has been taken from the pool
+
+        :return: True, if the session was used, else False
+        :rtype: bool
+
+        """
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        """Takes the session from the pool (at the first use) and returns its attribute
+
+        :param: name: name of the attribute of the session
+        :type: name: string
+        :return: the attribute of the session
+        :rtype: Any
+
+        """
+        if self._session is None:
+            self._session = self._pool()
+            metrics.increment('db.sessions_used')
+        return getattr(self._session, name)
+
+    async def close(self) -> None:
+        """Closes the session (if it was taken from the pool)
+
+        :return: None
+
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
 class DbMiddleware(LifetimeControllerMiddleware):
     """
-    Middleware to get the session (from the database connection pool) at all stages
-    of the bot's operation
+    Middleware to get the sessions (from the database connection pools) at all stages
+    of the bot's operation: the session for writing (to the primary database) and the
+    session for the read-only queries (to the read replica, if it is used)
     """
     skip_patterns = ['error', 'update']
 
-    def __init__(self, pool: sessionmaker) -> None:
+    def __init__(self, pool: sessionmaker, read_pool: sessionmaker) -> None:
         """constructor of the middleware class
 
         :param: pool: current pool of database connections
         :type: time_limit: sessionmaker
+        :param: read_pool: pool of connections for the read-only queries
+        :type: read_pool: sessionmaker
         :return: None
 
         """
         super(DbMiddleware, self).__init__()
         self.pool = pool
+        self.read_pool = read_pool
 
 
     async def pre_process(self, obj: TelegramObject, data: dict, *args) -> None:
-        """when a message was received, gets a current session from the pool of database
-        connections (from a class attribute),  and assigns it as a dictionary value for
-        contextual data (for later access to it in the necessary places)
+        """when a message was received, creates lazy sessions for writing and for reading
+        (they are taken from the pools of database connections only at the first use) and
+        assigns them as dictionary values for contextual data (for later access to them
+        in the necessary places)
 
          :param: obj: received object
          :type: obj: TelegramObject
@@ -41,11 +100,13 @@ class DbMiddleware(LifetimeControllerMiddleware):
          :return: None
 
          """
-        session = self.pool()
-        data['session']: Session = session
+        metrics.increment('db.updates')
+        data['session']: LazySession = LazySession(pool=self.pool)
+        data['read_session']: LazySession = LazySession(pool=self.read_pool)
 
     async def post_process(self, obj: TelegramObject, data: dict, *args) -> None:
-        """retrieves the current session (from the context data dictionary) and closes it
+        """retrieves the current sessions (from the context data dictionary) and closes them
+        (if they were used)
 
          :param: obj: received object
          :type: obj: TelegramObject
@@ -56,5 +117,6 @@ class DbMiddleware(LifetimeControllerMiddleware):
          :return: None
 
          """
-        if session := data.get('session', None):
-            await session.close()
\ No newline at end of file
+        for key in ('session', 'read_session'):
+            if session := data.get(key, None):
+                await session.close()
\ No newline at end of file
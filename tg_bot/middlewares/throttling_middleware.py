@@ -1,13 +1,16 @@
-import asyncio
+from typing import Tuple
 
-from aiogram import Dispatcher
 from aiogram.dispatcher import DEFAULT_RATE_LIMIT
 from aiogram.dispatcher.handler import CancelHandler, current_handler
 from aiogram.dispatcher.middlewares import BaseMiddleware
-from aiogram.types import Message
-from aiogram.utils.exceptions import Throttled
+from aiogram.types import CallbackQuery, Message
+from aiogram.utils.exceptions import BadRequest, InvalidQueryID
 
+from tg_bot.middlewares.callback_answer_middleware import CALLBACK_ANSWERED
 from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+from tg_bot.services.throttling.notifier import UnlockNotifier
+from tg_bot.services.throttling.sliding_window import SlidingWindow, Verdict
 from aiogram.dispatcher.handler import ctx_data
 
 logger = get_logger(name=__name__)
@@ -16,22 +19,72 @@ logger = get_logger(name=__name__)
 
 class ThrottlingMiddleware(BaseMiddleware):
     """
-    Middleware for throttling clicks on the inline keyboard (menu button)
+    Middleware for throttling messages and clicks on the inline keyboards (menu button,
+    calendar, continuation of the exploring, history) with the sliding window of each
+    handler for each user
     """
-    def __init__(self, time_limit=DEFAULT_RATE_LIMIT, key_prefix='antiflood_') -> None:
+    def __init__(self, limiter: SlidingWindow, notifier: UnlockNotifier,
+                 time_limit=DEFAULT_RATE_LIMIT, key_prefix='antiflood_') -> None:
         """constructor of the middleware class
 
+        :param: limiter: limiter of the calls with the sliding window
+        :type: limiter: SlidingWindow
+        :param: notifier: delayed queue of the notifications about the end of the block
+        :type: notifier: UnlockNotifier
         :param: time_limit: current time limit of current handler (set by default)
-        :type: time_limit: integer
+        :type: time_limit: float
         :param: key_prefix: prefix of name of current hanller
         :type: key_prefix: string
         :return: None
 
         """
+        self.limiter = limiter
+        self.notifier = notifier
         self.rate_limit = time_limit
         self.prefix = key_prefix
         super(ThrottlingMiddleware, self).__init__()
 
+    def handler_limit(self, kind: str) -> Tuple[str, float, int]:
+        """Gets the key, the time limit and the number of allowed calls of current handler
+        (set by the rate_limit decorator or by default)
+
+        :param: kind: kind of the update (message or callback query)
+        :type: kind: string
+        :return: key, time limit and number of calls
+        :rtype: Tuple[string, float, integer]
+
+        """
+        # gets current handler
+        handler = current_handler.get()
+        # If handler was configured, get rate limit and key from handler
+        if handler:
+            return (getattr(handler, 'throttling_key', f"{self.prefix}_{handler.__name__}"),
+                    getattr(handler, 'throttling_rate_limit', self.rate_limit),
+                    getattr(handler, 'throttling_calls', 1))
+        return f"{self.prefix}_{kind}", self.rate_limit, 1
+
+    async def throttle(self, kind: str, user_id: int, chat_id: int) -> Tuple[str, Verdict]:
+        """Checks the sliding window of current handler for the user
+
+        :param: kind: kind of the update (message or callback query)
+        :type: kind: string
+        :param: user_id: id of the user
+        :type: user_id: integer
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :return: key of the window and result of the check
+        :rtype: Tuple[string, Verdict]
+
+        """
+        key, limit, calls = self.handler_limit(kind=kind)
+        key = f'{key}:{chat_id}:{user_id}'
+        verdict: Verdict = await self.limiter.hit(key=key, period=limit, calls=calls)
+        if not verdict.allowed:
+            metrics.increment(f'throttling.{kind}')
+            name: str = ctx_data.get()['user'].user_name
+            logger.info(f'{name} have pushed the button many times')
+        return key, verdict
+
     async def on_process_message(self, message: Message, data: dict) -> None:
         """This handler is called when dispatcher receives a message
 
@@ -42,55 +95,59 @@ class ThrottlingMiddleware(BaseMiddleware):
         :return: None
 
         """
-        # gets current handler
-        handler = current_handler.get()
-        # gets current dispatcher from context
-        dispatcher = Dispatcher.get_current()
-        # If handler was configured, get rate limit and key from handler
-        if handler:
-            limit = getattr(handler, 'throttling_rate_limit', self.rate_limit)
-            key = getattr(handler, 'throttling_key', f"{self.prefix}_{handler.__name__}")
-        else:
-            limit = self.rate_limit
-            key = f"{self.prefix}_message"
-
-        # Use Dispatcher.throttle method.
-        try:
-            await dispatcher.throttle(key, rate=limit)
-        except Throttled as t:  # if current handler was throttled
-            name: str = ctx_data.get()['user'].user_name
-            logger.info(f'{name} have pushed the menu button many times')
+        key, verdict = await self.throttle(kind='message', user_id=message.from_user.id,
+                                           chat_id=message.chat.id)
+        if not verdict.allowed:  # if current handler was throttled
             # Execute action
-            await self.message_throttled(message=message, throttled=t, dp=dispatcher, key=key)
+            await self.message_throttled(message=message, verdict=verdict, key=key)
             # Cancel current handler
             raise CancelHandler()
 
-    @staticmethod
-    async def message_throttled(message: Message, throttled: Throttled,
-                                dp: Dispatcher, key: str) -> None:
-        """Notify user only on first exceed and notify about unlocking only on last exceed
+    async def on_process_callback_query(self, call: CallbackQuery, data: dict) -> None:
+        """This handler is called when dispatcher receives a callback query. The throttled
+        callback is answered at once (the user is warned only on the first exceeds)
+
+        :param: call: current callback
+        :type: call: CallbackQuery
+        :param: data: data of current callback
+        :type: data: Dictionary
+        :return: None
+
+        """
+        chat_id: int = call.message.chat.id if call.message else call.from_user.id
+        key, verdict = await self.throttle(kind='callback_query', user_id=call.from_user.id,
+                                           chat_id=chat_id)
+        if not verdict.allowed:
+            try:
+                if verdict.exceeded <= 2:
+                    await call.answer('Не стоит так часто жать на кнопку,\n'
+                                      'я вас понял с первого раза)')
+                else:
+                    await call.answer()
+            except (InvalidQueryID, BadRequest) as exception:
+                logger.debug(f'the throttled callback "{call.data}" is not answered: {exception}')
+            data[CALLBACK_ANSWERED] = True
+            raise CancelHandler()
+
+    async def message_throttled(self, message: Message, verdict: Verdict, key: str) -> None:
+        """Notify user only on first exceed and notify about unlocking only on last exceed.
+        The notification about unlocking is scheduled in the delayed queue, so the processing
+        of the throttled message ends at once
 
         :param: message: current message
         :type: message: Message
-        :param: throttled: an exception that occurred when the keyboard pressing limit was exceeded
-        :type: throttled: Throttled (inherits from TelegramAPIError)
-        :param: dp: current dispatcher:
-        :type: dp: Dispatcher
+        :param: verdict: result of the check of the sliding window
+        :type: verdict: Verdict
         :param: key: specific key for a throttling
         :type: key: string
         :return: None
 
         """
-        # Calculate how much time is left till the block ends
-        delta = throttled.rate - throttled.delta
         # Prevent flooding
-        if throttled.exceeded_count <= 2:
+        if verdict.exceeded <= 2:
             await message.reply('Не стоит так часто жать на кнопку,\n'
                                 'я вас понял с первого раза)')
-        # Sleep.
-        await asyncio.sleep(delta)
-        # Check lock status
-        thr = await dp.check_key(key)
-        # If current message is not last with current key - do not send message
-        if thr.exceeded_count == throttled.exceeded_count:
-            await message.reply('Ладно, можете продолжать)')
+        # Schedule the notification for the end of the block (it replaces the notification
+        # of the previous message with current key)
+        self.notifier.schedule(key=key, delay=verdict.retry_after, chat_id=message.chat.id,
+                               message_id=message.message_id, exceeded=verdict.exceeded)
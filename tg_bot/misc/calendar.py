@@ -1,14 +1,170 @@
 import calendar
+import json
 from datetime import datetime
-from typing import Optional, Tuple
+from functools import lru_cache
+from typing import Callable, FrozenSet, Optional, Tuple
 
 from aiogram.types import CallbackQuery
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.callback_data import CallbackData
+from aiogram.utils.exceptions import MessageNotModified
+
+from tg_bot.keyboards.registry import serialize
+from tg_bot.middlewares.callback_answer_middleware import answer_callback
+from tg_bot.services.metrics.registry import metrics
 
 # setting callback_data prefix and parts
 calendar_callback = CallbackData('dialog_calendar', 'act', 'year', 'month', 'day')
 ignore_callback = calendar_callback.new('IGNORE', -1, -1, -1)  # for buttons with no answer
+MONTHS = ['Январь', 'Февраль', 'Март',
+          'Апрель', 'Май', 'Июнь',
+          'Июль', 'Август', 'Сентябрь',
+          'Октябрь', 'Ноябрь', 'Декабрь']
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+EMPTY_DAY = '·'  # the day without photos
+# views of the calendar
+YEARS_VIEW = 'years'
+MONTHS_VIEW = 'months'
+DAYS_VIEW = 'days'
+
+
+def _years_keyboard(year: int) -> InlineKeyboardMarkup:
+    """Creates a part of the calendar that displays variants of possible years
+
+    :param: year: current year
+    :type: year: integer
+    :return: keyboard with the variants of possible years
+    :rtype: InlineKeyboardMarkup
+
+    """
+    inline_keyboard = InlineKeyboardMarkup(row_width=5)
+    # first row - years
+    inline_keyboard.row()
+    for value in range(year - 2, year + 1):
+        inline_keyboard.insert(InlineKeyboardButton(
+            str(value),
+            callback_data=calendar_callback.new(act='SET-YEAR', year=value,
+                                                month=-1, day=-1)
+        ))
+    # nav buttons
+    inline_keyboard.row()
+    inline_keyboard.insert(InlineKeyboardButton(
+        "⬅️",
+        callback_data=calendar_callback.new(act='PREV-YEARS', year=year,
+                                            month=-1, day=-1)
+    ))
+    inline_keyboard.insert(InlineKeyboardButton(
+        "➡️",
+        callback_data=calendar_callback.new(act='NEXT-YEARS', year=year,
+                                            month=-1, day=-1)
+    ))
+    return inline_keyboard
+
+
+def _months_keyboard(year: int) -> InlineKeyboardMarkup:
+    """Creates a part of the calendar that displays possible months
+
+    :param: year: current year
+    :type: year: integer
+    :return: keyboard with the variants of possible months
+    :rtype: InlineKeyboardMarkup
+
+    """
+    inline_keyboard = InlineKeyboardMarkup(row_width=6)
+    # first row with year button
+    inline_keyboard.row()
+    inline_keyboard.insert(InlineKeyboardButton(' ', callback_data=ignore_callback))
+    inline_keyboard.insert(InlineKeyboardButton(
+        str(year),
+        callback_data=calendar_callback.new('START', year, -1, -1)
+    ))
+    inline_keyboard.insert(InlineKeyboardButton(' ', callback_data=ignore_callback))
+    # two rows with 6 months buttons
+    for number, month in enumerate(MONTHS, start=1):
+        if number % 6 == 1:
+            inline_keyboard.row()
+        inline_keyboard.insert(InlineKeyboardButton(
+            month,
+            callback_data=calendar_callback.new(act='SET-MONTH', year=year,
+                                                month=number, day=-1)
+        ))
+    return inline_keyboard
+
+
+def _days_keyboard(year: int, month: int, available: Optional[FrozenSet[int]]) -> InlineKeyboardMarkup:
+    """Creates a part of the calendar that displays possible days (the days without
+    photos are shown as the buttons with no answer)
+
+    :param: year: current year
+    :type: year: integer
+    :param: month: current month
+    :type: month: integer
+    :param: available: the days with photos (None - all days)
+    :type: available: Optional[FrozenSet[integer]]
+    :return: keyboard with the variants of possible days
+    :rtype: InlineKeyboardMarkup
+
+    """
+    inline_keyboard = InlineKeyboardMarkup(row_width=7)
+    inline_keyboard.row()
+    inline_keyboard.insert(InlineKeyboardButton(
+        str(year),
+        callback_data=calendar_callback.new(act='START', year=year,
+                                            month=-1, day=-1)
+    ))
+    inline_keyboard.insert(InlineKeyboardButton(
+        MONTHS[month - 1],
+        callback_data=calendar_callback.new(act='SET-YEAR', year=year,
+                                            month=-1, day=-1)
+    ))
+    inline_keyboard.row()
+    for day in WEEKDAYS:
+        inline_keyboard.insert(InlineKeyboardButton(day, callback_data=ignore_callback))
+
+    month_calendar = calendar.monthcalendar(year, month)
+    for week in month_calendar:
+        inline_keyboard.row()
+        for day in week:
+            if day == 0:
+                inline_keyboard.insert(InlineKeyboardButton(' ', callback_data=ignore_callback))
+                continue
+            if available is not None and day not in available:
+                inline_keyboard.insert(InlineKeyboardButton(EMPTY_DAY, callback_data=ignore_callback))
+                continue
+            inline_keyboard.insert(InlineKeyboardButton(
+                str(day), callback_data=calendar_callback.new(act='SET-DAY', year=year,
+                                                              month=month, day=day)
+            ))
+    return inline_keyboard
+
+
+@lru_cache(maxsize=512)
+def calendar_keyboard(view: str, year: int, month: int = -1,
+                      available: Optional[FrozenSet[int]] = None) -> str:
+    """Builds the keyboard of the view of the calendar and serializes it for the Bot API.
+    The keyboards depend only on the view, the year, the month and the days with photos,
+    so each of them is built once and then is taken from the LRU cache (the serialized
+    keyboard is sent by aiogram as it is)
+
+    :param: view: view of the calendar (years, months or days)
+    :type: view: string
+    :param: year: current year
+    :type: year: integer
+    :param: month: current month (only for the view of the days)
+    :type: month: integer
+    :param: available: the days of the month with photos (None - all days)
+    :type: available: Optional[FrozenSet[integer]]
+    :return: serialized keyboard
+    :rtype: string
+
+    """
+    if view == YEARS_VIEW:
+        inline_keyboard: InlineKeyboardMarkup = _years_keyboard(year=year)
+    elif view == MONTHS_VIEW:
+        inline_keyboard = _months_keyboard(year=year)
+    else:
+        inline_keyboard = _days_keyboard(year=year, month=month, available=available)
+    return serialize(keyboard=inline_keyboard)
 
 
 class DialogCalendar:
@@ -20,140 +176,97 @@ class DialogCalendar:
     :type: year: integer
     :param: month: current month
     :type: month: integer
+    :param: available_days: function returning the days of the month with photos
+    :type: available_days: Optional[Callable[[integer, integer], Optional[FrozenSet[integer]]]]
 
     """
-    months = ['Январь', 'Февраль', 'Март',
-              'Апрель', 'Май', 'Июнь',
-              'Июль', 'Август', 'Сентябрь',
-              'Октябрь', 'Ноябрь', 'Декабрь']
+    months = MONTHS
 
     def __init__(self, year: int = datetime.now().year,
-                 month: int = datetime.now().month):
+                 month: int = datetime.now().month,
+                 available_days: Optional[Callable[[int, int], Optional[FrozenSet[int]]]] = None):
         """constructor of the calendar class
 
         :param: year: current year
         :type: year: integer
         :param: month: current month
         :type: moth: integer
+        :param: available_days: function returning the days of the month with photos
+        (None, if they are unknown), all days are offered without it
+        :type: available_days: Optional[Callable[[integer, integer], Optional[FrozenSet[integer]]]]
 
         """
         self.year = year
         self.month = month
+        self.available_days = available_days
 
 
     @staticmethod
-    async def start_calendar(year: int = datetime.now().year) -> InlineKeyboardMarkup:
-        """Creates a part of the calendar that displays variants of possible years
+    async def start_calendar(year: int = datetime.now().year) -> str:
+        """Returns a part of the calendar that displays variants of possible years
 
         :param: year: current year
         :type: year: integer
-        :return: keyboard with the variants of possible years
-        :rtype: InlineKeyboardMarkup
+        :return: serialized keyboard with the variants of possible years
+        :rtype: string
 
         """
-        inline_keyboard = InlineKeyboardMarkup(row_width=5)
-        # first row - years
-        inline_keyboard.row()
-        for value in range(year - 2, year + 1):
-            inline_keyboard.insert(InlineKeyboardButton(
-                str(value),
-                callback_data=calendar_callback.new(act='SET-YEAR', year=value,
-                                                    month=-1, day=-1)
-            ))
-        # nav buttons
-        inline_keyboard.row()
-        inline_keyboard.insert(InlineKeyboardButton(
-            "⬅️",
-            callback_data=calendar_callback.new(act='PREV-YEARS', year=year,
-                                                month=-1, day=-1)
-        ))
-        inline_keyboard.insert(InlineKeyboardButton(
-            "➡️",
-            callback_data=calendar_callback.new(act='NEXT-YEARS', year=year,
-                                                month=-1, day=-1)
-        ))
-        return inline_keyboard
+        return calendar_keyboard(view=YEARS_VIEW, year=year)
 
-    async def _get_month_keyboard(self, year: int) -> InlineKeyboardMarkup:
-        """Creates a part of the calendar that displays possible months
+    async def _get_month_keyboard(self, year: int) -> str:
+        """Returns a part of the calendar that displays possible months
 
         :param: year: current year
         :type: year: integer
-        :return: keyboard with the variants of possible months
-        :rtype: InlineKeyboardMarkup
+        :return: serialized keyboard with the variants of possible months
+        :rtype: string
 
         """
-        inline_keyboard = InlineKeyboardMarkup(row_width=6)
-        # first row with year button
-        inline_keyboard.row()
-        inline_keyboard.insert(InlineKeyboardButton(' ', callback_data=ignore_callback))
-        inline_keyboard.insert(InlineKeyboardButton(
-            str(year),
-            callback_data=calendar_callback.new('START', year, -1, -1)
-        ))
-        inline_keyboard.insert(InlineKeyboardButton(' ', callback_data=ignore_callback))
-        # two rows with 6 months buttons
-        inline_keyboard.row()
-        for month in self.months[0:6]:
-            inline_keyboard.insert(InlineKeyboardButton(
-                month,
-                callback_data=calendar_callback.new(act='SET-MONTH', year=year,
-                                                    month=self.months.index(month) + 1, day=-1)
-            ))
-        inline_keyboard.row()
-        for month in self.months[6:12]:
-            inline_keyboard.insert(InlineKeyboardButton(
-                month,
-                callback_data=calendar_callback.new(act='SET-MONTH', year=year,
-                                                    month=self.months.index(month) + 1, day=-1)
-            ))
-        return inline_keyboard
+        return calendar_keyboard(view=MONTHS_VIEW, year=year)
 
-    async def _get_days_keyboard(self, year: int, month: int) -> InlineKeyboardMarkup:
-        """Creates a part of the calendar that displays possible days
+    async def _get_days_keyboard(self, year: int, month: int) -> str:
+        """Returns a part of the calendar that displays possible days (only the days
+        with photos can be chosen)
 
         :param: year: current year
         :type: year: integer
         :param: month: current month
         :type: month: integer
-        :return: keyboard with the variants of possible days
-        :rtype: InlineKeyboardMarkup
+        :return: serialized keyboard with the variants of possible days
+        :rtype: string
 
         """
-        inline_keyboard = InlineKeyboardMarkup(row_width=7)
-        inline_keyboard.row()
-        inline_keyboard.insert(InlineKeyboardButton(
-            str(year),
-            callback_data=calendar_callback.new(act='START', year=year,
-                                                month=-1, day=-1)
-        ))
-        inline_keyboard.insert(InlineKeyboardButton(
-            self.months[month - 1],
-            callback_data=calendar_callback.new(act='SET-YEAR', year=year,
-                                                month=-1, day=-1)
-        ))
-        inline_keyboard.row()
-        for day in ['Пн', 'Вт', 'Ср',
-                    'Чт', 'Пт', 'Сб',
-                    'Вс']:
-            inline_keyboard.insert(InlineKeyboardButton(day, callback_data=ignore_callback))
+        available: Optional[FrozenSet[int]] = (self.available_days(year, month)
+                                               if self.available_days else None)
+        return calendar_keyboard(view=DAYS_VIEW, year=year, month=month, available=available)
 
-        month_calendar = calendar.monthcalendar(year, month)
-        for week in month_calendar:
-            inline_keyboard.row()
-            for day in week:
-                if day == 0:
-                    inline_keyboard.insert(InlineKeyboardButton(' ', callback_data=ignore_callback))
-                    continue
-                inline_keyboard.insert(InlineKeyboardButton(
-                    str(day), callback_data=calendar_callback.new(act='SET-DAY', year=year,
-                                                                  month=month, day=day)
-                ))
-        return inline_keyboard
+    @staticmethod
+    async def _edit_keyboard(query: CallbackQuery, keyboard: str) -> None:
+        """Replaces the keyboard of the message with the pressed button, if the new
+        keyboard differs from the current one (the same keyboard is not sent to the Bot API)
+
+        :param: query: current callback
+        :type: query: aiogram.types.CallbackQuery
+        :param: keyboard: serialized new keyboard
+        :type: keyboard: string
+        :return: None
+
+        """
+        current: Optional[InlineKeyboardMarkup] = query.message.reply_markup
+        if current is not None and current.to_python() == json.loads(keyboard):
+            metrics.increment('calendar.skipped_edits')
+            return
+        try:
+            await query.message.edit_reply_markup(keyboard)
+        except MessageNotModified:  # the keyboard was replaced by the previous press
+            metrics.increment('calendar.skipped_edits')
 
     async def process_selection(self, query: CallbackQuery,
                                 data: CallbackData) -> Tuple[bool, Optional[datetime.date]]:
-        """Handles callbacks of pressed calendar buttons
+        """Handles callbacks of pressed calendar buttons. Each callback is answered at once
+        (the answers to the buttons with no answer are cached by the client); the callback
+        that can not be answered anymore is processed all the same
+
         :param: query: current callback
         :type: query: aiogram.types.CallbackQuery
         :param: data: it collects the current data of pushed buttons (year, month, day)
@@ -165,20 +278,22 @@ class DialogCalendar:
         """
         return_data = (False, None)
         if data['act'] == "IGNORE":
-            await query.answer(cache_time=60)
+            await answer_callback(call=query, cache_time=60)
+        else:
+            await answer_callback(call=query)
         if data['act'] == "SET-YEAR":
-            await query.message.edit_reply_markup(await self._get_month_keyboard(int(data['year'])))
+            await self._edit_keyboard(query, await self._get_month_keyboard(int(data['year'])))
         if data['act'] == "PREV-YEARS":
             new_year = int(data['year']) - 5
-            await query.message.edit_reply_markup(await self.start_calendar(new_year))
+            await self._edit_keyboard(query, await self.start_calendar(new_year))
         if data['act'] == "NEXT-YEARS":
             new_year = int(data['year']) + 5
-            await query.message.edit_reply_markup(await self.start_calendar(new_year))
+            await self._edit_keyboard(query, await self.start_calendar(new_year))
         if data['act'] == "START":
-            await query.message.edit_reply_markup(await self.start_calendar(int(data['year'])))
+            await self._edit_keyboard(query, await self.start_calendar(int(data['year'])))
         if data['act'] == "SET-MONTH":
-            await query.message.edit_reply_markup(await self._get_days_keyboard(int(data['year']),
-                                                                                int(data['month'])))
+            await self._edit_keyboard(query, await self._get_days_keyboard(int(data['year']),
+                                                                           int(data['month'])))
         if data['act'] == "SET-DAY":
             await query.message.delete_reply_markup()   # removing inline keyboard
             return_data = True, datetime(int(data['year']), int(data['month']), int(data['day']))
@@ -0,0 +1,16 @@
+from typing import Callable, Any
+
+
+def answers_callback(function: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorates the handler of callback queries, which answers the callback itself
+    (for example, with the text or the cache time), so the callback is not answered
+    in advance by CallbackAnswerMiddleware
+
+    :param: function: handler of callback queries
+    :type: function: Callable[..., Any]
+    :return: called function
+    :rtype: Callable[..., Any]
+
+    """
+    setattr(function, 'answers_callback', True)
+    return function
@@ -1,20 +1,25 @@
 from typing import Callable, Any
 
 
-def rate_limit(limit: int, key=None) -> Callable[[Any], Any]:
-    """Decorates function, sets the time limit or special key as the dictionary
-    values of the name space of the object of the called function
+def rate_limit(limit: float, key=None, calls: int = 1) -> Callable[[Any], Any]:
+    """Decorates function, sets the time limit, the number of calls allowed during
+    this time or special key as the dictionary values of the name space of the object
+    of the called function (the handlers of messages and callback queries are throttled
+    in the same way)
 
     :param: limit: time limit for calling the throttled function
-    :type: limit: integer
+    :type: limit: float
     :param: key: key for more specific throttling of the calling function
     :type: key: None
+    :param: calls: the number of calls allowed during the time limit
+    :type: calls: integer
     :return: called function
     :rtype: Callable[[Any], Any]
 
     """
     def decorator(function):
         setattr(function, 'throttling_rate_limit', limit)
+        setattr(function, 'throttling_calls', calls)
         if key:
             setattr(function, 'throttling_key', key)
         return function
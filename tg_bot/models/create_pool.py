@@ -1,39 +1,248 @@
+import logging
+import time
+from typing import Dict, Optional, Type
+
+from sqlalchemy import event, text
 from sqlalchemy.engine import make_url
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from tg_bot.config import Config
 from tg_bot.models.db_tables import Base
 from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
 
 logger = get_logger(name=__name__)
 
+# checks whether the unique index of the history exists (Postgres)
+UNIQUE_INDEX_QUERY = ("SELECT 1 FROM pg_indexes WHERE tablename = 'user_photos' "
+                      "AND indexname = 'ix_user_photos_user_url_hash'")
 
-async def create_pool(config: Config) -> sessionmaker:
+# adds the hashes of the urls to the history created by the previous versions of the bot,
+# removes the repeated photos and creates the unique index (Postgres, only once: while
+# the unique index does not exist)
+UNIQUE_INDEX_STATEMENTS = (
+    'ALTER TABLE user_photos ADD COLUMN IF NOT EXISTS photo_url_hash VARCHAR(32)',
+    'UPDATE user_photos SET photo_url_hash = md5(photo_url) WHERE photo_url_hash IS NULL',
+    'DELETE FROM user_photos AS duplicate USING user_photos AS original '
+    'WHERE duplicate.relation_user_id = original.relation_user_id '
+    'AND duplicate.photo_url_hash = original.photo_url_hash AND duplicate.id > original.id',
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_user_photos_user_url_hash '
+    'ON user_photos (relation_user_id, photo_url_hash)',
+)
+
+# brings the tables created by the previous versions of the bot up to date (Postgres)
+UPGRADE_STATEMENTS = (
+    'CREATE INDEX IF NOT EXISTS ix_user_photos_user_id ON user_photos (relation_user_id, id)',
+    'ALTER TABLE user_photos ADD COLUMN IF NOT EXISTS source VARCHAR(16)',
+    'ALTER TABLE user_photos ADD COLUMN IF NOT EXISTS photo_date DATE',
+    'ALTER TABLE user_photos ADD COLUMN IF NOT EXISTS width INTEGER',
+    'ALTER TABLE user_photos ADD COLUMN IF NOT EXISTS height INTEGER',
+    'ALTER TABLE user_photos ADD COLUMN IF NOT EXISTS caption VARCHAR',
+    'ALTER TABLE user_photos ADD COLUMN IF NOT EXISTS file_id VARCHAR',
+)
+
+# settings of each connection to SQLite: the write-ahead log (readers do not block
+# the writer), no fsync on each commit, waiting for the lock instead of the error,
+# bigger cache of pages and temporary tables in memory
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA foreign_keys=ON',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Pool of connections which measures how long the connection is waited for
+    """
+    # prefix of the names of the metrics of the pool
+    metric = 'db.pool'
+
+    def _do_get(self):
+        """Gives the connection from the pool and records the time of the waiting
+
+        :return: connection record
+        :rtype: ConnectionRecord
+
+        """
+        start: float = time.perf_counter()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            metrics.observe(f'{self.metric}.checkout', time.perf_counter() - start)
+
+
+class ReplicaTimedQueuePool(TimedQueuePool):
+    """
+    Pool of connections to the read replica which measures how long the connection
+    is waited for
+    """
+    metric = 'db.replica_pool'
+
+
+# SQLAlchemy logs the pools under the names of their classes (below the logger of this
+# module), so each checkout would be logged: only the warnings of the pools are kept
+for pool_class in (TimedQueuePool, ReplicaTimedQueuePool):
+    logging.getLogger(f'{pool_class.__module__}.{pool_class.__name__}').setLevel(logging.WARNING)
+
+
+def register_pool_metrics(engine: AsyncEngine) -> None:
+    """Registers the gauges of the pool of connections: the number of connections given
+    out, opened above the pool size and the utilisation of the pool (given out connections
+    in relation to the maximum number of connections)
+
+    :param: engine: current asynchronous engine
+    :type: engine: AsyncEngine
+    :return: None
+
+    """
+    pool: TimedQueuePool = engine.sync_engine.pool
+    metrics.gauge(f'{pool.metric}.checked_out', pool.checkedout)
+    metrics.gauge(f'{pool.metric}.overflow', lambda: max(pool.overflow(), 0))
+    metrics.gauge(f'{pool.metric}.utilisation',
+                  lambda: round(pool.checkedout() / (pool.size() + pool._max_overflow), 3))
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Applies the settings to the new connection to SQLite
+
+    :param: dbapi_connection: new connection
+    :type: dbapi_connection: AsyncAdapt_aiosqlite_connection
+    :param: connection_record: record of the connection in the pool
+    :type: connection_record: ConnectionRecord
+    :return: None
+
+    """
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def create_sqlite_engine(config: Config) -> AsyncEngine:
+    """Creates the asynchronous engine of the embedded SQLite database (the file
+    specified in the config) with the write-ahead log and tuned settings
+
+    :param: config: current user's config
+    :type: config: Config
+    :return: asynchronous engine
+    :rtype: AsyncEngine
+
+    """
+    engine = create_async_engine(
+        url=make_url(f'sqlite+aiosqlite:///{config.database.sqlite_path}'),
+        poolclass=TimedQueuePool,
+        pool_size=config.database.pool_size,
+        max_overflow=config.database.max_overflow,
+        pool_timeout=config.database.pool_timeout
+    )
+    event.listen(engine.sync_engine, 'connect', set_sqlite_pragmas)
+    return engine
+
+
+def create_postgres_engine(config: Config, connection_uri: Optional[str] = None,
+                           poolclass: Type[TimedQueuePool] = TimedQueuePool) -> AsyncEngine:
     """Extracts the necessary parameters for connecting to the database from the config,
-    adds them to the connection uri and passes it to the created asynchronous engine.
-    Creates database tables. Creates a pool of database connections and
-    passes the asynchronous engine to it
+    adds them to the connection uri (if the uri is not given) and passes it to the created
+    asynchronous engine. The pool of the engine is configured from the config
 
     :param: config: current user's config
     :type: config: Config
-    :return: pool of connections to database
-    :rtype: sessionmaker
+    :param: connection_uri: uri of the database (the primary database from the config,
+    if not given)
+    :type: connection_uri: Optional[string]
+    :param: poolclass: class of the pool of connections
+    :type: poolclass: Type[TimedQueuePool]
+    :return: asynchronous engine
+    :rtype: AsyncEngine
 
     """
-    user: str = config.database.user
-    password: str = config.database.password
-    host: str = config.database.host
-    port: str = config.database.port
-    database: str = config.database.database_name
-    connection_uri: str = f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{database}"
+    if connection_uri is None:
+        user: str = config.database.user
+        password: str = config.database.password
+        host: str = config.database.host
+        port: str = config.database.port
+        database: str = config.database.database_name
+        connection_uri = f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{database}"
+    # the statements are prepared by SQLAlchemy and cached in its adapter (the cache
+    # of asyncpg itself is used only for the statements that are not prepared)
+    connect_args: Dict[str, int] = dict(
+        prepared_statement_cache_size=config.database.prepared_statement_cache_size)
+    if config.database.pgbouncer:
+        connect_args.update(prepared_statement_cache_size=0, statement_cache_size=0)
     engine = create_async_engine(
-        url=make_url(connection_uri)
+        url=make_url(connection_uri),
+        poolclass=poolclass,
+        pool_size=config.database.pool_size,
+        max_overflow=config.database.max_overflow,
+        pool_timeout=config.database.pool_timeout,
+        pool_recycle=config.database.pool_recycle,
+        pool_pre_ping=config.database.pool_pre_ping,
+        connect_args=connect_args
     )
+    return engine
+
+
+async def create_pool(config: Config) -> sessionmaker:
+    """Creates the asynchronous engine of the database chosen in the config (Postgres
+    or the embedded SQLite) and registers the metrics of its pool. Creates database
+    tables (and brings the existing Postgres ones up to date: the history is deduplicated
+    only if its unique index is missing). Creates a pool of database connections (sessions)
+    and passes the asynchronous engine to it
+
+    :param: config: current user's config
+    :type: config: Config
+    :return: pool of connections to database
+    :rtype: sessionmaker
+
+    """
+    if config.database.backend == 'sqlite':
+        engine: AsyncEngine = create_sqlite_engine(config=config)
+    else:
+        engine = create_postgres_engine(config=config)
+    register_pool_metrics(engine=engine)
     async with engine.begin() as connect:
         # await connect.run_sync(Base.metadata.drop_all)
         await connect.run_sync(Base.metadata.create_all)
+        if engine.dialect.name == 'postgresql':
+            if (await connect.execute(text(UNIQUE_INDEX_QUERY))).first() is None:
+                logger.info('the history is deduplicated and its unique index is created')
+                for statement in UNIQUE_INDEX_STATEMENTS:
+                    await connect.execute(text(statement))
+            for statement in UPGRADE_STATEMENTS:
+                await connect.execute(text(statement))
     pool = sessionmaker(bind=engine,  class_=AsyncSession,
                         expire_on_commit=False, autoflush=False)
-    logger.info(f'pool of connection is created')
+    logger.info(f'pool of connection is created ({engine.dialect.name})')
     return pool
+
+
+def create_read_pool(config: Config, pool: sessionmaker) -> sessionmaker:
+    """Creates a pool of connections (sessions) to the read replica specified in the config,
+    which is used by the read-only queries (the viewing of the history). If the replica
+    is not specified, the pool of the primary database is used for reading as well
+
+    :param: config: current user's config
+    :type: config: Config
+    :param: pool: pool of connections to the primary database
+    :type: pool: sessionmaker
+    :return: pool of connections for reading
+    :rtype: sessionmaker
+
+    """
+    if not config.database.replica_dsn:
+        return pool
+    engine: AsyncEngine = create_postgres_engine(config=config,
+                                                 connection_uri=config.database.replica_dsn,
+                                                 poolclass=ReplicaTimedQueuePool)
+    register_pool_metrics(engine=engine)
+    read_pool = sessionmaker(bind=engine, class_=AsyncSession,
+                             expire_on_commit=False, autoflush=False)
+    logger.info('pool of connection to the read replica is created')
+    return read_pool
@@ -1,9 +1,26 @@
-from sqlalchemy import Column, ForeignKey, Integer, String
+import hashlib
+
+from sqlalchemy import Column, Date, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
+# columns describing the shown photo (filled when the photo is shown for the first time)
+PHOTO_METADATA = ('source', 'photo_date', 'width', 'height', 'caption', 'file_id')
+
+
+def url_hash(url: str) -> str:
+    """Calculates the hash of the url of the photo (the same as the md5 function of Postgres)
+
+    :param: url: url of the photo
+    :type: url: string
+    :return: md5 hash of the url as a hex string
+    :rtype: string
+
+    """
+    return hashlib.md5(url.encode()).hexdigest()
+
 
 class User(Base):
     """
@@ -19,10 +36,22 @@ class User(Base):
 
 class UserFavoritePhotos(Base):
     """
-    A table with viewed photos of users and their main parameters
+    A table with viewed photos of users and their main parameters (each photo
+    is recorded once for each user)
     """
     __tablename__ = 'user_photos'
+    __table_args__ = (
+        Index('ix_user_photos_user_url_hash', 'relation_user_id', 'photo_url_hash', unique=True),
+        Index('ix_user_photos_user_id', 'relation_user_id', 'id'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     relation_user_id = Column(Integer, ForeignKey('user.user_id'), nullable=False)
     user = relationship('User', back_populates='all_photos')
-    photo_url = Column(String)
\ No newline at end of file
+    photo_url = Column(String)
+    photo_url_hash = Column(String(32))
+    source = Column(String(16))
+    photo_date = Column(Date)
+    width = Column(Integer)
+    height = Column(Integer)
+    caption = Column(String)
+    file_id = Column(String)
\ No newline at end of file
@@ -1 +1 @@
-from . import logger
\ No newline at end of file
+from . import cache, jobs, logger, metrics, nasa, scheduler, sending, throttling
\ No newline at end of file
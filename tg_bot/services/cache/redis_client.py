@@ -0,0 +1,24 @@
+from typing import Optional
+
+import aioredis
+
+from tg_bot.config import Config
+from tg_bot.services.logger.my_logger import get_logger
+
+logger = get_logger(name=__name__)
+
+
+def create_redis(config: Config) -> Optional[aioredis.Redis]:
+    """Creates the client of the Redis server (if the use of Redis is specified in the config).
+    The connections are established lazily, at the first command
+
+    :param: config: current user's config
+    :type: config: Config
+    :return: client of the Redis server or None (if Redis is not used)
+    :rtype: Optional[aioredis.Redis]
+
+    """
+    if not config.bot.use_redis:
+        return None
+    logger.info('Redis client is created')
+    return aioredis.from_url(config.bot.redis_url, decode_responses=True)
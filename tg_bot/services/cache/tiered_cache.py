@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import aioredis
+
+from tg_bot.services.logger.my_logger import get_logger
+
+logger = get_logger(name=__name__)
+
+
+class TieredCache:
+    """
+    Cache of string values: the bounded LRU in the memory of the current process and
+    (optionally) Redis as the second tier, shared by the restarts of the bot
+    """
+    def __init__(self, prefix: str, maxsize: int = 10000,
+                 redis: Optional[aioredis.Redis] = None, ttl: int = 86400) -> None:
+        """constructor of the cache class
+
+        :param: prefix: prefix of the Redis keys
+        :type: prefix: string
+        :param: maxsize: the maximum number of values kept in the memory
+        :type: maxsize: integer
+        :param: redis: client of the Redis server or None (if Redis is not used)
+        :type: redis: Optional[aioredis.Redis]
+        :param: ttl: how long (in seconds) the value is kept in Redis
+        :type: ttl: integer
+        :return: None
+
+        """
+        self.prefix = prefix
+        self.maxsize = maxsize
+        self.redis = redis
+        self.ttl = ttl
+        self._values: OrderedDict = OrderedDict()
+
+    async def get(self, key: Hashable) -> Optional[str]:
+        """Returns the cached value (the memory is checked first, then Redis)
+
+        :param: key: key of the value
+        :type: key: Hashable
+        :return: the value or None (if it is not cached)
+        :rtype: Optional[string]
+
+        """
+        if key in self._values:
+            self._values.move_to_end(key)
+            return self._values[key]
+        if self.redis is None:
+            return None
+        try:
+            value: Optional[str] = await self.redis.get(f'{self.prefix}:{key}')
+        except Exception as exception:
+            logger.warning(f'{self.prefix}:{key} was not read from Redis: {exception}')
+            return None
+        if value is not None:
+            self._remember(key=key, value=value)
+        return value
+
+    async def set(self, key: Hashable, value: str) -> None:
+        """Remembers the value
+
+        :param: key: key of the value
+        :type: key: Hashable
+        :param: value: the value
+        :type: value: string
+        :return: None
+
+        """
+        self._remember(key=key, value=value)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(f'{self.prefix}:{key}', value, ex=self.ttl)
+        except Exception as exception:
+            logger.warning(f'{self.prefix}:{key} was not written to Redis: {exception}')
+
+    async def delete(self, key: Hashable) -> None:
+        """Forgets the value
+
+        :param: key: key of the value
+        :type: key: Hashable
+        :return: None
+
+        """
+        self._values.pop(key, None)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.delete(f'{self.prefix}:{key}')
+        except Exception as exception:
+            logger.warning(f'{self.prefix}:{key} was not deleted from Redis: {exception}')
+
+    def _remember(self, key: Hashable, value: str) -> None:
+        """Puts the value into the memory, the least recently used value is forgotten
+        if the cache is full
+
+        :param: key: key of the value
+        :type: key: Hashable
+        :param: value: the value
+        :type: value: string
+        :return: None
+
+        """
+        self._values[key] = value
+        self._values.move_to_end(key)
+        if len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
@@ -0,0 +1,251 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.exc import DataError, IntegrityError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from tg_bot.models.db_tables import PHOTO_METADATA, UserFavoritePhotos, url_hash
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+
+logger = get_logger(name=__name__)
+
+# the maximum number of rows in one statement (asyncpg accepts up to 32767 parameters)
+MAX_STATEMENT_ROWS = 32767 // (len(PHOTO_METADATA) + 3)
+# errors after which the photos are returned to the buffer (the database is not available)
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError, asyncio.TimeoutError, OSError)
+# errors of the rows themselves (the photos are dropped, they can never be written)
+ROW_ERRORS = (IntegrityError, DataError)
+
+
+class HistoryWriter:
+    """
+    Write-behind buffer of the viewed photos: the handlers only put the photo into
+    the buffer, and the photos are added to the database in bulk (with multi-row
+    statements of the batch size) every few hundred milliseconds or when enough of them
+    are collected. While the database is not available the buffer is limited: the oldest
+    photos are dropped. The users whose photos have been written recently are remembered,
+    so their history is read from the primary database until the read replica catches up
+    """
+    def __init__(self, pool: sessionmaker, interval: float = 0.5, batch_size: int = 500,
+                 max_size: int = 10000, replica_lag: float = 5) -> None:
+        """constructor of the writer class
+
+        :param: pool: current pool of database connections
+        :type: pool: sessionmaker
+        :param: interval: how often (in seconds) the buffer is written to the database
+        :type: interval: float
+        :param: batch_size: the number of photos after which the buffer is written at once
+        (and the number of photos in one statement)
+        :type: batch_size: integer
+        :param: max_size: the maximum number of photos kept in the buffer
+        :type: max_size: integer
+        :param: replica_lag: how long (in seconds) the written photos may be missing
+        on the read replica
+        :type: replica_lag: float
+        :return: None
+
+        """
+        self.pool = pool
+        self.interval = interval
+        self.batch_size = min(batch_size, MAX_STATEMENT_ROWS)
+        self.max_size = max_size
+        self.replica_lag = replica_lag
+        self._written: Dict[int, float] = dict()
+        self._buffer: Dict[Tuple[int, str], Dict] = dict()
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closing: bool = False
+
+    def add(self, user_id: int, url: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Puts the viewed photo into the buffer (the photo repeated in the buffer is
+        recorded once)
+
+        :param: user_id: id of the user
+        :type: user_id: integer
+        :param: url: url of the photo
+        :type: url: string
+        :param: metadata: description of the photo (source, date, dimensions, caption, file_id)
+        :type: metadata: Optional[dictionary]
+        :return: None
+
+        """
+        photo_url_hash: str = url_hash(url)
+        row: Dict[str, Any] = dict.fromkeys(PHOTO_METADATA)
+        row.update(metadata or dict(), relation_user_id=user_id,
+                   photo_url=url, photo_url_hash=photo_url_hash)
+        self._buffer[(user_id, photo_url_hash)] = row
+        self._trim()
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    def _trim(self) -> None:
+        """Drops the oldest photos of the buffer above its maximum size
+
+        :return: None
+
+        """
+        dropped: int = len(self._buffer) - self.max_size
+        if dropped <= 0:
+            return
+        for key in list(self._buffer)[:dropped]:
+            del self._buffer[key]
+        metrics.increment('history.dropped', dropped)
+        logger.debug(f'the buffer of the viewed photos is full, {dropped} oldest photos were dropped')
+
+    async def _write(self, rows: List[Dict]) -> None:
+        """Writes the photos to the database with one statement (the description of the
+        photo already recorded for the user is completed: only its empty columns are set,
+        the complete rows are not touched at all)
+
+        :param: rows: the photos
+        :type: rows: List[dictionary]
+        :return: None
+
+        """
+        statement: Insert = insert(UserFavoritePhotos).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[UserFavoritePhotos.relation_user_id, UserFavoritePhotos.photo_url_hash],
+            set_={column: func.coalesce(getattr(UserFavoritePhotos, column), statement.excluded[column])
+                  for column in PHOTO_METADATA},
+            where=or_(*[and_(getattr(UserFavoritePhotos, column).is_(None),
+                             statement.excluded[column].isnot(None)) for column in PHOTO_METADATA])
+        )
+        session: AsyncSession = self.pool()
+        try:
+            async with session.begin():
+                await session.execute(statement)
+        finally:
+            await session.close()
+
+    async def _write_rows(self, rows: List[Dict]) -> None:
+        """Writes the photos of the rejected statement one by one: the photos rejected by
+        the database are dropped, the others are written (the errors of the database that is
+        not available are raised)
+
+        :param: rows: the photos
+        :type: rows: List[dictionary]
+        :return: None
+
+        """
+        for row in rows:
+            try:
+                await self._write(rows=[row])
+            except ROW_ERRORS as exception:
+                metrics.increment('history.dropped')
+                logger.error(f'the viewed photo {row["photo_url"]} of the user '
+                             f'{row["relation_user_id"]} was dropped: {exception}')
+
+    def _restore(self, rows: List[Dict]) -> None:
+        """Returns the photos that were not written to the buffer (before the photos added
+        after them; the newer description of the same photo is kept)
+
+        :param: rows: the photos
+        :type: rows: List[dictionary]
+        :return: None
+
+        """
+        buffer: Dict[Tuple[int, str], Dict] = {
+            (row['relation_user_id'], row['photo_url_hash']): row for row in rows
+        }
+        buffer.update(self._buffer)
+        self._buffer = buffer
+        self._trim()
+
+    def _remember_written(self, rows: List[Dict]) -> None:
+        """Remembers the time of the writing of the photos of the users (the users whose
+        photos were written long ago are forgotten)
+
+        :param: rows: the written photos
+        :type: rows: List[dictionary]
+        :return: None
+
+        """
+        now: float = time.monotonic()
+        self._written = {user_id: moment for user_id, moment in self._written.items()
+                         if now - moment < self.replica_lag}
+        self._written.update((row['relation_user_id'], now) for row in rows)
+
+    def written_recently(self, user_id: int) -> bool:
+        """Checks whether the photos of the user have been written to the primary database
+        so recently, that the read replica may not have them yet
+
+        :param: user_id: id of the user
+        :type: user_id: integer
+        :return: True, if the history of the user should be read from the primary, else False
+        :rtype: bool
+
+        """
+        moment: Optional[float] = self._written.get(user_id)
+        return moment is not None and time.monotonic() - moment < self.replica_lag
+
+    async def flush(self) -> None:
+        """Writes all photos of the buffer to the database by the statements of the batch
+        size. If the database is not available, the photos that were not written are
+        returned to the buffer; the photos rejected by the database are dropped
+
+        :return: None
+
+        """
+        async with self._lock:
+            if not self._buffer:
+                return
+            rows: List[Dict] = list(self._buffer.values())
+            self._buffer.clear()
+            self._full.clear()
+            for start in range(0, len(rows), self.batch_size):
+                batch: List[Dict] = rows[start:start + self.batch_size]
+                try:
+                    try:
+                        await self._write(rows=batch)
+                    except ROW_ERRORS:
+                        await self._write_rows(rows=batch)
+                    self._remember_written(rows=batch)
+                except TRANSIENT_ERRORS as exception:
+                    logger.error(f'{len(rows) - start} viewed photos were not written, '
+                                 f'they are kept in the buffer: {exception!r}')
+                    self._restore(rows=rows[start:])
+                    return
+                except Exception as exception:
+                    metrics.increment('history.dropped', len(batch))
+                    logger.error(f'{len(batch)} viewed photos were dropped: {exception!r}')
+
+    def start(self) -> None:
+        """Starts the periodic writing of the buffer
+
+        :return: None
+
+        """
+        self._task = asyncio.create_task(self._work())
+
+    async def close(self) -> None:
+        """Stops the periodic writing (the writing in progress is completed) and writes
+        the rest of the buffer
+
+        :return: None
+
+        """
+        self._closing = True
+        self._full.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+
+    async def _work(self) -> None:
+        """Writes the buffer every interval or at once when it is full
+
+        :return: None
+
+        """
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
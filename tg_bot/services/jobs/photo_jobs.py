@@ -0,0 +1,471 @@
+import asyncio
+import json
+import traceback
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aioredis
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.handler import ctx_data
+from sqlalchemy.orm import sessionmaker
+
+from tg_bot.middlewares.data_middleware import DataMiddleware
+from tg_bot.middlewares.db_middleware import LazySession
+from tg_bot.models.db_tables import User
+from tg_bot.services.jobs.history_writer import HistoryWriter
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.scheduler.chat_scheduler import ChatScheduler
+from tg_bot.services.scheduler.lanes import LANE_PHOTO, Lanes
+
+logger = get_logger(name=__name__)
+
+
+@dataclass
+class PhotoJob:
+    """
+    Search of the photo, executed in the background
+
+    :param: kind: explored place (Mars, Earth, Space)
+    :type: kind: string
+    :param: chat_id: id of the current chat
+    :type: chat_id: integer
+    :param: user_id: id of the current user
+    :type: user_id: integer
+    :param: user_name: name of the current user
+    :type: user_name: string
+    :param: message: the message with the progress of the search (serialized)
+    :type: message: dictionary
+    :param: done_text: text of the above message after the search is finished
+    :type: done_text: string
+    :param: number: sequence number of the job
+    :type: number: integer
+    """
+    kind: str
+    chat_id: int
+    user_id: int
+    user_name: str
+    message: Dict
+    done_text: str
+    number: int = 0
+
+    def dumps(self) -> str:
+        """Serializes the job
+
+        :return: the job as json
+        :rtype: string
+
+        """
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def loads(cls, payload: str) -> 'PhotoJob':
+        """Deserializes the job
+
+        :param: payload: the job as json
+        :type: payload: string
+        :return: the job
+        :rtype: PhotoJob
+
+        """
+        return cls(**json.loads(payload))
+
+
+# atomic submission of the job: the job is dropped if the same search of the same chat is
+# already waiting in the queue (or is being executed), otherwise its number is recorded
+# as the live job of the chat and the job is put into the queue
+PUT_SCRIPT = """
+if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('RPUSH', KEYS[1], ARGV[4])
+return 1
+"""
+# atomic completion of the job: its search is forgotten only if it is still the live one
+# (the newer job of the same search, submitted after the cancelling, is kept)
+DONE_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+
+class MemoryJobQueue:
+    """
+    Queue of jobs in the memory of the current process. The number of the live job is
+    kept for each search of each chat: the repeated search is dropped, the cancelled jobs
+    (whose numbers are forgotten) are skipped by the workers
+    """
+    def __init__(self) -> None:
+        """constructor of the queue class
+
+        :return: None
+
+        """
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._number: int = 0
+        self._live: Dict[int, Dict[str, int]] = dict()
+
+    async def put(self, job: PhotoJob) -> bool:
+        """Numbers the job and adds it to the end of the queue (if the same search of the
+        same chat is not waiting in the queue or being executed)
+
+        :param: job: current job
+        :type: job: PhotoJob
+        :return: True, if the job was put into the queue, else False
+        :rtype: bool
+
+        """
+        if job.kind in self._live.get(job.chat_id, ()):
+            return False
+        self._number += 1
+        job.number = self._number
+        self._live.setdefault(job.chat_id, dict())[job.kind] = job.number
+        await self._queue.put(job)
+        return True
+
+    async def get(self) -> PhotoJob:
+        """Waits for the first job of the queue and takes it
+
+        :return: the first job
+        :rtype: PhotoJob
+
+        """
+        return await self._queue.get()
+
+    async def is_live(self, job: PhotoJob) -> bool:
+        """Checks whether the job is still needed (it is not cancelled)
+
+        :param: job: current job
+        :type: job: PhotoJob
+        :return: True, if the job should be executed, else False
+        :rtype: bool
+
+        """
+        return self._live.get(job.chat_id, dict()).get(job.kind) == job.number
+
+    async def done(self, job: PhotoJob) -> None:
+        """Forgets the executed (or skipped) job, so the same search can be submitted again
+
+        :param: job: current job
+        :type: job: PhotoJob
+        :return: None
+
+        """
+        if await self.is_live(job):
+            del self._live[job.chat_id][job.kind]
+            if not self._live[job.chat_id]:
+                del self._live[job.chat_id]
+
+    async def cancel(self, chat_id: int) -> None:
+        """Cancels all jobs of the chat that are waiting in the queue
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :return: None
+
+        """
+        self._live.pop(chat_id, None)
+
+    async def size(self) -> int:
+        """The number of jobs waiting in the queue
+
+        :return: number of jobs
+        :rtype: integer
+
+        """
+        return self._queue.qsize()
+
+    async def close(self) -> None:
+        """Nothing to close for the queue in the memory
+
+        :return: None
+
+        """
+
+
+class RedisJobQueue:
+    """
+    Queue of jobs stored in the Redis list (the jobs are not lost when the bot is restarted).
+    The numbers of the live jobs of each chat are kept in Redis too, so the repeated search
+    is dropped and the cancelled jobs are skipped by all processes of the bot. The numbers
+    expire after the ttl, so the jobs left in the queue for longer (e.g. while the bot was
+    stopped) are not executed. The workers wait for the jobs over their own connection, one
+    at a time, so the connections of the shared pool are not held by the waiting
+    """
+    def __init__(self, redis: aioredis.Redis, key: str = 'photo_jobs', ttl: int = 600) -> None:
+        """constructor of the queue class
+
+        :param: redis: client of the Redis server
+        :type: redis: aioredis.Redis
+        :param: key: name of the Redis list (and prefix of the other keys of the queue)
+        :type: key: string
+        :param: ttl: how long (in seconds) the job waiting in the queue stays needed
+        :type: ttl: integer
+        :return: None
+
+        """
+        self.redis = redis
+        self.key = key
+        self.ttl = ttl
+        self._blocking: aioredis.Redis = redis.client()
+        self._blocking_lock: asyncio.Lock = asyncio.Lock()
+        self._put_script = redis.register_script(PUT_SCRIPT)
+        self._done_script = redis.register_script(DONE_SCRIPT)
+
+    def _live_key(self, chat_id: int) -> str:
+        """Creates the key of the numbers of the live jobs of the chat
+
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :return: the Redis key
+        :rtype: string
+
+        """
+        return f'{self.key}:live:{chat_id}'
+
+    async def put(self, job: PhotoJob) -> bool:
+        """Numbers the job and adds it to the end of the queue (if the same search of the
+        same chat is not waiting in the queue or being executed)
+
+        :param: job: current job
+        :type: job: PhotoJob
+        :return: True, if the job was put into the queue, else False
+        :rtype: bool
+
+        """
+        job.number = await self.redis.incr(f'{self.key}:number')
+        return bool(await self._put_script(keys=[self.key, self._live_key(chat_id=job.chat_id)],
+                                           args=[job.kind, job.number, self.ttl, job.dumps()]))
+
+    async def get(self) -> PhotoJob:
+        """Waits for the first job of the queue and takes it
+
+        :return: the first job
+        :rtype: PhotoJob
+
+        """
+        async with self._blocking_lock:
+            while True:
+                item: Optional[Tuple[str, str]] = await self._blocking.blpop(self.key, timeout=5)
+                if item:
+                    return PhotoJob.loads(item[1])
+
+    async def is_live(self, job: PhotoJob) -> bool:
+        """Checks whether the job is still needed (it is neither cancelled nor expired)
+
+        :param: job: current job
+        :type: job: PhotoJob
+        :return: True, if the job should be executed, else False
+        :rtype: bool
+
+        """
+        number: Optional[str] = await self.redis.hget(self._live_key(chat_id=job.chat_id), job.kind)
+        return number == str(job.number)
+
+    async def done(self, job: PhotoJob) -> None:
+        """Forgets the executed (or skipped) job, so the same search can be submitted again
+
+        :param: job: current job
+        :type: job: PhotoJob
+        :return: None
+
+        """
+        await self._done_script(keys=[self._live_key(chat_id=job.chat_id)],
+                                args=[job.kind, job.number])
+
+    async def cancel(self, chat_id: int) -> None:
+        """Cancels all jobs of the chat that are waiting in the queue
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :return: None
+
+        """
+        await self.redis.delete(self._live_key(chat_id=chat_id))
+
+    async def size(self) -> int:
+        """The number of jobs waiting in the queue
+
+        :return: number of jobs
+        :rtype: integer
+
+        """
+        return await self.redis.llen(self.key)
+
+    async def close(self) -> None:
+        """Releases the connection of the waiting workers (the Redis client is closed by
+        its owner)
+
+        :return: None
+
+        """
+        await self._blocking.close()
+
+
+class PhotoJobWorkers:
+    """
+    Bounded pool of workers executing the searches of photos in the background, so the
+    handlers only put a job into the queue and finish at once. The job is executed in the
+    turn of its chat (taken from the scheduler of updates), so it never runs together with
+    the updates of the same chat. The jobs are executed in the photo lane, so they give
+    way to the interactive updates
+    """
+    def __init__(self, dp: Dispatcher, queue, pool: sessionmaker,
+                 runner: Callable[[types.Message, FSMContext, PhotoJob], Awaitable[None]],
+                 on_failure: Callable[[types.Message, PhotoJob], Awaitable[None]],
+                 scheduler: ChatScheduler, lanes: Lanes, history: HistoryWriter,
+                 workers: int = 8) -> None:
+        """constructor of the workers class
+
+        :param: dp: current dispatcher
+        :type: dp: Dispatcher
+        :param: queue: queue of jobs
+        :type: queue: MemoryJobQueue or RedisJobQueue
+        :param: pool: current pool of database connections
+        :type: pool: sessionmaker
+        :param: runner: function executing the job
+        :type: runner: Callable[[Message, FSMContext, PhotoJob], Awaitable[None]]
+        :param: on_failure: function telling the user that the job has failed
+        :type: on_failure: Callable[[Message, PhotoJob], Awaitable[None]]
+        :param: scheduler: scheduler of updates (the turns of the chats)
+        :type: scheduler: ChatScheduler
+        :param: lanes: lanes of the processing
+        :type: lanes: Lanes
+        :param: history: write-behind buffer of the viewed photos
+        :type: history: HistoryWriter
+        :param: workers: number of workers
+        :type: workers: integer
+        :return: None
+
+        """
+        self.dp = dp
+        self.queue = queue
+        self.pool = pool
+        self.runner = runner
+        self.on_failure = on_failure
+        self.scheduler = scheduler
+        self.lanes = lanes
+        self.history = history
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = list()
+        self._waiting: int = 0
+        self._running: int = 0
+
+    async def submit(self, job: PhotoJob) -> bool:
+        """Puts the job into the queue. If the same search of the same chat is already
+        waiting in the queue (or is being executed), the job is dropped
+
+        :param: job: current job
+        :type: job: PhotoJob
+        :return: True, if the job was put into the queue, else False
+        :rtype: bool
+
+        """
+        if not await self.queue.put(job):
+            logger.info(f'{job.user_name} already waits for the photo ({job.kind}), '
+                        f'the repeated search was dropped')
+            return False
+        self._waiting = await self.queue.size()
+        return True
+
+    @property
+    def pending(self) -> int:
+        """The number of jobs waiting in the queue (when it was last seen) or being executed
+
+        :return: the number of jobs
+        :rtype: integer
+
+        """
+        return self._waiting + self._running
+
+    async def cancel(self, chat_id: int) -> None:
+        """Drops all jobs of the chat that are waiting in the queue (the user has moved on)
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :return: None
+
+        """
+        await self.queue.cancel(chat_id=chat_id)
+
+    def start(self) -> None:
+        """Starts the workers
+
+        :return: None
+
+        """
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f'{self.workers} photo workers are started')
+
+    async def close(self) -> None:
+        """Stops the workers and closes the queue
+
+        :return: None
+
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.queue.close()
+
+    async def _work(self) -> None:
+        """Takes the jobs from the queue one by one and executes them in the turn of their
+        chat (the cancelled job is skipped at once, the job cancelled while it was waiting
+        for the turn is skipped too)
+
+        :return: None
+
+        """
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        while True:
+            job: PhotoJob = await self.queue.get()
+            self._waiting = await self.queue.size()
+            self._running += 1
+            try:
+                if await self.queue.is_live(job):
+                    async with self.scheduler.acquire(chat_id=job.chat_id):
+                        if await self.queue.is_live(job):
+                            async with self.lanes.slot(LANE_PHOTO, own_limit=False):
+                                await self._run(job)
+                        await self.queue.done(job)
+            except Exception as exception:
+                logger.error(f'Photo job was not executed: {exception!r}; job: {job}')
+            finally:
+                self._running -= 1
+
+    async def _run(self, job: PhotoJob) -> None:
+        """Restores the context of the update (chat, user, state, contextual data) and executes
+        the job. The url of the shown photo is put into the buffer of the history (as
+        DataMiddleware does after the processing of the update). If the job fails, the user
+        is told about it
+
+        :param: job: current job
+        :type: job: PhotoJob
+        :return: None
+
+        """
+        message: types.Message = types.Message.to_object(job.message)
+        types.Chat.set_current(message.chat)
+        types.User.set_current(types.User(id=job.user_id, is_bot=False, first_name=job.user_name))
+        state: FSMContext = self.dp.current_state(chat=job.chat_id, user=job.user_id)
+        data: Dict = dict(user=User(user_id=job.user_id, user_name=job.user_name),
+                          session=LazySession(pool=self.pool))
+        ctx_data.set(data)
+        try:
+            await self.runner(message, state, job)
+            await DataMiddleware.add_url_to_database(history=self.history)
+        except Exception as exception:
+            logger.error(f'Photo job has failed: {exception};'
+                         f'\n {traceback.format_exc()};'
+                         f'\n job: {job}')
+            try:
+                await self.on_failure(message, job)
+            except Exception as failure:
+                logger.error(f'the user was not told about the failed photo job: {failure!r}')
+        finally:
+            await data['session'].close()
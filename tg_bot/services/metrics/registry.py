@@ -0,0 +1,160 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from tg_bot.services.logger.my_logger import get_logger
+
+logger = get_logger(name=__name__)
+
+
+@dataclass
+class Timing:
+    """
+    Accumulated durations of the observed operation
+
+    :param: count: the number of observations
+    :type: count: integer
+    :param: total: the sum of the durations (in seconds)
+    :type: total: float
+    :param: maximum: the longest duration since the last report (in seconds)
+    :type: maximum: float
+    """
+    count: int = 0
+    total: float = 0
+    maximum: float = 0
+
+
+class Metrics:
+    """
+    Registry of the metrics of the bot: counters, durations of operations and gauges
+    (values calculated at the moment of the report)
+    """
+    def __init__(self) -> None:
+        """constructor of the registry class
+
+        :return: None
+
+        """
+        self.counters: Dict[str, float] = dict()
+        self.timings: Dict[str, Timing] = dict()
+        self.gauges: Dict[str, Callable[[], float]] = dict()
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """Increases the counter
+
+        :param: name: name of the counter
+        :type: name: string
+        :param: value: the increase
+        :type: value: float
+        :return: None
+
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Records the duration of the operation
+
+        :param: name: name of the operation
+        :type: name: string
+        :param: seconds: the duration
+        :type: seconds: float
+        :return: None
+
+        """
+        timing: Timing = self.timings.setdefault(name, Timing())
+        timing.count += 1
+        timing.total += seconds
+        timing.maximum = max(timing.maximum, seconds)
+
+    def gauge(self, name: str, getter: Callable[[], float]) -> None:
+        """Registers the gauge
+
+        :param: name: name of the gauge
+        :type: name: string
+        :param: getter: function calculating the current value
+        :type: getter: Callable[[], float]
+        :return: None
+
+        """
+        self.gauges[name] = getter
+
+    def snapshot(self) -> Dict[str, float]:
+        """Collects the current values of all metrics (the maximums of the durations
+        are reset)
+
+        :return: values by the names of the metrics
+        :rtype: dictionary
+
+        """
+        values: Dict[str, float] = dict(self.counters)
+        for name, timing in self.timings.items():
+            values[f'{name}.count'] = timing.count
+            values[f'{name}.avg_ms'] = round(timing.total / timing.count * 1000, 3) if timing.count else 0
+            values[f'{name}.max_ms'] = round(timing.maximum * 1000, 3)
+            timing.maximum = 0
+        for name, getter in self.gauges.items():
+            values[name] = getter()
+        return values
+
+
+# metrics of the current process
+metrics = Metrics()
+
+
+class MetricsReporter:
+    """
+    Periodic writer of the metrics to the log
+    """
+    def __init__(self, registry: Metrics, interval: float = 60) -> None:
+        """constructor of the reporter class
+
+        :param: registry: registry of the metrics
+        :type: registry: Metrics
+        :param: interval: how often (in seconds) the metrics are written
+        :type: interval: float
+        :return: None
+
+        """
+        self.registry = registry
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Starts the periodic writing of the metrics
+
+        :return: None
+
+        """
+        self._task = asyncio.create_task(self._work())
+
+    async def close(self) -> None:
+        """Stops the periodic writing and writes the metrics for the last time
+
+        :return: None
+
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.report()
+
+    def report(self) -> None:
+        """Writes the current metrics to the log
+
+        :return: None
+
+        """
+        values: Dict[str, float] = self.registry.snapshot()
+        if values:
+            logger.info('metrics: ' + ', '.join(f'{name}={value}'
+                                                for name, value in sorted(values.items())))
+
+    async def _work(self) -> None:
+        """Writes the metrics every interval
+
+        :return: None
+
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
@@ -0,0 +1,170 @@
+import asyncio
+import calendar
+from datetime import date
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from aiohttp import ClientError, ClientSession
+
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+from tg_bot.services.nasa.overload import OverloadDetector
+
+logger = get_logger(name=__name__)
+
+MARS_MANIFEST_URL = 'https://api.nasa.gov/mars-photos/api/v1/manifests/curiosity'
+EARTH_DATES_URL = 'https://api.nasa.gov/EPIC/api/natural/available'
+# sources of the photos (the values of the explored place)
+SOURCE_MARS = 'Mars'
+SOURCE_EARTH = 'Earth'
+
+
+class DateAvailability:
+    """
+    Index of the dates on which NASA has the photos: the days of the photos of Curiosity
+    (from the manifest of the rover) and of the photos of Earth (from the available dates
+    of EPIC). The index is refreshed in the background, so the calendar offers only the
+    days with the photos and no requests are sent to NASA for the empty days. While the index
+    of the source is not loaded (and for the days after its last date), all days are offered
+    """
+    def __init__(self, api_key: str, overload: OverloadDetector, interval: float = 3600,
+                 retry: float = 60) -> None:
+        """constructor of the index class
+
+        :param: api_key: your private NASA API token
+        :type: api_key: string
+        :param: overload: detector of the overload (its requests are watched, nothing is
+        requested in the degraded mode)
+        :type: overload: OverloadDetector
+        :param: interval: how often (in seconds) the index is refreshed
+        :type: interval: float
+        :param: retry: how long (in seconds) to wait before the next attempt of the failed refresh
+        :type: retry: float
+        :return: None
+
+        """
+        self.api_key = api_key
+        self.overload = overload
+        self.interval = interval
+        self.retry = retry
+        self._dates: Dict[str, Set[date]] = dict()
+        self._last: Dict[str, date] = dict()
+        self._months: Dict[str, Dict[Tuple[int, int], FrozenSet[int]]] = dict()
+        self._task: Optional[asyncio.Task] = None
+        metrics.gauge('availability.mars_days', lambda: len(self._dates.get(SOURCE_MARS, ())))
+        metrics.gauge('availability.earth_days', lambda: len(self._dates.get(SOURCE_EARTH, ())))
+
+    def month_days(self, source: str, year: int, month: int) -> Optional[FrozenSet[int]]:
+        """Returns the days of the month on which the source has the photos
+
+        :param: source: source of the photos (Mars or Earth)
+        :type: source: string
+        :param: year: year
+        :type: year: integer
+        :param: month: month
+        :type: month: integer
+        :return: the days with the photos or None (if they are unknown)
+        :rtype: Optional[FrozenSet[integer]]
+
+        """
+        last: Optional[date] = self._last.get(source)
+        if last is None or (year, month) > (last.year, last.month):
+            return None
+        return self._months[source].get((year, month), frozenset())
+
+    def is_empty(self, source: str, day: str) -> bool:
+        """Checks whether the source surely has no photos on the day
+
+        :param: source: source of the photos (Mars or Earth)
+        :type: source: string
+        :param: day: date in the format YYYY-MM-DD
+        :type: day: string
+        :return: True, if the day is covered by the index and has no photos, else False
+        :rtype: bool
+
+        """
+        last: Optional[date] = self._last.get(source)
+        chosen: date = date.fromisoformat(day)
+        return last is not None and chosen <= last and chosen not in self._dates[source]
+
+    def _index(self, source: str, days: Iterable[str]) -> None:
+        """Replaces the index of the source: the days are grouped by the months (the days
+        of the last month after the last date are unknown yet, so they are offered)
+
+        :param: source: source of the photos (Mars or Earth)
+        :type: source: string
+        :param: days: dates with the photos in the format YYYY-MM-DD
+        :type: days: Iterable[string]
+        :return: None
+
+        """
+        dates: Set[date] = {date.fromisoformat(day[:10]) for day in days}
+        if not dates:
+            return
+        last: date = max(dates)
+        months: Dict[Tuple[int, int], Set[int]] = dict()
+        for day in dates:
+            months.setdefault((day.year, day.month), set()).add(day.day)
+        months[(last.year, last.month)].update(
+            range(last.day + 1, calendar.monthrange(last.year, last.month)[1] + 1))
+        self._dates[source] = dates
+        self._last[source] = last
+        self._months[source] = {key: frozenset(value) for key, value in months.items()}
+        logger.info(f'the index of the photos of {source} has {len(dates)} days, '
+                    f'the last one is {last}')
+
+    async def refresh(self) -> bool:
+        """Loads the manifest of Curiosity and the available dates of EPIC (nothing is
+        requested in the degraded mode, the old index is kept)
+
+        :return: True, if the index is refreshed, else False
+        :rtype: bool
+
+        """
+        if self.overload.degraded:
+            return False
+        params: Dict[str, str] = dict(api_key=self.api_key)
+        try:
+            async with ClientSession(trace_configs=[self.overload.trace]) as session:
+                async with session.get(url=MARS_MANIFEST_URL, params=params) as response:
+                    response.raise_for_status()
+                    manifest: Dict = await response.json()
+                self._index(source=SOURCE_MARS,
+                            days=(photo['earth_date'] for photo in manifest['photo_manifest']['photos']
+                                  if photo.get('total_photos')))
+                async with session.get(url=EARTH_DATES_URL, params=params) as response:
+                    response.raise_for_status()
+                    self._index(source=SOURCE_EARTH, days=await response.json())
+        except (ClientError, asyncio.TimeoutError, KeyError, TypeError, ValueError) as exception:
+            metrics.increment('availability.failures')
+            logger.warning(f'the index of the dates with photos is not refreshed: {exception!r}')
+            return False
+        metrics.increment('availability.refreshes')
+        return True
+
+    def start(self) -> None:
+        """Starts the refreshing of the index in the background
+
+        :return: None
+
+        """
+        self._task = asyncio.create_task(self._work())
+
+    async def close(self) -> None:
+        """Stops the refreshing of the index
+
+        :return: None
+
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _work(self) -> None:
+        """Refreshes the index with the interval (the failed refresh is repeated sooner)
+
+        :return: None
+
+        """
+        while True:
+            refreshed: bool = await self.refresh()
+            await asyncio.sleep(self.interval if refreshed else self.retry)
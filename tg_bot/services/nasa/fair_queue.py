@@ -0,0 +1,178 @@
+import asyncio
+import heapq
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, List, Tuple
+
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+
+logger = get_logger(name=__name__)
+
+
+class NasaQuotas:
+    """
+    Fair sharing of the requests to NASA between the users. Each user has a budget of
+    requests and downloaded bytes for the sliding window: the user who has spent it waits
+    until the old requests leave the window (the user is slowed down, not refused). The places
+    for the requests executed at the same time are given by the weighted fair queue: each
+    request gets a virtual start time, which grows with the requests and the bytes already
+    used by its user, so the heavy users go after the light ones when the places are busy
+    """
+    def __init__(self, capacity: int = 8, requests: int = 30, megabytes: float = 100,
+                 window: float = 60) -> None:
+        """constructor of the quotas class
+
+        :param: capacity: the number of requests to NASA executed at the same time
+        :type: capacity: integer
+        :param: requests: the number of requests of one user in the window
+        :type: requests: integer
+        :param: megabytes: the number of megabytes downloaded by one user in the window
+        :type: megabytes: float
+        :param: window: length of the window (in seconds)
+        :type: window: float
+        :return: None
+
+        """
+        self.requests = requests
+        self.bytes = megabytes * 1024 * 1024
+        self.window = window
+        # bytes of the average request: the downloaded bytes are converted into the
+        # number of requests when the virtual time of the user is moved
+        self._request_bytes: float = self.bytes / requests
+        self._free: int = capacity
+        self._virtual: float = 0
+        self._finish: Dict[int, float] = dict()
+        self._usage: Dict[int, Deque[List[float]]] = dict()
+        self._number: int = 0
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = list()
+        metrics.gauge('nasa.waiting', lambda: len(self._waiters))
+
+    def _used(self, user_id: int, now: float) -> Deque[List[float]]:
+        """Returns the requests of the user in the window (the old ones are removed)
+
+        :param: user_id: id of the user
+        :type: user_id: integer
+        :param: now: current time
+        :type: now: float
+        :return: time and downloaded bytes of each request
+        :rtype: Deque[List[float]]
+
+        """
+        usage: Deque[List[float]] = self._usage.setdefault(user_id, deque())
+        while usage and now - usage[0][0] >= self.window:
+            usage.popleft()
+        return usage
+
+    async def _wait_budget(self, user_id: int) -> List[float]:
+        """Waits until the user has a budget for the next request in the window
+
+        :param: user_id: id of the user
+        :type: user_id: integer
+        :return: entry of the request in the window (its time and downloaded bytes)
+        :rtype: List[float]
+
+        """
+        while True:
+            now: float = time.monotonic()
+            usage: Deque[List[float]] = self._used(user_id=user_id, now=now)
+            if len(usage) < self.requests and sum(size for _, size in usage) < self.bytes:
+                entry: List[float] = [now, 0]
+                usage.append(entry)
+                return entry
+            metrics.increment('nasa.budget_waits')
+            logger.info(f'the user {user_id} has spent the budget of the requests to NASA')
+            await asyncio.sleep(usage[0][0] + self.window - now)
+
+    async def _acquire(self, user_id: int) -> None:
+        """Takes a place for the request at once (if there is a free one and nobody is
+        waiting for it), otherwise waits for its turn by the virtual start time
+
+        :param: user_id: id of the user
+        :type: user_id: integer
+        :return: None
+
+        """
+        start: float = max(self._virtual, self._finish.get(user_id, 0))
+        self._finish[user_id] = start + 1
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            self._virtual = start
+            return
+        self._number += 1
+        waiter: asyncio.Future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (start, self._number, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        """Gives the place to the waiting request with the earliest virtual start time
+        (the cancelled ones are skipped) or frees it
+
+        :return: None
+
+        """
+        while self._waiters:
+            start, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self._virtual = start
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+    def _charge(self, user_id: int, entry: List[float], size: int) -> None:
+        """Adds the downloaded bytes to the entry of the request in the budget of the user
+        and moves the virtual time of the user
+
+        :param: user_id: id of the user
+        :type: user_id: integer
+        :param: entry: entry of the request in the window of the user
+        :type: entry: List[float]
+        :param: size: the number of downloaded bytes
+        :type: size: integer
+        :return: None
+
+        """
+        entry[1] += size
+        self._finish[user_id] = self._finish.get(user_id, self._virtual) + size / self._request_bytes
+        metrics.increment('nasa.bytes', size)
+
+    def _forget_idle(self) -> None:
+        """Removes the users who have no requests in the window and whose virtual time
+        is behind the virtual time of the queue
+
+        :return: None
+
+        """
+        now: float = time.monotonic()
+        for user_id in list(self._usage):
+            if not self._used(user_id=user_id, now=now):
+                del self._usage[user_id]
+        self._finish = {user_id: finish for user_id, finish in self._finish.items()
+                        if finish > self._virtual or user_id in self._usage}
+
+    @asynccontextmanager
+    async def request(self, user_id: int) -> AsyncIterator[Callable[[int], None]]:
+        """Waits for the budget of the user and for the place in the fair queue for the
+        time of the request to NASA
+
+        :param: user_id: id of the user
+        :type: user_id: integer
+        :return: function adding the downloaded bytes to the budget of the user
+        :rtype: Callable[[integer], None]
+
+        """
+        if user_id not in self._finish and len(self._finish) >= 1000:
+            self._forget_idle()
+        entry: List[float] = await self._wait_budget(user_id=user_id)
+        await self._acquire(user_id=user_id)
+        metrics.increment('nasa.requests')
+        try:
+            yield lambda size: self._charge(user_id=user_id, entry=entry, size=size)
+        finally:
+            self._release()
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Callable, Deque, List, Optional, Tuple
+
+from aiohttp import ClientSession, TraceConfig, TraceRequestEndParams, \
+    TraceRequestExceptionParams, TraceRequestStartParams
+
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+
+logger = get_logger(name=__name__)
+
+
+class OverloadDetector:
+    """
+    Detector of the overload of the bot and of NASA: the depth of the queue of the searches,
+    the lag of the event loop, the share of the failed (or too slow) requests to NASA and the
+    remaining quota of the NASA API are watched. While any of them is beyond its limit (and for
+    the cooldown after that), the bot works in the degraded mode: only the cached data is served,
+    no new requests are sent to NASA. The observations of NASA are kept only for the period, so
+    without new requests the bot returns to the normal mode by itself
+    """
+    def __init__(self, depth: Callable[[], int], max_depth: int = 200, max_lag: float = 0.5,
+                 max_error_rate: float = 0.5, min_quota: int = 100, slow_request: float = 10,
+                 cooldown: float = 30, period: float = 60, interval: float = 0.5) -> None:
+        """constructor of the detector class
+
+        :param: depth: function returning the number of the searches waiting in the queue
+        :type: depth: Callable[[], integer]
+        :param: max_depth: the maximum number of the waiting searches
+        :type: max_depth: integer
+        :param: max_lag: the maximum lag of the event loop (in seconds)
+        :type: max_lag: float
+        :param: max_error_rate: the maximum share of the failed requests to NASA
+        :type: max_error_rate: float
+        :param: min_quota: the minimum number of the remaining requests of the NASA API
+        :type: min_quota: integer
+        :param: slow_request: duration (in seconds) after which the request to NASA is failed
+        :type: slow_request: float
+        :param: cooldown: how long (in seconds) the degraded mode lasts after the overload
+        :type: cooldown: float
+        :param: period: how long (in seconds) the observations of NASA are kept
+        :type: period: float
+        :param: interval: how often (in seconds) the lag of the event loop is measured
+        :type: interval: float
+        :return: None
+
+        """
+        self.depth = depth
+        self.max_depth = max_depth
+        self.max_lag = max_lag
+        self.max_error_rate = max_error_rate
+        self.min_quota = min_quota
+        self.slow_request = slow_request
+        self.cooldown = cooldown
+        self.period = period
+        self.interval = interval
+        self.lag: float = 0
+        self._outcomes: Deque[Tuple[float, bool]] = deque(maxlen=1000)
+        self._quota: Optional[Tuple[float, int]] = None
+        self._until: float = 0
+        self._task: Optional[asyncio.Task] = None
+        self.trace = TraceConfig()
+        self.trace.on_request_start.append(self._on_request_start)
+        self.trace.on_request_end.append(self._on_request_end)
+        self.trace.on_request_exception.append(self._on_request_exception)
+        metrics.gauge('overload.degraded', lambda: int(self.degraded))
+        metrics.gauge('overload.loop_lag_ms', lambda: round(self.lag * 1000, 3))
+
+    async def _on_request_start(self, session: ClientSession, context: SimpleNamespace,
+                                params: TraceRequestStartParams) -> None:
+        """Remembers the start of the request to NASA
+
+        :param: session: current session
+        :type: session: ClientSession
+        :param: context: data of the current request
+        :type: context: SimpleNamespace
+        :param: params: parameters of the request
+        :type: params: TraceRequestStartParams
+        :return: None
+
+        """
+        context.started = time.monotonic()
+
+    async def _on_request_end(self, session: ClientSession, context: SimpleNamespace,
+                              params: TraceRequestEndParams) -> None:
+        """Records the outcome of the request to NASA and the remaining quota of the API
+
+        :param: session: current session
+        :type: session: ClientSession
+        :param: context: data of the current request
+        :type: context: SimpleNamespace
+        :param: params: parameters of the request
+        :type: params: TraceRequestEndParams
+        :return: None
+
+        """
+        now: float = time.monotonic()
+        status: int = params.response.status
+        self._outcomes.append((now, status < 500 and status != 429
+                               and now - context.started < self.slow_request))
+        remaining: Optional[str] = params.response.headers.get('X-RateLimit-Remaining')
+        if remaining and remaining.isdigit():
+            self._quota = (now, int(remaining))
+
+    async def _on_request_exception(self, session: ClientSession, context: SimpleNamespace,
+                                    params: TraceRequestExceptionParams) -> None:
+        """Records the failed request to NASA
+
+        :param: session: current session
+        :type: session: ClientSession
+        :param: context: data of the current request
+        :type: context: SimpleNamespace
+        :param: params: parameters of the request
+        :type: params: TraceRequestExceptionParams
+        :return: None
+
+        """
+        self._outcomes.append((time.monotonic(), False))
+
+    def reasons(self) -> List[str]:
+        """Returns the signs of the overload observed now
+
+        :return: descriptions of the signs
+        :rtype: List[string]
+
+        """
+        now: float = time.monotonic()
+        while self._outcomes and now - self._outcomes[0][0] >= self.period:
+            self._outcomes.popleft()
+        reasons: List[str] = list()
+        depth: int = self.depth()
+        if depth > self.max_depth:
+            reasons.append(f'{depth} searches are waiting')
+        if self.lag > self.max_lag:
+            reasons.append(f'the event loop lags {self.lag:.2f} s')
+        if len(self._outcomes) >= 10:
+            failed: float = sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+            if failed > self.max_error_rate:
+                reasons.append(f'{failed:.0%} of the requests to NASA failed')
+        if self._quota and now - self._quota[0] < self.period and self._quota[1] < self.min_quota:
+            reasons.append(f'{self._quota[1]} requests to the NASA API are left')
+        return reasons
+
+    @property
+    def degraded(self) -> bool:
+        """Whether the bot works in the degraded mode (only the cached data is served)
+
+        :return: True, if the bot is overloaded now or the cooldown has not passed, else False
+        :rtype: bool
+
+        """
+        now: float = time.monotonic()
+        reasons: List[str] = self.reasons()
+        if reasons:
+            if now >= self._until:
+                logger.warning(f'the bot switches to the degraded mode: {", ".join(reasons)}')
+                metrics.increment('overload.switches')
+            self._until = now + self.cooldown
+        return now < self._until
+
+    def start(self) -> None:
+        """Starts the measuring of the lag of the event loop
+
+        :return: None
+
+        """
+        self._task = asyncio.create_task(self._work())
+
+    async def close(self) -> None:
+        """Stops the measuring of the lag of the event loop
+
+        :return: None
+
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _work(self) -> None:
+        """Measures how much later than planned the event loop wakes up the sleeping task
+
+        :return: None
+
+        """
+        while True:
+            started: float = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lag = max(time.monotonic() - started - self.interval, 0)
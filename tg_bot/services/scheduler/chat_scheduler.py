@@ -0,0 +1,216 @@
+import asyncio
+import inspect
+from contextlib import asynccontextmanager
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional,
+                    Sequence, Set)
+
+from aiogram import Dispatcher, types
+
+from tg_bot.middlewares.callback_answer_middleware import answer_callback
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.scheduler.lanes import Lanes
+
+logger = get_logger(name=__name__)
+
+# commands, texts and buttons after which the photo being searched is no longer needed
+SUPERSEDING_COMMANDS = ('start', 'help')
+SUPERSEDING_TEXTS = ('Меню  🔭',)
+SUPERSEDING_CALLBACKS = ('new_date', 'new_planet', 'finish_work', 'mars_stop', 'earth_stop')
+SUPERSEDING_CALLBACK_PREFIXES = ('dialog_calendar:SET-DAY',)
+
+
+class ChatScheduler:
+    """
+    Scheduler of updates: updates of one chat are processed strictly one after
+    another (in the order of their arrival), updates of different chats are processed
+    in parallel within the limits of their lanes (interactive updates go ahead of the
+    searches of photos and the sending of the history)
+    """
+    def __init__(self, lanes: Lanes,
+                 on_superseded: Sequence[Callable[[int], Any]] = ()) -> None:
+        """constructor of the scheduler class
+
+        :param: lanes: lanes of the processing with their limits
+        :type: lanes: Lanes
+        :param: on_superseded: functions (accepting the chat id) that cancel the work which
+        became useless for the chat: the photo search being executed, the search of the next
+        photo in the background, the searches waiting in the queue (the returned awaitables
+        are awaited)
+        :type: on_superseded: Sequence[Callable[[int], Any]]
+        :return: None
+
+        """
+        self.lanes = lanes
+        self.on_superseded = on_superseded
+        self._chat_locks: Dict[int, asyncio.Lock] = dict()
+        self._chat_waiting: Dict[int, int] = dict()
+        self._in_progress: Set[Hashable] = set()
+
+    @staticmethod
+    def get_chat_id(update: types.Update) -> Optional[int]:
+        """Retrieves the id of the chat the received update belongs to
+
+        :param: update: current update
+        :type: update: Update
+        :return: chat id or None (if the update is not bound to any chat)
+        :rtype: Optional[integer]
+
+        """
+        if update.message:
+            return update.message.chat.id
+        if update.callback_query:
+            if update.callback_query.message:
+                return update.callback_query.message.chat.id
+            return update.callback_query.from_user.id
+        return None
+
+    @staticmethod
+    def get_duplicate_key(update: types.Update) -> Optional[Hashable]:
+        """Creates a key by which repeated presses of the same button of the same
+        message are recognized (a double tap on 'mars_continue', on the calendar, etc.)
+
+        :param: update: current update
+        :type: update: Update
+        :return: key of the pressed button or None (if the update is not a callback query)
+        :rtype: Optional[Hashable]
+
+        """
+        query: types.CallbackQuery = update.callback_query
+        if query and query.message:
+            return query.message.chat.id, query.message.message_id, query.data
+        return None
+
+    @staticmethod
+    def is_superseding(update: types.Update) -> bool:
+        """Checks whether the received update makes the photo being searched in the same
+        chat useless (the menu is called, a new date or a new planet is chosen, the work
+        is finished, etc.)
+
+        :param: update: current update
+        :type: update: Update
+        :return: True, if the search of the photo should be cancelled, else False
+        :rtype: bool
+
+        """
+        if update.message:
+            if update.message.is_command():
+                return update.message.get_command(pure=True) in SUPERSEDING_COMMANDS
+            return update.message.text in SUPERSEDING_TEXTS
+        if update.callback_query and update.callback_query.data:
+            data: str = update.callback_query.data
+            return data in SUPERSEDING_CALLBACKS or data.startswith(SUPERSEDING_CALLBACK_PREFIXES)
+        return False
+
+    @property
+    def queued(self) -> int:
+        """The number of updates that have been received, but are not processed yet
+
+        :return: number of updates (and jobs) waiting for their turn or being processed
+        :rtype: integer
+
+        """
+        return sum(self._chat_waiting.values())
+
+    @asynccontextmanager
+    async def acquire(self, chat_id: int) -> AsyncIterator[None]:
+        """Takes the turn of the chat: the code is executed after the updates of the chat
+        received earlier are processed and before the later ones (the background jobs of the
+        chat are executed in the same order as its updates)
+
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :return: None
+
+        """
+        lock: asyncio.Lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_waiting[chat_id] = self._chat_waiting.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._chat_waiting[chat_id] -= 1
+            if not self._chat_waiting[chat_id]:
+                del self._chat_waiting[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def submit(self, update: types.Update,
+                     process: Callable[[types.Update], Awaitable[Any]]) -> List:
+        """Processes the update in turn with the other updates of the same chat (in the
+        lane of the update). If the
+        same button of the same message is already waiting for processing (or is being
+        processed), the repeated press is answered and dropped, so button mashing does
+        not start the same heavy work several times. If the update makes the photo being
+        searched in the same chat useless, this search (together with the search of the next
+        photo in the background and the searches waiting in the queue) is cancelled at once,
+        without waiting for the turn of the update
+
+        :param: update: current update
+        :type: update: Update
+        :param: process: function that processes the update
+        :type: process: Callable[[Update], Awaitable[Any]]
+        :return: results of the processing of the update
+        :rtype: List
+
+        """
+        chat_id: Optional[int] = self.get_chat_id(update)
+        lane: str = self.lanes.classify(update)
+        if chat_id is None:
+            async with self.lanes.slot(lane):
+                return await process(update)
+
+        duplicate_key: Optional[Hashable] = self.get_duplicate_key(update)
+        if duplicate_key is not None:
+            if duplicate_key in self._in_progress:
+                logger.info(f'repeated press of the button "{update.callback_query.data}" '
+                            f'in the chat {chat_id} was dropped')
+                await answer_callback(call=update.callback_query)
+                return []
+            self._in_progress.add(duplicate_key)
+
+        try:
+            if self.is_superseding(update):
+                for cancel in self.on_superseded:
+                    cancelled: Any = cancel(chat_id)
+                    if inspect.isawaitable(cancelled):
+                        await cancelled
+
+            async with self.acquire(chat_id=chat_id):
+                async with self.lanes.slot(lane):
+                    return await process(update)
+        finally:
+            if duplicate_key is not None:
+                self._in_progress.discard(duplicate_key)
+
+
+class ScheduledDispatcher(Dispatcher):
+    """
+    Dispatcher which passes all received updates through the chat scheduler
+    """
+    def __init__(self, *args, scheduler: ChatScheduler, **kwargs) -> None:
+        """constructor of the dispatcher class
+
+        :param: scheduler: scheduler of updates
+        :type: scheduler: ChatScheduler
+        :return: None
+
+        """
+        super(ScheduledDispatcher, self).__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    async def process_updates(self, updates: List[types.Update], fast: bool = True) -> List:
+        """Processes the list of received updates: each update gets into the queue of
+        its chat, different chats are processed in parallel
+
+        :param: updates: received updates
+        :type: updates: List[Update]
+        :param: fast: if False, updates are processed one by one (as in the Dispatcher)
+        :type: fast: bool
+        :return: results of the processing of all updates
+        :rtype: List
+
+        """
+        if not fast:
+            return await super(ScheduledDispatcher, self).process_updates(updates, fast)
+        return await asyncio.gather(*[
+            self.scheduler.submit(update, self.updates_handler.notify) for update in updates
+        ])
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Optional, Set
+
+from tg_bot.services.logger.my_logger import get_logger
+
+logger = get_logger(name=__name__)
+
+
+class InFlightFetches:
+    """
+    Registry of photo searches that are being executed at the moment (not more than
+    one per chat). A search that is no longer needed by the user can be cancelled
+    """
+    def __init__(self) -> None:
+        """constructor of the registry class
+
+        :return: None
+
+        """
+        self._tasks: Dict[int, asyncio.Task] = dict()
+        self._superseded: Set[asyncio.Task] = set()
+
+    async def run(self, chat_id: int, fetch: Awaitable[Any]) -> Optional[Any]:
+        """Executes the search as a separate task, registered for the current chat
+        (the previous search of this chat, if any, is cancelled) and waits for its result
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :param: fetch: coroutine searching for the photo
+        :type: fetch: Awaitable[Any]
+        :return: result of the search or None (if the search was cancelled because
+        the user has already moved on)
+        :rtype: Optional[Any]
+
+        """
+        self.cancel(chat_id=chat_id)
+        task: asyncio.Task = asyncio.ensure_future(fetch)
+        self._tasks[chat_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task not in self._superseded:
+                raise
+            logger.info(f'the search of the photo in the chat {chat_id} was cancelled')
+            return None
+        finally:
+            self._superseded.discard(task)
+            if self._tasks.get(chat_id) is task:
+                del self._tasks[chat_id]
+
+    def cancel(self, chat_id: int) -> bool:
+        """Cancels the search of the current chat (the cancellation gets into
+        all requests to the API that are being executed)
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :return: True, if some search was cancelled, else False
+        :rtype: bool
+
+        """
+        task: Optional[asyncio.Task] = self._tasks.pop(chat_id, None)
+        if task is None or task.done():
+            return False
+        self._superseded.add(task)
+        task.cancel()
+        return True
@@ -0,0 +1,154 @@
+import asyncio
+import heapq
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+
+from aiogram import types
+
+# lanes of the processing, in the order of their priority
+LANE_INTERACTIVE = 'interactive'
+LANE_PHOTO = 'photo'
+LANE_HISTORY = 'history'
+PRIORITIES = {LANE_INTERACTIVE: 0, LANE_PHOTO: 1, LANE_HISTORY: 2}
+
+# buttons whose processing goes to the NASA API or sends a lot of photos
+PHOTO_CALLBACKS = ('mars_continue', 'earth_continue')
+PHOTO_CALLBACK_PREFIXES = ('dialog_calendar:SET-DAY',)
+HISTORY_CALLBACKS = ('history',)
+HISTORY_CALLBACK_PREFIXES = ('history_next:',)
+
+
+class PrioritySemaphore:
+    """
+    Semaphore which gives a released place to the waiting work with the highest
+    priority (the lowest number), the works of the same priority get it in the order
+    of their arrival
+    """
+    def __init__(self, value: int) -> None:
+        """constructor of the semaphore class
+
+        :param: value: the number of works executed at the same time
+        :type: value: integer
+        :return: None
+
+        """
+        self._value = value
+        self._number: int = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = list()
+
+    async def acquire(self, priority: int) -> None:
+        """Takes a place at once (if there is a free one and nobody is waiting for it),
+        otherwise waits for its turn
+
+        :param: priority: priority of the work
+        :type: priority: integer
+        :return: None
+
+        """
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        self._number += 1
+        waiter: asyncio.Future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, self._number, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Gives the place to the first waiting work (the cancelled ones are skipped)
+        or frees it
+
+        :return: None
+
+        """
+        while self._waiters:
+            waiter: asyncio.Future = heapq.heappop(self._waiters)[2]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._value += 1
+
+
+class Lanes:
+    """
+    Lanes of the processing: interactive updates (keyboards, menu, calendar navigation)
+    go first, the searches of photos in the NASA API go second, the sending of the history
+    goes last. Each lane has its own limit of works executed at the same time, so the
+    busy searches of photos do not freeze the keyboards, and all lanes share the common
+    limit, places of which are given according to the priority of the lane
+    """
+    def __init__(self, max_workers: int, limits: Dict[str, int]) -> None:
+        """constructor of the lanes class
+
+        :param: max_workers: the maximum number of works executed at the same time in all lanes
+        :type: max_workers: integer
+        :param: limits: the maximum number of works executed at the same time in each lane
+        :type: limits: dictionary
+        :return: None
+
+        """
+        self.max_workers = max_workers
+        self.limits = limits
+        self._workers = PrioritySemaphore(max_workers)
+        self._lanes: Dict[str, asyncio.Semaphore] = {
+            lane: asyncio.Semaphore(limits.get(lane, max_workers)) for lane in PRIORITIES
+        }
+        self._busy: Dict[str, int] = dict.fromkeys(PRIORITIES, 0)
+
+    @staticmethod
+    def classify(update: types.Update) -> str:
+        """Determines the lane of the received update
+
+        :param: update: current update
+        :type: update: Update
+        :return: name of the lane
+        :rtype: string
+
+        """
+        if update.callback_query and update.callback_query.data:
+            data: str = update.callback_query.data
+            if data in HISTORY_CALLBACKS or data.startswith(HISTORY_CALLBACK_PREFIXES):
+                return LANE_HISTORY
+            if data in PHOTO_CALLBACKS or data.startswith(PHOTO_CALLBACK_PREFIXES):
+                return LANE_PHOTO
+        return LANE_INTERACTIVE
+
+    @property
+    def busy(self) -> Dict[str, int]:
+        """The number of works being executed in each lane
+
+        :return: numbers of works by the names of the lanes
+        :rtype: dictionary
+
+        """
+        return dict(self._busy)
+
+    @asynccontextmanager
+    async def slot(self, lane: str, own_limit: bool = True) -> AsyncIterator[None]:
+        """Takes a place in the lane and in the common limit for the time of the work
+
+        :param: lane: name of the lane
+        :type: lane: string
+        :param: own_limit: whether the limit of the lane should be taken (the background
+        workers, which are limited by their number, take only the common limit)
+        :type: own_limit: bool
+        :return: None
+
+        """
+        if own_limit:
+            await self._lanes[lane].acquire()
+        try:
+            await self._workers.acquire(priority=PRIORITIES[lane])
+            self._busy[lane] += 1
+            try:
+                yield
+            finally:
+                self._busy[lane] -= 1
+                self._workers.release()
+        finally:
+            if own_limit:
+                self._lanes[lane].release()
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Dict, Hashable, List, Optional, Union
+
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.scheduler.inflight import InFlightFetches
+
+logger = get_logger(name=__name__)
+
+
+@dataclass
+class PrefetchedPhoto:
+    """
+    Photo found in advance (while the user was looking at the previous one)
+
+    :param: photo: bytes of the photo (Mars) or its url (Earth); None if no suitable
+    photo was found among the checked candidates
+    :type: photo: Optional[Union[bytes, string]]
+    :param: url: url of the photo
+    :type: url: Optional[string]
+    :param: remaining: candidates that have not been checked yet
+    :type: remaining: list
+    """
+    photo: Optional[Union[bytes, str]]
+    url: Optional[str]
+    remaining: List
+
+
+# result of the waiting for the search cancelled because the user has already moved on
+SUPERSEDED = PrefetchedPhoto(photo=None, url=None, remaining=[])
+
+
+class PrefetchSlots:
+    """
+    Per-chat slots with the next photo, which is searched in the background right after
+    the previous photo is shown. The found photo is kept for a short time only
+    """
+    def __init__(self, ttl: float = 60) -> None:
+        """constructor of the slots class
+
+        :param: ttl: how long (in seconds) the found photo is kept in the slot
+        :type: ttl: float
+        :return: None
+
+        """
+        self.ttl = ttl
+        self._slots: Dict[int, Dict[str, Any]] = dict()
+
+    def start(self, chat_id: int, key: Hashable, fetch: Awaitable[Optional[PrefetchedPhoto]]) -> None:
+        """Starts the background search of the next photo for the current chat (the previous
+        search of this chat, if any, is cancelled)
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :param: key: parameters of the search (place, date, color), the photo can be
+        taken from the slot only with the same parameters
+        :type: key: Hashable
+        :param: fetch: coroutine searching for the next photo
+        :type: fetch: Awaitable[Optional[PrefetchedPhoto]]
+        :return: None
+
+        """
+        self.discard(chat_id=chat_id)
+        task: asyncio.Task = asyncio.ensure_future(fetch)
+        slot: Dict[str, Any] = dict(key=key, task=task, expires=None)
+        self._slots[chat_id] = slot
+        task.add_done_callback(lambda _: self._on_ready(chat_id=chat_id, slot=slot))
+
+    def _on_ready(self, chat_id: int, slot: Dict[str, Any]) -> None:
+        """Remembers when the found photo goes stale and schedules its removal from
+        the slot (so the photos abandoned by the users do not stay in memory)
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :param: slot: the slot of the current chat
+        :type: slot: dictionary
+        :return: None
+
+        """
+        task: asyncio.Task = slot['task']
+        if not task.cancelled() and task.exception():
+            logger.warning(f'the background search of the photo in the chat {chat_id} '
+                           f'failed: {task.exception()}')
+        slot['expires'] = time.monotonic() + self.ttl
+        asyncio.get_event_loop().call_later(self.ttl, self._expire, chat_id, slot)
+
+    def _expire(self, chat_id: int, slot: Dict[str, Any]) -> None:
+        """Removes the stale slot (if it was not replaced by a new one)
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :param: slot: the slot to be removed
+        :type: slot: dictionary
+        :return: None
+
+        """
+        if self._slots.get(chat_id) is slot:
+            del self._slots[chat_id]
+
+    async def take(self, chat_id: int, key: Hashable,
+                   fetches: InFlightFetches) -> Optional[PrefetchedPhoto]:
+        """Takes the photo found in advance from the slot of the current chat. If the
+        search is still being executed, waits for it (it has started earlier than
+        a new search would); the waiting is registered as the in-flight fetch of the
+        chat, so the update superseding the search cancels it
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :param: key: parameters of the current search (place, date, color)
+        :type: key: Hashable
+        :param: fetches: registry of the in-flight fetches of the chats
+        :type: fetches: InFlightFetches
+        :return: photo found in advance, None (if there is no suitable one) or SUPERSEDED
+        (if the search was cancelled because the user has already moved on)
+        :rtype: Optional[PrefetchedPhoto]
+
+        """
+        slot: Optional[Dict[str, Any]] = self._slots.pop(chat_id, None)
+        if slot is None:
+            return None
+        task: asyncio.Task = slot['task']
+        expired: bool = slot['expires'] is not None and slot['expires'] < time.monotonic()
+        if slot['key'] != key or expired:
+            task.cancel()
+            return None
+        try:
+            if task.done():
+                return task.result()
+            prefetched: Optional[PrefetchedPhoto] = await fetches.run(chat_id=chat_id, fetch=task)
+        except Exception:
+            return None
+        if prefetched is None and task.cancelled():
+            return SUPERSEDED
+        return prefetched
+
+    def discard(self, chat_id: int) -> None:
+        """Cancels the background search of the current chat and clears its slot
+
+        :param: chat_id: id of the current chat
+        :type: chat_id: integer
+        :return: None
+
+        """
+        slot: Optional[Dict[str, Any]] = self._slots.pop(chat_id, None)
+        if slot is not None:
+            slot['task'].cancel()
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from aiogram import Bot, types
+from aiogram.utils.exceptions import BadRequest
+
+from tg_bot.services.cache.tiered_cache import TieredCache
+from tg_bot.services.logger.my_logger import get_logger
+
+logger = get_logger(name=__name__)
+
+# the maximum number of photos in one media group (the Telegram limit)
+ALBUM_SIZE = 10
+
+
+class AlbumSender:
+    """
+    Sender of the albums (media groups) of photos. The photos sent earlier are sent by
+    their file_id, so Telegram does not download them again (the limits of the Telegram
+    and the RetryAfter are handled by the scheduler of the sending of the bot)
+    """
+    def __init__(self, bot: Bot, file_ids: TieredCache) -> None:
+        """constructor of the sender class
+
+        :param: bot: current bot
+        :type: bot: Bot
+        :param: file_ids: cache of the file_id of the sent photos by their urls
+        :type: file_ids: TieredCache
+        :return: None
+
+        """
+        self.bot = bot
+        self.file_ids = file_ids
+
+    async def _prepare(self, urls: List[str], known: List[Optional[str]]) -> List[str]:
+        """Replaces the urls of the photos sent earlier with their file_id (the known
+        file_id are used at once, the others are looked up in the cache)
+
+        :param: urls: urls of the photos
+        :type: urls: List[string]
+        :param: known: file_id of the photos known in advance (None for unknown)
+        :type: known: List[Optional[string]]
+        :return: file_id or url of each photo
+        :rtype: List[string]
+
+        """
+        unknown: List[str] = [url for url, file_id in zip(urls, known) if not file_id]
+        cached: Dict[str, Optional[str]] = dict(zip(unknown, await asyncio.gather(*[
+            self.file_ids.get(key=url) for url in unknown
+        ])))
+        return [file_id or cached.get(url) or url for url, file_id in zip(urls, known)]
+
+    async def _send_album(self, chat_id: int, urls: List[str], photos: List[str],
+                          captions: List[Optional[str]]) -> List[types.Message]:
+        """Sends one album and remembers the file_id of its photos (if Telegram rejects
+        the file_id, the album is sent again by the urls)
+
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :param: urls: urls of the photos
+        :type: urls: List[string]
+        :param: photos: file_id or url of each photo
+        :type: photos: List[string]
+        :param: captions: captions of the photos
+        :type: captions: List[Optional[string]]
+        :return: sent messages
+        :rtype: List[Message]
+
+        """
+        while True:
+            try:
+                if len(photos) == 1:
+                    messages: List[types.Message] = [
+                        await self.bot.send_photo(chat_id=chat_id, photo=photos[0],
+                                                  caption=captions[0])
+                    ]
+                else:
+                    messages = await self.bot.send_media_group(
+                        chat_id=chat_id, media=[types.InputMediaPhoto(photo, caption=caption)
+                                                for photo, caption in zip(photos, captions)])
+            except BadRequest:
+                if photos == urls:
+                    raise
+                logger.warning(f'file_id of the album in the chat {chat_id} were rejected, '
+                               f'the photos are sent by urls')
+                await asyncio.gather(*[self.file_ids.delete(key=url) for url in urls])
+                photos = urls
+                continue
+            for url, message in zip(urls, messages):
+                if message.photo:
+                    await self.file_ids.set(key=url, value=message.photo[-1].file_id)
+            return messages
+
+    async def send(self, chat_id: int, urls: List[str],
+                   file_ids: Optional[List[Optional[str]]] = None,
+                   captions: Optional[List[Optional[str]]] = None) -> List[types.Message]:
+        """Sends the photos to the chat as albums (one after another, in their order).
+        The file_id of all albums are looked up at once, before the sending
+
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :param: urls: urls of the photos
+        :type: urls: List[string]
+        :param: file_ids: file_id of the photos known in advance (None for unknown)
+        :type: file_ids: Optional[List[Optional[string]]]
+        :param: captions: captions of the photos
+        :type: captions: Optional[List[Optional[string]]]
+        :return: sent messages
+        :rtype: List[Message]
+
+        """
+        file_ids = file_ids or [None] * len(urls)
+        captions = captions or [None] * len(urls)
+        starts: range = range(0, len(urls), ALBUM_SIZE)
+        prepared: List[List[str]] = await asyncio.gather(*[
+            self._prepare(urls=urls[start:start + ALBUM_SIZE],
+                          known=file_ids[start:start + ALBUM_SIZE]) for start in starts
+        ])
+        messages: List[types.Message] = list()
+        for start, photos in zip(starts, prepared):
+            messages.extend(await self._send_album(chat_id=chat_id,
+                                                   urls=urls[start:start + ALBUM_SIZE],
+                                                   photos=photos,
+                                                   captions=captions[start:start + ALBUM_SIZE]))
+        return messages
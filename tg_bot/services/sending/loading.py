@@ -0,0 +1,88 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Union
+
+from aiogram import Bot, types
+from aiogram.types import ChatActions
+from aiogram.utils.exceptions import BadRequest, TelegramAPIError
+
+from tg_bot.services.cache.tiered_cache import TieredCache
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+
+logger = get_logger(name=__name__)
+
+LOADING_ANIMATION_URL = 'https://vgif.ru/gifs/166/vgif-ru-37964.gif'
+
+
+class LoadingAnimation:
+    """
+    Indicator of the search of the photo. The animation is downloaded by Telegram only
+    once: then it is sent by its cached file_id. When the result is expected soon (the data
+    of NASA is already cached), only the action of the chat is sent instead of the animation
+    (it is neither sent as a message nor deleted)
+    """
+    def __init__(self, bot: Bot, file_ids: TieredCache, url: str = LOADING_ANIMATION_URL) -> None:
+        """constructor of the indicator class
+
+        :param: bot: current bot
+        :type: bot: Bot
+        :param: file_ids: cache of the file_id of the sent files by their urls
+        :type: file_ids: TieredCache
+        :param: url: url of the animation
+        :type: url: string
+        :return: None
+
+        """
+        self.bot = bot
+        self.file_ids = file_ids
+        self.url = url
+
+    async def _send(self, chat_id: int) -> types.Message:
+        """Sends the animation by its file_id (if Telegram rejects the file_id or it is not
+        known yet, the animation is sent by the url and its file_id is remembered)
+
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :return: message with the animation
+        :rtype: Message
+
+        """
+        file_id: Optional[str] = await self.file_ids.get(key=self.url)
+        if file_id:
+            try:
+                return await self.bot.send_animation(chat_id=chat_id, animation=file_id)
+            except BadRequest:
+                logger.warning('the file_id of the loading animation is rejected, '
+                               'it is sent by the url')
+        metrics.increment('loading.uploads')
+        sent: types.Message = await self.bot.send_animation(chat_id=chat_id, animation=self.url)
+        media: Optional[Union[types.Animation, types.Document]] = sent.animation or sent.document
+        if media:
+            await self.file_ids.set(key=self.url, value=media.file_id)
+        return sent
+
+    @asynccontextmanager
+    async def show(self, chat_id: int, warm: bool = False) -> AsyncIterator[None]:
+        """Shows the animation for the time of the search of the photo and deletes it after
+        (if the data is cached, only the action of the chat is shown)
+
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :param: warm: whether the data of NASA is already cached
+        :type: warm: bool
+        :return: None
+
+        """
+        if warm:
+            metrics.increment('loading.chat_actions')
+            await self.bot.send_chat_action(chat_id=chat_id, action=ChatActions.UPLOAD_PHOTO)
+            yield
+            return
+        gif: types.Message = await self._send(chat_id=chat_id)
+        try:
+            yield
+        finally:
+            try:
+                await gif.delete()
+            except TelegramAPIError:
+                logger.warning(f'the loading animation in the chat {chat_id} is not deleted')
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Limiter of the rate of the requests: the tokens are restored with the specified
+    rate up to the capacity of the bucket, each request takes a token. The waiting
+    requests get the tokens in the order of their arrival
+    """
+    def __init__(self, rate: float, capacity: float) -> None:
+        """constructor of the bucket class
+
+        :param: rate: the number of tokens restored per second
+        :type: rate: float
+        :param: capacity: the maximum number of tokens (the allowed burst of requests)
+        :type: capacity: float
+        :return: None
+
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens: float = capacity
+        self._updated: float = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """Restores the tokens accumulated since the last check
+
+        :return: None
+
+        """
+        now: float = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Takes the tokens, waiting for them if necessary
+
+        :param: tokens: the number of tokens
+        :type: tokens: float
+        :return: None
+
+        """
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Takes all tokens for the specified time (Telegram has asked to wait)
+
+        :param: seconds: how long no tokens are given
+        :type: seconds: float
+        :return: None
+
+        """
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+    @property
+    def full(self) -> bool:
+        """Whether the bucket is full (it has not been used for a long time)
+
+        :return: True, if the bucket is full, else False
+        :rtype: bool
+
+        """
+        self._refill()
+        return self._tokens >= self.capacity
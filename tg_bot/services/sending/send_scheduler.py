@@ -0,0 +1,184 @@
+import json
+import time
+from typing import Dict, Optional, Union
+
+from aiogram import Bot
+from aiogram.bot import api
+from aiogram.utils.exceptions import RetryAfter
+
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+from tg_bot.services.scheduler.lanes import PrioritySemaphore
+from tg_bot.services.sending.rate_limit import TokenBucket
+
+logger = get_logger(name=__name__)
+
+# priorities of the outgoing requests: the replies to the user's actions (texts, edits of
+# the keyboards) go before the photos and the animations
+PRIORITY_INTERACTIVE = 0
+PRIORITY_MEDIA = 1
+INTERACTIVE_METHODS = (api.Methods.SEND_MESSAGE, api.Methods.EDIT_MESSAGE_TEXT,
+                       api.Methods.EDIT_MESSAGE_CAPTION, api.Methods.EDIT_MESSAGE_REPLY_MARKUP)
+# requests that are not limited by Telegram as the messages of the chat
+UNLIMITED_METHODS = (api.Methods.SEND_CHAT_ACTION, api.Methods.ANSWER_CALLBACK_QUERY,
+                     api.Methods.DELETE_MESSAGE)
+
+
+class SendScheduler:
+    """
+    Scheduler of the outgoing messages within the limits of the Bot API: each chat has
+    its own limiter (the groups have a stricter one) and all chats share the global
+    limiter, the places of which are given to the replies to the user's actions first.
+    The private chats may get a short burst of messages (a photo, its description and
+    the keyboard, the edits of the calendar) without waiting for the limiter
+    When Telegram asks to wait (RetryAfter), the limiter of the chat is paused for the
+    specified time; the limiter of the bot is paused only when several chats are asked
+    to wait at the same time (the bot as a whole exceeds the limits)
+    """
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1,
+                 group_rate: float = 20 / 60, chat_burst: float = 3,
+                 flood_chats: int = 3, flood_window: float = 10) -> None:
+        """constructor of the scheduler class
+
+        :param: global_rate: the maximum number of messages per second for the whole bot
+        :type: global_rate: float
+        :param: chat_rate: the maximum number of messages per second for one private chat
+        :type: chat_rate: float
+        :param: group_rate: the maximum number of messages per second for one group
+        :type: group_rate: float
+        :param: chat_burst: the number of messages sent at once to one private chat
+        :type: chat_burst: float
+        :param: flood_chats: the number of chats asked to wait, after which all chats wait
+        :type: flood_chats: integer
+        :param: flood_window: the period (in seconds) in which the above chats are counted
+        :type: flood_window: float
+        :return: None
+
+        """
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.flood_chats = flood_chats
+        self.flood_window = flood_window
+        self._global = TokenBucket(rate=global_rate, capacity=global_rate)
+        self._turn = PrioritySemaphore(1)
+        self._chats: Dict[Union[int, str], TokenBucket] = dict()
+        self._retries: Dict[Union[int, str], float] = dict()
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        """Returns the limiter of the chat (the limiters of the chats that have not been
+        used for a long time are removed)
+
+        :param: chat_id: id of the chat
+        :type: chat_id: Union[integer, string]
+        :return: the limiter of the chat
+        :rtype: TokenBucket
+
+        """
+        if chat_id not in self._chats and len(self._chats) >= 1000:
+            self._chats = {chat: bucket for chat, bucket in self._chats.items() if not bucket.full}
+        if chat_id not in self._chats:
+            group: bool = str(chat_id).startswith(('-', '@'))
+            self._chats[chat_id] = TokenBucket(rate=self.group_rate if group else self.chat_rate,
+                                               capacity=1 if group else self.chat_burst)
+        return self._chats[chat_id]
+
+    async def acquire(self, chat_id: Union[int, str], priority: int, messages: int = 1) -> None:
+        """Waits until the message may be sent to the chat: first the limiter of the chat,
+        then the turn for the global limiter (according to the priority)
+
+        :param: chat_id: id of the chat
+        :type: chat_id: Union[integer, string]
+        :param: priority: priority of the request
+        :type: priority: integer
+        :param: messages: the number of messages sent by the request
+        :type: messages: integer
+        :return: None
+
+        """
+        chat: TokenBucket = self._chat_bucket(chat_id=chat_id)
+        await chat.acquire(tokens=min(messages, chat.capacity))
+        await self._turn.acquire(priority=priority)
+        try:
+            await self._global.acquire(tokens=min(messages, self._global.capacity))
+        finally:
+            self._turn.release()
+
+    def pause(self, chat_id: Optional[Union[int, str]], seconds: float) -> None:
+        """Stops the sending to the chat for the specified time. The sending to all chats
+        is stopped if the request was not bound to any chat or if several chats have been
+        asked to wait recently
+
+        :param: chat_id: id of the chat (None - the request of the bot as a whole)
+        :type: chat_id: Optional[Union[integer, string]]
+        :param: seconds: how long nothing is sent
+        :type: seconds: float
+        :return: None
+
+        """
+        if chat_id is None:
+            self._global.pause(seconds=seconds)
+            return
+        self._chat_bucket(chat_id=chat_id).pause(seconds=seconds)
+        now: float = time.monotonic()
+        self._retries = {chat: moment for chat, moment in self._retries.items()
+                         if now - moment < self.flood_window}
+        self._retries[chat_id] = now
+        if len(self._retries) >= self.flood_chats:
+            metrics.increment('sending.global_pauses')
+            logger.warning(f'{len(self._retries)} chats were asked to wait, '
+                           f'the sending to all chats is paused for {seconds} s')
+            self._global.pause(seconds=seconds)
+            self._retries.clear()
+
+
+class ScheduledBot(Bot):
+    """
+    Bot whose outgoing messages (from the handlers, the background jobs and the albums)
+    go through the scheduler of the sending. The requests rejected by Telegram with
+    RetryAfter are repeated after the pause
+    """
+    def __init__(self, *args, sender: SendScheduler, attempts: int = 3, **kwargs) -> None:
+        """constructor of the bot class
+
+        :param: sender: scheduler of the outgoing messages
+        :type: sender: SendScheduler
+        :param: attempts: the number of attempts to send the message
+        :type: attempts: integer
+        :return: None
+
+        """
+        super(ScheduledBot, self).__init__(*args, **kwargs)
+        self.sender = sender
+        self.attempts = attempts
+
+    async def request(self, method: str, data: Optional[Dict] = None,
+                      files: Optional[Dict] = None, **kwargs):
+        """Makes the request to the Bot API; the messages to the chats wait for their turn
+        in the scheduler of the sending
+
+        :param: method: method of the Bot API
+        :type: method: string
+        :param: data: parameters of the request
+        :type: data: Optional[dictionary]
+        :param: files: files of the request
+        :type: files: Optional[dictionary]
+        :return: result of the request
+
+        """
+        chat_id: Optional[Union[int, str]] = (data or dict()).get('chat_id')
+        if chat_id is None or method in UNLIMITED_METHODS:
+            return await super(ScheduledBot, self).request(method, data, files, **kwargs)
+        priority: int = PRIORITY_INTERACTIVE if method in INTERACTIVE_METHODS else PRIORITY_MEDIA
+        messages: int = len(json.loads(data['media'])) if method == api.Methods.SEND_MEDIA_GROUP else 1
+        for attempt in range(1, self.attempts + 1):
+            await self.sender.acquire(chat_id=chat_id, priority=priority, messages=messages)
+            try:
+                return await super(ScheduledBot, self).request(method, data, files, **kwargs)
+            except RetryAfter as exception:
+                metrics.increment('sending.retry_after')
+                logger.warning(f'Telegram asked to wait {exception.timeout} s before '
+                               f'{method} to the chat {chat_id}')
+                self.sender.pause(chat_id=chat_id, seconds=exception.timeout)
+                if attempt == self.attempts:
+                    raise
@@ -0,0 +1,106 @@
+import asyncio
+from typing import Dict, Set, Tuple
+
+from aiogram import Bot
+
+from tg_bot.services.logger.my_logger import get_logger
+from tg_bot.services.metrics.registry import metrics
+from tg_bot.services.throttling.sliding_window import SlidingWindow
+
+logger = get_logger(name=__name__)
+
+
+class UnlockNotifier:
+    """
+    Delayed queue of the notifications about the end of the block of the throttled user.
+    The notifications are kept as timers of the event loop (no task waits for them), and
+    each key of the throttling has only one timer (the next throttled message replaces it),
+    so the flood of messages does not increase the number of tasks and of kept messages
+    """
+    def __init__(self, bot: Bot, limiter: SlidingWindow) -> None:
+        """constructor of the notifier class
+
+        :param: bot: current bot
+        :type: bot: Bot
+        :param: limiter: limiter of the calls with the sliding window
+        :type: limiter: SlidingWindow
+        :return: None
+
+        """
+        self.bot = bot
+        self.limiter = limiter
+        self._timers: Dict[str, asyncio.TimerHandle] = dict()
+        self._tasks: Set[asyncio.Task] = set()
+        metrics.gauge('throttling.pending_notifications', lambda: len(self._timers))
+
+    def schedule(self, key: str, delay: float, chat_id: int, message_id: int, exceeded: int) -> None:
+        """Schedules the notification (the notification scheduled earlier for the key is cancelled)
+
+        :param: key: key of the throttling
+        :type: key: string
+        :param: delay: how long (in seconds) the block lasts
+        :type: delay: float
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :param: message_id: id of the throttled message, which is replied to
+        :type: message_id: integer
+        :param: exceeded: the number of the throttled messages at the moment of scheduling
+        :type: exceeded: integer
+        :return: None
+
+        """
+        timer: asyncio.TimerHandle = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[key] = asyncio.get_event_loop().call_later(
+            delay, self._fire, key, (chat_id, message_id, exceeded)
+        )
+
+    def _fire(self, key: str, notification: Tuple[int, int, int]) -> None:
+        """Starts the sending of the notification when its time has come
+
+        :param: key: key of the throttling
+        :type: key: string
+        :param: notification: id of the chat, id of the message and the number of the throttled messages
+        :type: notification: Tuple[integer, integer, integer]
+        :return: None
+
+        """
+        self._timers.pop(key, None)
+        task: asyncio.Task = asyncio.create_task(self._notify(key, *notification))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _notify(self, key: str, chat_id: int, message_id: int, exceeded: int) -> None:
+        """Notifies the user about the end of the block, if no message has been throttled
+        after the scheduled one (for example, by another process of the bot)
+
+        :param: key: key of the throttling
+        :type: key: string
+        :param: chat_id: id of the chat
+        :type: chat_id: integer
+        :param: message_id: id of the throttled message
+        :type: message_id: integer
+        :param: exceeded: the number of the throttled messages at the moment of scheduling
+        :type: exceeded: integer
+        :return: None
+
+        """
+        try:
+            if await self.limiter.exceeded(key=key) == exceeded:
+                await self.bot.send_message(chat_id=chat_id, text='Ладно, можете продолжать)',
+                                            reply_to_message_id=message_id,
+                                            allow_sending_without_reply=True)
+        except Exception as exception:
+            logger.warning(f'the end of the block was not sent to the chat {chat_id}: {exception}')
+
+    async def close(self) -> None:
+        """Cancels the scheduled notifications and waits for the ones being sent
+
+        :return: None
+
+        """
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,164 @@
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+import aioredis
+
+from tg_bot.services.logger.my_logger import get_logger
+
+logger = get_logger(name=__name__)
+
+# atomic check of the sliding window: the calls that have left the window are removed,
+# the call is recorded if the window is not full, otherwise the number of the rejected
+# calls is increased. The time of the Redis server is used, so the windows are the same
+# for all processes of the bot
+SLIDING_WINDOW_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local period = tonumber(ARGV[1])
+local calls = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now_ms - period)
+if redis.call('ZCARD', KEYS[1]) < calls then
+    redis.call('ZADD', KEYS[1], now_ms, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], period)
+    redis.call('DEL', KEYS[2])
+    return {1, 0, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+local exceeded = redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], period * 2)
+return {0, exceeded, tonumber(oldest[2]) + period - now_ms}
+"""
+
+
+@dataclass
+class Verdict:
+    """
+    Result of the check of the call
+
+    :param: allowed: whether the call is allowed
+    :type: allowed: bool
+    :param: exceeded: the number of the calls rejected one after another (0 for the allowed call)
+    :type: exceeded: integer
+    :param: retry_after: how long (in seconds) the next call will be rejected
+    :type: retry_after: float
+    """
+    allowed: bool
+    exceeded: int = 0
+    retry_after: float = 0
+
+
+class SlidingWindow:
+    """
+    Limiter of the calls with the sliding window: no more than the specified number of
+    calls during the specified period. The window is checked in Redis with one atomic
+    script (one round trip, the same limits for all processes of the bot), without Redis
+    or when it is not available the ring buffers of the times of the last calls are kept
+    in the memory of the current process
+    """
+    def __init__(self, redis: Optional[aioredis.Redis] = None, prefix: str = 'throttling',
+                 maxsize: int = 10000) -> None:
+        """constructor of the limiter class
+
+        :param: redis: client of the Redis server or None (if Redis is not used)
+        :type: redis: Optional[aioredis.Redis]
+        :param: prefix: prefix of the Redis keys
+        :type: prefix: string
+        :param: maxsize: the number of keys kept in the memory after which the expired ones are removed
+        :type: maxsize: integer
+        :return: None
+
+        """
+        self.redis = redis
+        self.prefix = prefix
+        self.maxsize = maxsize
+        self._script = redis.register_script(SLIDING_WINDOW_SCRIPT) if redis else None
+        self._calls: Dict[str, Deque[float]] = dict()
+        self._exceeded: Dict[str, int] = dict()
+
+    async def hit(self, key: str, period: float, calls: int = 1) -> Verdict:
+        """Records the call if the window is not full
+
+        :param: key: key of the limited calls (the handler and the user)
+        :type: key: string
+        :param: period: length of the window (in seconds)
+        :type: period: float
+        :param: calls: the number of calls allowed in the window
+        :type: calls: integer
+        :return: result of the check
+        :rtype: Verdict
+
+        """
+        if self._script is not None:
+            try:
+                allowed, exceeded, retry_after = await self._script(
+                    keys=[f'{self.prefix}:{key}', f'{self.prefix}:{key}:exceeded'],
+                    args=[max(int(period * 1000), 1), calls, uuid.uuid4().hex]
+                )
+                return Verdict(allowed=bool(allowed), exceeded=int(exceeded),
+                               retry_after=max(int(retry_after), 0) / 1000)
+            except Exception as exception:
+                logger.warning(f'{self.prefix}:{key} was not checked in Redis: {exception}')
+        return self._hit_memory(key=key, period=period, calls=calls)
+
+    async def exceeded(self, key: str) -> int:
+        """Returns the number of the calls rejected one after another
+
+        :param: key: key of the limited calls
+        :type: key: string
+        :return: the number of the rejected calls
+        :rtype: integer
+
+        """
+        if self.redis is not None:
+            try:
+                return int(await self.redis.get(f'{self.prefix}:{key}:exceeded') or 0)
+            except Exception as exception:
+                logger.warning(f'{self.prefix}:{key} was not read from Redis: {exception}')
+        return self._exceeded.get(key, 0)
+
+    def _hit_memory(self, key: str, period: float, calls: int) -> Verdict:
+        """Checks the window in the memory of the current process: the ring buffer keeps
+        the times of the last allowed calls, the call is allowed if the buffer is not full
+        or its oldest call has left the window
+
+        :param: key: key of the limited calls
+        :type: key: string
+        :param: period: length of the window (in seconds)
+        :type: period: float
+        :param: calls: the number of calls allowed in the window
+        :type: calls: integer
+        :return: result of the check
+        :rtype: Verdict
+
+        """
+        now: float = time.monotonic()
+        if key not in self._calls and len(self._calls) >= self.maxsize:
+            self._forget_expired(now=now, period=period)
+        window: Deque[float] = self._calls.get(key)
+        if window is None or window.maxlen != calls:
+            window = self._calls[key] = deque(window or (), maxlen=calls)
+        if len(window) < calls or now - window[0] >= period:
+            window.append(now)
+            self._exceeded.pop(key, None)
+            return Verdict(allowed=True)
+        self._exceeded[key] = self._exceeded.get(key, 0) + 1
+        return Verdict(allowed=False, exceeded=self._exceeded[key],
+                       retry_after=window[0] + period - now)
+
+    def _forget_expired(self, now: float, period: float) -> None:
+        """Removes the keys whose last call has left the window
+
+        :param: now: current time
+        :type: now: float
+        :param: period: length of the window (in seconds)
+        :type: period: float
+        :return: None
+
+        """
+        self._calls = {key: window for key, window in self._calls.items()
+                       if now - window[-1] < period}
+        self._exceeded = {key: count for key, count in self._exceeded.items()
+                          if key in self._calls}